@@ -0,0 +1,224 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+import asyncio
+import math
+import os
+import time
+
+from fastapi.responses import ORJSONResponse
+
+from app.metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+from app.vcf_parser import MAX_COMPRESSED_VCF_BYTES, MAX_INDEX_BYTES, MAX_JOB_VCF_BYTES
+
+# ==============================
+# ADMISSION CONTROL
+# ==============================
+# Upload endpoints are admitted before Starlette reads and spools the
+# multipart body, based on the declared Content-Length. Each admitted
+# request holds one analysis slot and its Content-Length against the
+# buffered-bytes budget until its response is sent. Requests that don't fit
+# wait in a bounded FIFO queue; when the queue is full, or the wait times
+# out, the client gets 429 with Retry-After instead of the worker taking on
+# more than it can hold.
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+ADMISSION_MAX_BUFFERED_MB = int(os.getenv("ADMISSION_MAX_BUFFERED_MB", "4096"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+# Retry-After used until a few requests have been timed
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+
+# One VCF, its index and the form fields
+MAX_ANALYZE_REQUEST_BYTES = MAX_COMPRESSED_VCF_BYTES + MAX_INDEX_BYTES + 1024 * 1024
+
+# POST path -> largest Content-Length accepted (None: only the budget applies)
+ADMITTED_PATHS: Dict[str, Optional[int]] = {
+    "/analyze": MAX_ANALYZE_REQUEST_BYTES,
+    "/analyze/batch/cohort": MAX_ANALYZE_REQUEST_BYTES,
+    "/analyze/batch": None,
+    "/jobs": MAX_JOB_VCF_BYTES + 1024 * 1024
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_buffered_bytes: int, max_queued: int,
+                 queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_buffered_bytes = max_buffered_bytes
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.buffered_bytes = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        # Moving average of how long an admitted request holds its slot
+        self._hold_seconds: Optional[float] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, fut in self._waiters if not fut.done())
+
+    def _fits(self, nbytes: int) -> bool:
+        return (self.active < self.max_concurrent
+                and self.buffered_bytes + nbytes <= self.max_buffered_bytes)
+
+    def _admit(self, nbytes: int):
+        self.active += 1
+        self.buffered_bytes += nbytes
+        self.admitted += 1
+
+    def reject(self, status_code: int, reason: str, detail: str) -> AdmissionRejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        return AdmissionRejected(status_code, reason, detail)
+
+    def retry_after(self) -> int:
+        # Roughly how long until the queue ahead of a new request drains
+        if self._hold_seconds is None:
+            return ADMISSION_RETRY_AFTER_SECONDS
+        waves = (self.queued + self.active) / max(1, self.max_concurrent)
+        return max(1, math.ceil(self._hold_seconds * waves))
+
+    async def acquire(self, nbytes: int):
+        if nbytes > self.max_buffered_bytes:
+            raise self.reject(413, "too_large", "Upload exceeds the server's buffering limit")
+
+        # FIFO: nobody jumps the queue, so large uploads aren't starved
+        if not self._waiters and self._fits(nbytes):
+            self._admit(nbytes)
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return
+
+        if self.queued >= self.max_queued:
+            raise self.reject(429, "queue_full", "Server busy, too many queued analyses")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (nbytes, fut)
+        self._waiters.append(entry)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # Admitted just as the wait ended
+                self.release(nbytes)
+            else:
+                try:
+                    self._waiters.remove(entry)
+                except ValueError:
+                    pass
+                # A large request leaving the head may unblock smaller ones
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self.reject(429, "timeout", "Server busy, timed out waiting for capacity")
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    def release(self, nbytes: int, held_seconds: Optional[float] = None):
+        self.active -= 1
+        self.buffered_bytes -= nbytes
+        if held_seconds is not None:
+            if self._hold_seconds is None:
+                self._hold_seconds = held_seconds
+            else:
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            nbytes, fut = self._waiters[0]
+            if fut.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self._admit(nbytes)
+            fut.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "buffered_bytes": self.buffered_bytes,
+            "max_concurrent": self.max_concurrent,
+            "max_buffered_bytes": self.max_buffered_bytes,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected)
+        }
+
+
+admission_controller = AdmissionController(
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_BUFFERED_MB * 1024 * 1024,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS
+)
+
+
+def _content_length(scope) -> Optional[int]:
+    # None for chunked bodies, whose size isn't known up front. Without
+    # either header the body is empty.
+    length = 0
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+        if name == b"transfer-encoding":
+            length = None
+    return length
+
+
+class AdmissionMiddleware:
+    # Plain ASGI middleware: it must run before the body is received, which
+    # a route dependency can't do because FastAPI parses the form first.
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"].rstrip("/")
+        if path not in ADMITTED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            nbytes = self._check_length(path, _content_length(scope))
+            await self.controller.acquire(nbytes)
+        except AdmissionRejected as e:
+            headers = {}
+            if e.status_code == 429:
+                headers["Retry-After"] = str(self.controller.retry_after())
+            response = ORJSONResponse({"detail": e.detail}, status_code=e.status_code, headers=headers)
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(nbytes, time.perf_counter() - start)
+
+    def _check_length(self, path: str, length: Optional[int]) -> int:
+        # Rejected before a single body byte is read
+        if length is None:
+            raise self.controller.reject(411, "length_required", "Content-Length required for uploads")
+        limit = ADMITTED_PATHS[path]
+        if limit is not None and length > limit:
+            raise self.controller.reject(413, "too_large", "Upload exceeds the maximum request size")
+        return length
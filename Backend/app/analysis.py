@@ -0,0 +1,248 @@
+from typing import Dict, List, Optional, Tuple
+import uuid
+
+from app.phenotype_engine import infer_cohort_diplotypes, infer_diplotype
+from app.decision_table import PHENOTYPES
+from app.knowledge_base import KnowledgeBase, current_knowledge_base
+from app.vcf_parser import MISSING_DOSAGE, VariantCalls
+
+
+MAX_PATIENT_ID_LENGTH = 128
+
+
+class UnsupportedDrugError(ValueError):
+    """Raised when a requested drug has no rule in the knowledge base."""
+
+
+class InvalidPatientIdError(ValueError):
+    """Raised when a client-supplied patient_id can't be stored."""
+
+
+def parse_drug_list(drug: str) -> List[str]:
+    # "codeine, Warfarin,CODEINE" -> ["CODEINE", "WARFARIN"]
+    drugs = [d.strip().upper() for d in drug.split(",")]
+    return list(dict.fromkeys(d for d in drugs if d))
+
+
+def resolve_patient_id(patient_id: Optional[str]) -> str:
+    # Caller-supplied ID, so a patient's assessments can be grouped later;
+    # a random one only when the client has none
+    patient_id = (patient_id or "").strip()
+    if len(patient_id) > MAX_PATIENT_ID_LENGTH:
+        raise InvalidPatientIdError(f"patient_id exceeds {MAX_PATIENT_ID_LENGTH} characters")
+    return patient_id or str(uuid.uuid4())
+
+
+def with_patient_id(result, patient_id: str, timestamp: str):
+    # Copies of cached assessments (shared, never mutated) for this patient
+    # and request
+    if isinstance(result, list):
+        return [{**a, "patient_id": patient_id, "timestamp": timestamp} for a in result]
+    return {**result, "patient_id": patient_id, "timestamp": timestamp}
+
+
+def gene_for_drug(kb: KnowledgeBase, drug: str) -> str:
+    rule_check = kb.table.risk_for(drug, "NM")
+
+    if not rule_check or not rule_check[1]:
+        raise UnsupportedDrugError(f"Unsupported drug: {drug}")
+
+    return rule_check[1].get("gene")
+
+
+def profile_gene(kb: KnowledgeBase, gene_variants: List[Dict], gene: str,
+                 genes_found: set) -> Tuple[str, str]:
+    # Detect if gene is completely missing from VCF (Safety Check)
+    if gene not in genes_found:
+        return "Unknown", "Indeterminate"
+
+    diplotype = infer_diplotype(gene_variants, gene)
+    return diplotype, kb.table.phenotype_for(gene, diplotype)
+
+
+def assess_drug(kb: KnowledgeBase, drug: str, gene: str, genes_found: set,
+                phenotype: str) -> Tuple[str, Dict]:
+    if gene not in genes_found:
+        # If the gene for this drug wasn't found in the VCF, assume missing data
+        return "Unknown", {"severity": "none"}
+
+    if phenotype == "Unknown":
+        return "Unknown", {}
+
+    result = kb.table.risk_for(drug, phenotype)
+    if not result:
+        return "Unknown", {}
+    return result
+
+
+def _clinical(kb: KnowledgeBase, drug: str, risk: str) -> Dict:
+    # Recommendation fields resolved against the same snapshot as the risk
+    return {
+        "guideline": kb.guideline,
+        "action": kb.recommendation(risk),
+        "alternatives": kb.alternatives_for(drug),
+        "knowledge_base_version": kb.tag
+    }
+
+
+def analyze_drugs(variants: VariantCalls, drugs: List[str],
+                  kb: Optional[KnowledgeBase] = None) -> List[Dict]:
+    """Deterministic part of /analyze for every requested drug.
+
+    Drugs are grouped by their rule's gene so diplotype and phenotype
+    inference runs once per gene, however many drugs share it, reading only
+    that gene's bucket. Every lookup uses one knowledge base snapshot.
+    """
+    kb = kb or current_knowledge_base()
+    drug_genes = {drug: gene_for_drug(kb, drug) for drug in drugs}
+
+    # No-calls (./.) don't count as data for the gene; hom-ref calls do, but
+    # aren't detected variants. Records without a GT count as before.
+    genes_found = set(
+        gene for gene, bucket in variants.by_gene.items()
+        if any(v.dosage != MISSING_DOSAGE for v in bucket)
+    )
+
+    profiles = {}
+    gene_variants = {}
+    for gene in set(drug_genes.values()):
+        gene_variants[gene] = [
+            v for v in variants.gene(gene) if v.dosage not in (0, MISSING_DOSAGE)
+        ]
+        profiles[gene] = profile_gene(kb, gene_variants[gene], gene, genes_found)
+
+    results = []
+    for drug, gene in drug_genes.items():
+        diplotype, phenotype = profiles[gene]
+        risk, rule = assess_drug(kb, drug, gene, genes_found, phenotype)
+        results.append({
+            "drug": drug,
+            "gene": gene,
+            "diplotype": diplotype,
+            "phenotype": phenotype,
+            "risk": risk,
+            "rule": rule,
+            "variants": gene_variants[gene],
+            **_clinical(kb, drug, risk)
+        })
+    return results
+
+
+def analyze_cohort(cohort, drugs: List[str],
+                   kb: Optional[KnowledgeBase] = None) -> List[List[Dict]]:
+    """analyze_drugs for every sample of a CohortGenotypes.
+
+    Diplotypes come from one pass over each gene's genotype matrix and are
+    classified for the whole cohort at once; the result is one list of
+    per-drug results (same shape as analyze_drugs) per sample.
+    """
+    kb = kb or current_knowledge_base()
+    drug_genes = {drug: gene_for_drug(kb, drug) for drug in drugs}
+    n = len(cohort.samples)
+
+    profiles = {}
+    for gene in set(drug_genes.values()):
+        sites = cohort.sites.get(gene, [])
+        if not sites:
+            profiles[gene] = None
+            continue
+
+        genotypes = cohort.genotypes[gene]
+        diplotypes = infer_cohort_diplotypes([s.star for s in sites], genotypes)
+        table = kb.table.classify_diplotypes(
+            gene, diplotypes, [d for d, g in drug_genes.items() if g == gene]
+        )
+        profiles[gene] = {
+            "diplotypes": diplotypes,
+            "phenotypes": table["phenotypes"],
+            "risks": table["risks"],
+            # A sample has data for the gene if any site was called for it
+            "called": (genotypes >= 0).any(axis=1),
+            "carried": genotypes > 0
+        }
+
+    results = [[] for _ in range(n)]
+    for drug, gene in drug_genes.items():
+        profile = profiles[gene]
+        rule = kb.table.risk_for(drug, "NM")[1]
+        clinical = {risk: _clinical(kb, drug, risk) for risk in kb.table.risk_labels}
+        for i in range(n):
+            if profile is None or not profile["called"][i]:
+                diplotype, phenotype = "Unknown", "Indeterminate"
+                risk, sample_rule, variants = "Unknown", {"severity": "none"}, []
+            else:
+                diplotype = profile["diplotypes"][i]
+                phenotype = PHENOTYPES[profile["phenotypes"][i]]
+                risk = kb.table.risk_labels[profile["risks"][drug][i]]
+                sample_rule = rule
+                variants = [
+                    site for site, carried in zip(cohort.sites[gene], profile["carried"][i])
+                    if carried
+                ]
+            results[i].append({
+                "drug": drug,
+                "gene": gene,
+                "diplotype": diplotype,
+                "phenotype": phenotype,
+                "risk": risk,
+                "rule": sample_rule,
+                "variants": variants,
+                **clinical[risk]
+            })
+    return results
+
+
+def quality_metrics(variants: VariantCalls) -> Dict:
+    return {
+        "vcf_parsing_success": True,
+        "variants_detected": len(variants),
+        "genes_identified": list(variants.by_gene)
+    }
+
+
+def build_drug_assessment(patient_id: str, timestamp: str, result: Dict,
+                          llm_explanation: Dict, metrics: Dict) -> Dict:
+    # Drug assessment object (EXACT SCHEMA)
+    drug = result["drug"]
+    risk = result["risk"]
+
+    explanation_block = {
+        "summary": llm_explanation.get("summary", ""),
+        "mechanism": llm_explanation.get("mechanism", ""),
+        "citations": llm_explanation.get("citations", ["CPIC guidelines"])
+    }
+    # Deferred mode: the explanation is fetched later by its ID
+    if "explanation_id" in llm_explanation:
+        explanation_block["status"] = llm_explanation["status"]
+        explanation_block["explanation_id"] = llm_explanation["explanation_id"]
+
+    return {
+        "patient_id": patient_id,
+        "drug": drug,
+        "timestamp": timestamp,
+
+        "risk_assessment": {
+            "risk_label": risk,
+            "confidence_score": 0.95,
+            "severity": result["rule"].get("severity", "none")
+        },
+
+        "pharmacogenomic_profile": {
+            "primary_gene": result["gene"],
+            "diplotype": result["diplotype"],
+            "phenotype": result["phenotype"],
+            "detected_variants": [v.detected() for v in result["variants"]]
+        },
+
+        "clinical_recommendation": {
+            "guideline": result["guideline"],
+            "action": result["action"],
+            "alternatives": result["alternatives"]
+        },
+
+        "llm_generated_explanation": explanation_block,
+
+        "quality_metrics": metrics,
+
+        "knowledge_base_version": result["knowledge_base_version"]
+    }
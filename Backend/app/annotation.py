@@ -0,0 +1,67 @@
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import os
+
+from app.gene_regions import normalize_chrom, target_regions
+
+ALLELE_DEFINITIONS_PATH = os.path.join(os.path.dirname(__file__), "data", "allele_definitions.tsv")
+
+
+class AnnotationIndex:
+    # Exact (chrom, pos, ref, alt) and rsID lookups are dict hits; the gene
+    # windows are sorted start/end arrays per chromosome searched by bisect.
+    def __init__(self, definitions: List[Tuple[str, str, str, str, int, str, str]]):
+        self.by_allele: Dict[Tuple[str, int, str, str], Tuple[str, str]] = {}
+        self.by_rsid: Dict[str, Tuple[str, str]] = {}
+
+        for gene, star, rsid, chrom, pos, ref, alt in definitions:
+            self.by_allele[(normalize_chrom(chrom), pos, ref.upper(), alt.upper())] = (gene, star)
+            if rsid and rsid != ".":
+                self.by_rsid[rsid] = (gene, star)
+
+        self.starts: Dict[str, List[int]] = {}
+        self.ends: Dict[str, List[int]] = {}
+        self.genes: Dict[str, List[str]] = {}
+        for chrom, start, end, gene in target_regions():
+            ends = self.ends.get(chrom)
+            if ends and start <= ends[-1]:
+                # Same gene on both builds overlaps once padded
+                ends[-1] = max(ends[-1], end)
+                continue
+            self.starts.setdefault(chrom, []).append(start)
+            self.ends.setdefault(chrom, []).append(end)
+            self.genes.setdefault(chrom, []).append(gene)
+
+    def gene_at(self, chrom: str, pos: int) -> Optional[str]:
+        starts = self.starts.get(chrom)
+        if not starts:
+            return None
+        i = bisect_right(starts, pos) - 1
+        if i >= 0 and pos <= self.ends[chrom][i]:
+            return self.genes[chrom][i]
+        return None
+
+    def lookup(self, chrom: str, pos: int, ref: str, alt: str, rsid: str) -> Optional[Tuple[str, str]]:
+        ref = ref.upper()
+        for allele in alt.upper().split(","):
+            hit = self.by_allele.get((chrom, pos, ref, allele))
+            if hit:
+                return hit
+        return self.by_rsid.get(rsid)
+
+
+def load_annotation_index(path: str = ALLELE_DEFINITIONS_PATH) -> AnnotationIndex:
+    definitions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            gene, star, rsid, _build, chrom, pos, ref, alt = line.rstrip("\n").split("\t")
+            definitions.append((gene, star, rsid, chrom, int(pos), ref, alt))
+    return AnnotationIndex(definitions)
+
+
+@lru_cache(maxsize=1)
+def get_annotation_index() -> AnnotationIndex:
+    return load_annotation_index()
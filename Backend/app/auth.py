@@ -1,10 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel, EmailStr
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from app.database import get_database
+import asyncio
+import hashlib
 import os
+import time
 
 router = APIRouter()
 
@@ -12,7 +19,32 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Protected routes reject requests without a valid bearer token unless this
+# is turned off (local development); then a token is optional but still
+# verified if sent. Job, explanation and admin routes always need one.
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").lower() in ("1", "true", "yes")
+# Accounts allowed to call admin routes (e.g. knowledge base reload)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+# Local development without MongoDB: signup and login accept any password.
+# Off by default; without it and without a database they are refused.
+AUTH_MOCK_LOGIN = os.getenv("AUTH_MOCK_LOGIN", "false").lower() in ("1", "true", "yes")
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+
+# bcrypt work factor (each +1 doubles the cost). Existing hashes keep the
+# rounds they were created with and still verify after a change.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so a small thread pool runs hashes in parallel
+# while the event loop keeps serving other requests. The pool size caps
+# how many CPU cores password work can take.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+# Verified against when the user doesn't exist, so unknown emails take as
+# long to reject as wrong passwords. Created on first use, off the loop.
+_dummy_hash = None
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -27,11 +59,31 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # passlib and its bcrypt backend load on first use, not at import
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+async def verify_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
+
+async def _timing_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await get_password_hash_async("pharmaguard-timing-equalizer")
+    return _dummy_hash
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -43,21 +95,169 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-@router.post("/signup", response_model=Token)
-async def signup(user: UserCreate):
-    # Mock signup: automatically accept and generate token
+
+# ==============================
+# TOKEN VERIFICATION
+# ==============================
+class TokenCache:
+    # Decoded claims keyed by the token's SHA-256, so raw tokens are never
+    # held in memory. An entry never outlives the token's own exp.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.verify_seconds = 0.0
+        self.verify_max_seconds = 0.0
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, claims = entry
+        if expires_at < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return claims
+
+    def set(self, key: str, claims: Dict):
+        expires_at = time.time() + self.ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+        self._data[key] = (expires_at, claims)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def record_verify(self, seconds: float):
+        self.verify_seconds += seconds
+        self.verify_max_seconds = max(self.verify_max_seconds, seconds)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "verify_mean_ms": round(self.verify_seconds / self.misses * 1000, 4) if self.misses else 0.0,
+            "verify_max_ms": round(self.verify_max_seconds * 1000, 4)
+        }
+
+
+token_cache = TokenCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+
+_bearer = HTTPBearer(auto_error=False)
+
+_credentials_error = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"}
+)
+
+
+def decode_token(token: str) -> Dict:
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        token_cache.hits += 1
+        return claims
+
+    token_cache.misses += 1
+    start = time.perf_counter()
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        claims = None
+    finally:
+        token_cache.record_verify(time.perf_counter() - start)
+
+    if not claims or not claims.get("sub"):
+        token_cache.failures += 1
+        raise _credentials_error
+
+    token_cache.set(key, claims)
+    return claims
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)
+) -> Optional[Dict]:
+    # Stateless: signature and exp only, no database lookup. HS256 checks
+    # take microseconds, so this runs on the loop rather than a thread.
+    if credentials is None:
+        if AUTH_REQUIRED:
+            raise _credentials_error
+        return None
+    return decode_token(credentials.credentials)
+
+
+async def require_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)
+) -> Dict:
+    # Like get_current_user, but never anonymous, whatever AUTH_REQUIRED says
+    if credentials is None:
+        raise _credentials_error
+    return decode_token(credentials.credentials)
+
+
+async def require_admin(user: Dict = Depends(require_user)) -> Dict:
+    # Without a user store, tokens aren't backed by a password check, so
+    # no token can prove an admin identity
+    if await get_database() is None or user["sub"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return user
+
+def _issue_token(email: str):
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": email}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _no_user_store():
+    return HTTPException(status_code=503, detail="User accounts are not configured")
+
+@router.post("/signup", response_model=Token)
+async def signup(user: UserCreate):
+    database = await get_database()
+    if database is None:
+        if not AUTH_MOCK_LOGIN:
+            raise _no_user_store()
+        # Mock signup: automatically accept and generate token
+        return _issue_token(user.email)
+
+    if await database["users"].find_one({"email": user.email}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    hashed_password = await get_password_hash_async(user.password)
+    await database["users"].insert_one({
+        "email": user.email,
+        "full_name": user.full_name,
+        "hashed_password": hashed_password,
+        "created_at": datetime.utcnow()
+    })
+    return _issue_token(user.email)
+
 @router.post("/login", response_model=Token)
 async def login(user: UserLogin):
-    # Mock login: automatically accept and generate token
-    print(f"DEBUG: Mock login attempt for {user.email}")
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    database = await get_database()
+    if database is None:
+        if not AUTH_MOCK_LOGIN:
+            raise _no_user_store()
+        # Mock login: automatically accept and generate token
+        return _issue_token(user.email)
+
+    record = await database["users"].find_one({"email": user.email}, {"hashed_password": 1})
+    hashed_password = record["hashed_password"] if record else await _timing_hash()
+    if not await verify_password_async(user.password, hashed_password) or not record:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return _issue_token(user.email)
@@ -0,0 +1,411 @@
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import uuid
+
+import orjson
+
+from app.analysis import (
+    UnsupportedDrugError,
+    analyze_cohort,
+    analyze_drugs,
+    build_drug_assessment,
+    gene_for_drug,
+    parse_drug_list,
+    quality_metrics
+)
+from app.auth import get_current_user
+from app.knowledge_base import current_knowledge_base
+from app.llm_engine import fallback_explanation, safe_generate_explanations
+from app.persistence import analysis_writer
+from app.vcf_parser import (
+    MAX_COMPRESSED_VCF_BYTES, VCFFormatError, VariantCalls, parse_cohort, read_variants
+)
+
+router = APIRouter()
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 2)))
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", str(BATCH_WORKERS * 2)))
+# Directory input is only for local deployments and is disabled unless a
+# root the server may read from is configured.
+BATCH_LOCAL_ROOT = os.getenv("BATCH_LOCAL_ROOT")
+MAX_TRACKED_BATCHES = 100
+# Extracted size of one archive, summed over its VCF members; each member is
+# also held to the single-file compressed VCF limit
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_MB", "8192")) * 1024 * 1024
+# Cohort samples whose explanations share one batched LLM prompt
+BATCH_EXPLAIN_SAMPLES = int(os.getenv("BATCH_EXPLAIN_SAMPLES", "8"))
+
+VCF_EXTENSIONS = (".vcf", ".vcf.gz", ".vcf.bgz")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the server process already runs threads
+        _executor = ProcessPoolExecutor(
+            max_workers=BATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+# ==============================
+# WORKER (runs in the process pool)
+# ==============================
+def analyze_path(path: str, drugs: List[str]) -> Tuple[VariantCalls, List[Dict]]:
+    with open(path, "rb") as f:
+        variants = read_variants(f)
+
+    if not variants:
+        raise VCFFormatError("No pharmacogenomic variants detected")
+
+    return variants, analyze_drugs(variants, drugs)
+
+
+# ==============================
+# PROGRESS TRACKING
+# ==============================
+class BatchProgress:
+    def __init__(self, batch_id: str, total: int, drugs: List[str]):
+        self.batch_id = batch_id
+        self.total = total
+        self.drugs = drugs
+        self.completed = 0
+        self.failed = 0
+        self.variants = 0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    def snapshot(self) -> Dict:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        done = self.completed + self.failed
+        return {
+            "batch_id": self.batch_id,
+            "status": "finished" if self.finished_at else "running",
+            "drugs": self.drugs,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": self.total - done,
+            "variants_processed": self.variants,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(done / elapsed, 3) if elapsed > 0 else 0.0
+        }
+
+
+BATCHES: "OrderedDict[str, BatchProgress]" = OrderedDict()
+
+
+def track(progress: BatchProgress):
+    BATCHES[progress.batch_id] = progress
+    while len(BATCHES) > MAX_TRACKED_BATCHES:
+        BATCHES.popitem(last=False)
+
+
+# ==============================
+# INPUT COLLECTION
+# ==============================
+def _copy_uploads(files: List[Tuple[str, object]], workdir: str) -> List[Tuple[str, str]]:
+    # Spool each upload to its own path so worker processes can open it
+    sources = []
+    for i, (name, fileobj) in enumerate(files):
+        path = os.path.join(workdir, f"{i}_{os.path.basename(name)}")
+        fileobj.seek(0)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        sources.append((name, path))
+    return sources
+
+
+def _copy_limited(src, out, limit: int) -> int:
+    # Counts what is actually written rather than trusting the header size
+    written = 0
+    for chunk in iter(lambda: src.read(1024 * 1024), b""):
+        written += len(chunk)
+        if written > limit:
+            raise HTTPException(status_code=413, detail="Archive exceeds the extraction size limit")
+        out.write(chunk)
+    return written
+
+
+def _extract_archive(fileobj, workdir: str) -> List[Tuple[str, str]]:
+    # Size caps are checked against the member headers before anything is
+    # copied and again while copying, so a tar bomb can't fill the disk
+    sources = []
+    total = 0
+    fileobj.seek(0)
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as tar:
+            for i, member in enumerate(tar):
+                if not member.isfile() or not member.name.endswith(VCF_EXTENSIONS):
+                    continue
+                if member.size > MAX_COMPRESSED_VCF_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Archive member too large: {member.name}")
+                if total + member.size > BATCH_MAX_ARCHIVE_BYTES:
+                    raise HTTPException(status_code=413, detail="Archive exceeds the extraction size limit")
+                # Never trust archive paths; only the basename is used
+                path = os.path.join(workdir, f"a{i}_{os.path.basename(member.name)}")
+                with tar.extractfile(member) as src, open(path, "wb") as out:
+                    total += _copy_limited(
+                        src, out, min(MAX_COMPRESSED_VCF_BYTES, BATCH_MAX_ARCHIVE_BYTES - total)
+                    )
+                sources.append((member.name, path))
+    except tarfile.TarError:
+        raise HTTPException(status_code=400, detail="Unreadable tar archive")
+    return sources
+
+
+def _list_directory(directory: str) -> List[Tuple[str, str]]:
+    if not BATCH_LOCAL_ROOT:
+        raise HTTPException(status_code=400, detail="Directory input is disabled")
+
+    root = os.path.realpath(BATCH_LOCAL_ROOT)
+    target = os.path.realpath(os.path.join(root, directory))
+    if os.path.commonpath([root, target]) != root or not os.path.isdir(target):
+        raise HTTPException(status_code=400, detail="Directory not found")
+
+    return [
+        (name, os.path.join(target, name))
+        for name in sorted(os.listdir(target))
+        if name.endswith(VCF_EXTENSIONS) and os.path.isfile(os.path.join(target, name))
+    ]
+
+
+# ==============================
+# BATCH ENDPOINTS
+# ==============================
+async def _explanations(results: List[Dict], explain: bool) -> List[Dict]:
+    if explain:
+        return await safe_generate_explanations(results)
+    return [
+        fallback_explanation(r["gene"], r["phenotype"], r["drug"], "LLM explanation not requested for batch runs.")
+        for r in results
+    ]
+
+
+def _remove_workdir(workdir: str, futures: List[Future]):
+    wait(futures)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _run_batch(progress: BatchProgress, sources: List[Tuple[str, str]],
+                     drugs: List[str], explain: bool, workdir: Optional[str], owner: str):
+    pending = set()
+    submitted = set()
+    queue = iter(sources)
+
+    async def analyze_one(name: str, path: str) -> Dict:
+        try:
+            future = get_executor().submit(analyze_path, path, drugs)
+            submitted.add(future)
+            variants, results = await asyncio.wrap_future(future)
+        except (VCFFormatError, UnsupportedDrugError) as e:
+            return {"file": name, "status": "error", "detail": str(e)}
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for later files
+            shutdown_executor()
+            return {"file": name, "status": "error", "detail": "Worker process crashed"}
+        except Exception as e:
+            print("BATCH ERROR:", name, str(e))
+            return {"file": name, "status": "error", "detail": "Analysis failed"}
+
+        explanations = await _explanations(results, explain)
+
+        # Named after the file, as job inputs without samples are, so reruns
+        # of the same files group under the same patient
+        patient_id = os.path.basename(name)
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        metrics = quality_metrics(variants)
+        progress.variants += len(variants)
+        assessments = [
+            build_drug_assessment(patient_id, timestamp, r, e, metrics)
+            for r, e in zip(results, explanations)
+        ]
+        analysis_writer.submit(assessments, owner)
+        return {"file": name, "status": "ok", "assessments": assessments}
+
+    def fill():
+        # Keep at most BATCH_MAX_IN_FLIGHT files submitted at once
+        for name, path in queue:
+            pending.add(asyncio.ensure_future(analyze_one(name, path)))
+            if len(pending) >= BATCH_MAX_IN_FLIGHT:
+                break
+
+    try:
+        fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                item = task.result()
+                if item["status"] == "ok":
+                    progress.completed += 1
+                else:
+                    progress.failed += 1
+                yield orjson.dumps(item) + b"\n"
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+        # Files not yet picked up by a worker are dropped; ones being read
+        # are left to finish before their directory is removed
+        for future in submitted:
+            future.cancel()
+        progress.finished_at = time.monotonic()
+        if workdir:
+            asyncio.get_running_loop().run_in_executor(None, _remove_workdir, workdir, list(submitted))
+
+
+@router.post("")
+async def analyze_batch(
+    user: Dict | None = Depends(get_current_user),
+    drug: str = Form(...),
+    vcf_files: List[UploadFile] = File(None),
+    archive: UploadFile | None = File(None),
+    directory: str | None = Form(None),
+    explain: bool = Form(False)
+):
+    drugs = parse_drug_list(drug)
+    if not drugs:
+        raise HTTPException(status_code=400, detail="No drug specified")
+
+    kb = current_knowledge_base()
+    try:
+        for d in drugs:
+            gene_for_drug(kb, d)
+    except UnsupportedDrugError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not vcf_files and archive is None and not directory:
+        raise HTTPException(status_code=400, detail="Provide vcf_files, an archive or a directory")
+
+    for f in vcf_files or []:
+        if not f.filename.endswith(VCF_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Only .vcf or .vcf.gz files allowed: {f.filename}")
+
+    workdir = tempfile.mkdtemp(prefix="pgx_batch_")
+    try:
+        sources = []
+        if vcf_files:
+            sources += await run_in_threadpool(
+                _copy_uploads, [(f.filename, f.file) for f in vcf_files], workdir
+            )
+        if archive is not None:
+            sources += await run_in_threadpool(_extract_archive, archive.file, workdir)
+        if directory:
+            sources += _list_directory(directory)
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+    if not sources:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No VCF files found in batch input")
+
+    progress = BatchProgress(str(uuid.uuid4()), len(sources), drugs)
+    track(progress)
+
+    return StreamingResponse(
+        _run_batch(progress, sources, drugs, explain, workdir, user["sub"] if user else ""),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-ID": progress.batch_id}
+    )
+
+
+def sample_assessments(sample: str, timestamp: str, sample_results: List[Dict],
+                       explanations: List[Dict]) -> Tuple[VariantCalls, List[Dict]]:
+    # One cohort sample's assessments, from its analyze_cohort results
+    variants = VariantCalls()
+    for r in sample_results:
+        if r["gene"] not in variants.by_gene:
+            for v in r["variants"]:
+                variants.add(v)
+    metrics = quality_metrics(variants)
+    assessments = [
+        build_drug_assessment(sample, timestamp, r, e, metrics)
+        for r, e in zip(sample_results, explanations)
+    ]
+    return variants, assessments
+
+
+async def _run_cohort(progress: BatchProgress, samples: List[str],
+                      results: List[List[Dict]], explain: bool, owner: str):
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    try:
+        for start in range(0, len(samples), BATCH_EXPLAIN_SAMPLES):
+            window = results[start:start + BATCH_EXPLAIN_SAMPLES]
+            explained = iter(await _explanations([r for rs in window for r in rs], explain))
+            for sample, sample_results in zip(samples[start:start + BATCH_EXPLAIN_SAMPLES], window):
+                explanations = [next(explained) for _ in sample_results]
+                variants, assessments = sample_assessments(sample, timestamp, sample_results, explanations)
+                progress.variants += len(variants)
+                progress.completed += 1
+                analysis_writer.submit(assessments, owner)
+                yield orjson.dumps({"sample": sample, "status": "ok", "assessments": assessments}) + b"\n"
+    finally:
+        progress.finished_at = time.monotonic()
+
+
+@router.post("/cohort")
+async def analyze_cohort_file(
+    user: Dict | None = Depends(get_current_user),
+    drug: str = Form(...),
+    vcf_file: UploadFile = File(...),
+    index_file: UploadFile | None = File(None),
+    explain: bool = Form(False)
+):
+    # One multi-sample VCF, parsed once; streams one NDJSON line per sample
+    drugs = parse_drug_list(drug)
+    if not drugs:
+        raise HTTPException(status_code=400, detail="No drug specified")
+
+    if not vcf_file.filename.endswith(VCF_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only .vcf or .vcf.gz files allowed")
+
+    try:
+        cohort = await parse_cohort(vcf_file, index_file)
+        results = await run_in_threadpool(analyze_cohort, cohort, drugs)
+    except (VCFFormatError, UnsupportedDrugError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not cohort.samples:
+        raise HTTPException(status_code=400, detail="VCF has no sample columns")
+
+    progress = BatchProgress(str(uuid.uuid4()), len(cohort.samples), drugs)
+    track(progress)
+
+    return StreamingResponse(
+        _run_cohort(progress, cohort.samples, results, explain, user["sub"] if user else ""),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-ID": progress.batch_id}
+    )
+
+
+@router.get("/{batch_id}")
+def batch_status(batch_id: str):
+    progress = BATCHES.get(batch_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return progress.snapshot()
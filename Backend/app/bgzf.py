@@ -0,0 +1,252 @@
+import gzip
+import struct
+import zlib
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+# ==============================
+# BGZF BLOCK READER
+# ==============================
+# BGZF is a series of gzip members, each carrying its compressed size in a
+# "BC" extra field. Offsets into the file are "virtual": the compressed
+# offset of a block shifted left 16 bits, OR'd with the offset inside the
+# decompressed block.
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class IndexFormatError(ValueError):
+    """Raised when a .tbi/.csi index cannot be decoded."""
+
+
+def split_virtual_offset(voffset: int) -> Tuple[int, int]:
+    return voffset >> 16, voffset & 0xFFFF
+
+
+def inflate_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    # Streaming decompression of a (possibly multi-member) gzip/BGZF file,
+    # holding at most one compressed chunk and its output in memory.
+    inflater = zlib.decompressobj(wbits=31)
+    in_member = False
+    for chunk in chunks:
+        while chunk:
+            in_member = True
+            data = inflater.decompress(chunk)
+            if data:
+                yield data
+            if inflater.eof:
+                chunk = inflater.unused_data
+                inflater = zlib.decompressobj(wbits=31)
+                in_member = False
+            else:
+                chunk = b""
+    if in_member:
+        # A truncated upload, not the end of the file
+        raise EOFError("Compressed file ended before the end-of-stream marker")
+
+
+class BGZFReader:
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+
+    def read_block(self, coffset: int) -> Tuple[bytes, int]:
+        """Return (decompressed data, compressed offset of the next block)."""
+        self.fileobj.seek(coffset)
+        header = self.fileobj.read(12)
+        if len(header) < 12:
+            return b"", coffset
+
+        if header[:2] != GZIP_MAGIC or not header[3] & 4:
+            raise IndexFormatError("Not a BGZF block")
+
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = self.fileobj.read(xlen)
+
+        block_size = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            si1, si2, slen = extra[pos], extra[pos + 1], struct.unpack("<H", extra[pos + 2:pos + 4])[0]
+            if si1 == 66 and si2 == 67 and slen == 2:
+                block_size = struct.unpack("<H", extra[pos + 4:pos + 6])[0] + 1
+            pos += 4 + slen
+
+        if block_size is None or block_size < 12 + xlen + 8:
+            raise IndexFormatError("Not a BGZF block")
+
+        cdata = self.fileobj.read(block_size - 12 - xlen - 8)
+        self.fileobj.read(8)  # CRC32 + ISIZE
+        return zlib.decompress(cdata, -15), coffset + block_size
+
+    def read_range(self, start: int, end: int) -> bytes:
+        # Decompress only the blocks between two virtual offsets.
+        coffset, uoffset = split_virtual_offset(start)
+        end_coffset, end_uoffset = split_virtual_offset(end)
+        parts = []
+
+        while coffset <= end_coffset:
+            data, next_coffset = self.read_block(coffset)
+            if next_coffset == coffset:
+                break
+            if coffset == end_coffset:
+                parts.append(data[uoffset:end_uoffset])
+                break
+            parts.append(data[uoffset:])
+            coffset, uoffset = next_coffset, 0
+
+        return b"".join(parts)
+
+    def iter_lines(self, voffset: int = 0) -> Iterator[bytes]:
+        coffset, uoffset = split_virtual_offset(voffset)
+        pending = b""
+        while True:
+            data, next_coffset = self.read_block(coffset)
+            if next_coffset == coffset:
+                break
+            pending += data[uoffset:]
+            *lines, pending = pending.split(b"\n")
+            yield from lines
+            coffset, uoffset = next_coffset, 0
+        if pending:
+            yield pending
+
+
+# ==============================
+# TABIX / CSI INDEX
+# ==============================
+class RegionIndex:
+    def __init__(self, names: List[str], refs: List[Dict], min_shift: int, depth: int,
+                 linear: Optional[List[List[int]]] = None):
+        self.names = names
+        self.refs = refs
+        self.min_shift = min_shift
+        self.depth = depth
+        self.linear = linear
+        self.pseudo_bin = ((1 << (3 * (depth + 1))) - 1) // 7 + 1
+
+    def reg2bins(self, beg: int, end: int) -> List[int]:
+        # All bins overlapping the 0-based half-open interval [beg, end)
+        bins = []
+        end -= 1
+        shift = self.min_shift + self.depth * 3
+        offset = 0
+        for level in range(self.depth + 1):
+            bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+            shift -= 3
+            offset += 1 << (level * 3)
+        return bins
+
+    def chunks(self, ref_name: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Virtual-offset chunks that may hold records in [start, end] (1-based)."""
+        if ref_name not in self.names:
+            return []
+
+        ref_id = self.names.index(ref_name)
+        bins = self.refs[ref_id]
+        beg = max(0, start - 1)
+
+        min_offset = 0
+        if self.linear is not None:
+            intervals = self.linear[ref_id]
+            window = beg >> self.min_shift
+            if intervals:
+                min_offset = intervals[min(window, len(intervals) - 1)]
+
+        found = []
+        for b in self.reg2bins(beg, end):
+            if b == self.pseudo_bin:
+                continue
+            for chunk_beg, chunk_end in bins.get(b, ()):
+                if chunk_end > min_offset:
+                    found.append((chunk_beg, chunk_end))
+        return found
+
+
+def _parse_tabix_conf(buf: bytes, pos: int) -> Tuple[List[str], int]:
+    # format, col_seq, col_beg, col_end, meta, skip, l_nm
+    l_nm = struct.unpack_from("<7i", buf, pos)[6]
+    pos += 28
+    names = [n.decode() for n in buf[pos:pos + l_nm].split(b"\x00") if n]
+    return names, pos + l_nm
+
+
+def parse_index(raw: bytes, contig_names: Optional[List[str]] = None) -> RegionIndex:
+    """Decode a tabix (.tbi) or CSI (.csi) index, both of which are BGZF files."""
+    try:
+        buf = gzip.decompress(raw) if raw[:2] == GZIP_MAGIC else raw
+    except (OSError, EOFError, zlib.error):
+        raise IndexFormatError("Unreadable index file")
+
+    try:
+        if buf[:4] == b"TBI\x01":
+            return _parse_tbi(buf)
+        if buf[:4] == b"CSI\x01":
+            return _parse_csi(buf, contig_names)
+    except struct.error:
+        raise IndexFormatError("Truncated index file")
+
+    raise IndexFormatError("Index must be a tabix (.tbi) or CSI (.csi) file")
+
+
+def _parse_tbi(buf: bytes) -> RegionIndex:
+    n_ref = struct.unpack_from("<i", buf, 4)[0]
+    names, pos = _parse_tabix_conf(buf, 8)
+
+    refs, linear = [], []
+    for _ in range(n_ref):
+        n_bin = struct.unpack_from("<i", buf, pos)[0]
+        pos += 4
+        bins = {}
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from("<Ii", buf, pos)
+            pos += 8
+            chunks = struct.unpack_from(f"<{2 * n_chunk}Q", buf, pos)
+            pos += 16 * n_chunk
+            bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+        n_intv = struct.unpack_from("<i", buf, pos)[0]
+        pos += 4
+        linear.append(list(struct.unpack_from(f"<{n_intv}Q", buf, pos)))
+        pos += 8 * n_intv
+        refs.append(bins)
+
+    return RegionIndex(names, refs, min_shift=14, depth=5, linear=linear)
+
+
+def _parse_csi(buf: bytes, contig_names: Optional[List[str]]) -> RegionIndex:
+    min_shift, depth, l_aux = struct.unpack_from("<3i", buf, 4)
+    pos = 16
+    names = []
+    if l_aux >= 28:
+        names, _ = _parse_tabix_conf(buf, pos)
+    pos += l_aux
+
+    n_ref = struct.unpack_from("<i", buf, pos)[0]
+    pos += 4
+
+    refs = []
+    for _ in range(n_ref):
+        n_bin = struct.unpack_from("<i", buf, pos)[0]
+        pos += 4
+        bins = {}
+        for _ in range(n_bin):
+            bin_id, _loffset, n_chunk = struct.unpack_from("<IQi", buf, pos)
+            pos += 16
+            chunks = struct.unpack_from(f"<{2 * n_chunk}Q", buf, pos)
+            pos += 16 * n_chunk
+            bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+        refs.append(bins)
+
+    # Indexes built without a tabix aux block rely on ##contig header order
+    if not names:
+        names = list(contig_names or [])
+
+    return RegionIndex(names, refs, min_shift=min_shift, depth=depth)
+
+
+def merge_chunks(chunks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for beg, end in sorted(chunks):
+        if merged and beg <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((beg, end))
+    return merged
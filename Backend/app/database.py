@@ -1,4 +1,3 @@
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 
@@ -7,20 +6,48 @@ load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URL")
 DB_NAME = os.getenv("DB_NAME", "precisionrx")
 
-import certifi
+# Connection pool: one client per process, opened at startup and shared by
+# every request. Timeouts keep a slow or unreachable cluster from hanging
+# requests (and background flushes) indefinitely.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
 
 class Database:
-    client: AsyncIOMotorClient = None
+    client = None
     db = None
 
     def connect(self):
-        self.client = AsyncIOMotorClient(MONGODB_URL, tlsCAFile=certifi.where())
+        # Persistence is optional: without a URL the app runs stateless
+        if not MONGODB_URL:
+            print("MONGODB_URL not set; persistence disabled")
+            return
+        # motor/pymongo are only imported by deployments that use them
+        import certifi
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(
+            MONGODB_URL,
+            tlsCAFile=certifi.where(),
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            retryWrites=True
+        )
         self.db = self.client[DB_NAME]
         print("Connected to MongoDB")
 
     def close(self):
         if self.client:
             self.client.close()
+            self.client = None
+            self.db = None
             print("Disconnected from MongoDB")
 
 db = Database()
@@ -0,0 +1,190 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.phenotype_engine import infer_phenotype
+
+# ==============================
+# COMPILED DECISION TABLE
+# ==============================
+# Compiled from a knowledge base's star_function and drug_rules. Star
+# alleles are interned per gene to small integer codes (0 is reserved for
+# alleles the table doesn't know), every (gene, allele1, allele2) pair is
+# resolved to a phenotype code up front, and every (drug, phenotype) to a
+# risk code. The codes are stored as flat int8 arrays in one buffer, so the
+# table can be read straight out of a memory-mapped snapshot file.
+
+UNKNOWN_ALLELE = 0
+
+PHENOTYPES = ["NM", "IM", "PM", "UM", "Indeterminate", "Unknown"]
+PHENOTYPE_CODES = {p: i for i, p in enumerate(PHENOTYPES)}
+
+
+def compile_tables(star_function: Dict, drug_rules: Dict) -> Tuple[Dict, bytes]:
+    """Return (layout, int8 table bytes) for DecisionTable."""
+    genes = sorted(star_function)
+    alleles = {gene: ["?"] + sorted(star_function[gene]) for gene in genes}
+    drugs = sorted(drug_rules)
+    risk_labels = sorted({
+        risk for rule in drug_rules.values() for risk in rule["risk_map"].values()
+    } | {"Unknown"})
+    risk_codes = {r: i for i, r in enumerate(risk_labels)}
+
+    data = bytearray()
+    phenotype_offsets = {}
+    for gene in genes:
+        phenotype_offsets[gene] = len(data)
+        for a in alleles[gene]:
+            for b in alleles[gene]:
+                phenotype = infer_phenotype(gene, f"{a}/{b}", star_function)
+                data.append(PHENOTYPE_CODES[phenotype])
+
+    # drugs x PHENOTYPES, mirroring rule["risk_map"].get(phenotype, "Unknown")
+    risk_offset = len(data)
+    for drug in drugs:
+        risk_map = drug_rules[drug]["risk_map"]
+        for phenotype in PHENOTYPES:
+            data.append(risk_codes[risk_map.get(phenotype, "Unknown")])
+
+    layout = {
+        "alleles": alleles,
+        "drugs": drugs,
+        "risk_labels": risk_labels,
+        "phenotype_offsets": phenotype_offsets,
+        "risk_offset": risk_offset,
+        "size": len(data)
+    }
+    return layout, bytes(data)
+
+
+class DecisionTable:
+    def __init__(self, layout: Dict, buffer, star_function: Dict, drug_rules: Dict):
+        # buffer: bytes-like holding the compiled int8 tables; kept as a
+        # memoryview so a snapshot mapping is read in place, never copied.
+        self.star_function = star_function
+        self.drug_rules = drug_rules
+        self.genes: List[str] = sorted(layout["alleles"])
+        self.alleles: Dict[str, List[str]] = layout["alleles"]
+        self.allele_codes: Dict[str, Dict[str, int]] = {
+            gene: {allele: code for code, allele in enumerate(alleles)}
+            for gene, alleles in self.alleles.items()
+        }
+        self.drugs: List[str] = layout["drugs"]
+        self.drug_index = {drug: i for i, drug in enumerate(self.drugs)}
+        self.risk_labels: List[str] = layout["risk_labels"]
+        self._phenotype_offsets: Dict[str, int] = layout["phenotype_offsets"]
+        self._risk_offset: int = layout["risk_offset"]
+        self._buffer = memoryview(buffer)[:layout["size"]]
+        self._matrices: Dict[str, object] = {}
+        self._risk_vectors: Dict[str, object] = {}
+
+    def phenotype_for(self, gene: str, diplotype: str) -> str:
+        codes = self.allele_codes.get(gene)
+        first, _, second = diplotype.partition("/")
+        if codes is not None and "/" not in second:
+            i = codes.get(first)
+            j = codes.get(second)
+            if i is not None and j is not None:
+                offset = self._phenotype_offsets[gene] + i * len(codes) + j
+                return PHENOTYPES[self._buffer[offset]]
+        # Alleles outside the table or more than two calls: slow path
+        return infer_phenotype(gene, diplotype, self.star_function)
+
+    def risk_for(self, drug: str, phenotype: str) -> Tuple[str, Optional[Dict]]:
+        drug = drug.upper()
+        index = self.drug_index.get(drug)
+        if index is None:
+            return "Unknown", None
+        rule = self.drug_rules[drug]
+        code = PHENOTYPE_CODES.get(phenotype)
+        if code is None:
+            return rule["risk_map"].get(phenotype, "Unknown"), rule
+        offset = self._risk_offset + index * len(PHENOTYPES) + code
+        return self.risk_labels[self._buffer[offset]], rule
+
+    # ==============================
+    # VECTORIZED COHORT API
+    # ==============================
+    def phenotype_matrix(self, gene: str):
+        # Read-only int8 view over the buffer, alleles x alleles
+        matrix = self._matrices.get(gene)
+        if matrix is None:
+            import numpy as np
+
+            n = len(self.alleles[gene])
+            matrix = np.frombuffer(
+                self._buffer, dtype=np.int8, count=n * n, offset=self._phenotype_offsets[gene]
+            ).reshape(n, n)
+            self._matrices[gene] = matrix
+        return matrix
+
+    def risk_vector(self, drug: str):
+        # Risk codes indexed by phenotype code
+        vector = self._risk_vectors.get(drug)
+        if vector is None:
+            import numpy as np
+
+            offset = self._risk_offset + self.drug_index[drug] * len(PHENOTYPES)
+            vector = np.frombuffer(self._buffer, dtype=np.int8, count=len(PHENOTYPES), offset=offset)
+            self._risk_vectors[drug] = vector
+        return vector
+
+    def encode_alleles(self, gene: str, alleles: Sequence[str]):
+        """Map star-allele strings to the gene's integer codes (0 = unknown)."""
+        import numpy as np
+
+        codes = self.allele_codes[gene]
+        unique, inverse = _factorize(alleles)
+        unique_codes = np.array([codes.get(a, UNKNOWN_ALLELE) for a in unique], dtype=np.int16)
+        return unique_codes[inverse]
+
+    def classify_codes(self, gene: str, allele1, allele2):
+        """Phenotype codes (indexes into PHENOTYPES) for arrays of allele codes."""
+        return self.phenotype_matrix(gene)[allele1, allele2]
+
+    def classify_diplotypes(self, gene: str, diplotypes: Sequence[str],
+                            drugs: Sequence[str] = ()) -> Dict:
+        """Classify a whole cohort's diplotypes for one gene in one call.
+
+        Returns int8 phenotype codes plus, for each requested drug, int8 risk
+        codes (indexes into risk_labels). Diplotypes that aren't exactly two
+        alleles are resolved through the scalar slow path.
+        """
+        unique, inverse = _factorize(diplotypes)
+
+        first, second, irregular = [], [], {}
+        for i, diplotype in enumerate(unique):
+            parts = diplotype.split("/")
+            if len(parts) != 2:
+                irregular[i] = PHENOTYPE_CODES[infer_phenotype(gene, diplotype, self.star_function)]
+                parts = ["?", "?"]
+            first.append(parts[0])
+            second.append(parts[1])
+
+        unique_codes = self.classify_codes(
+            gene, self.encode_alleles(gene, first), self.encode_alleles(gene, second)
+        )
+        for i, code in irregular.items():
+            unique_codes[i] = code
+        phenotypes = unique_codes[inverse]
+
+        risks = {}
+        for drug in drugs:
+            drug = drug.upper()
+            if drug not in self.drug_index:
+                raise KeyError(f"Unsupported drug: {drug}")
+            risks[drug] = self.risk_vector(drug)[phenotypes]
+
+        return {"phenotypes": phenotypes, "risks": risks}
+
+
+def _factorize(values: Sequence[str]):
+    # (distinct values, int32 index of each input into them). Cohorts repeat
+    # a handful of alleles, so one dict pass beats sorting the strings.
+    import numpy as np
+
+    positions: Dict[str, int] = {}
+    inverse = np.fromiter(
+        (positions.setdefault(v, len(positions)) for v in values),
+        dtype=np.int32,
+        count=len(values)
+    )
+    return list(positions), inverse
@@ -0,0 +1,184 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from collections import OrderedDict
+from typing import Awaitable, Dict, List, Optional
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from app.explanation_cache import SQLiteStore, explanation_cache
+
+router = APIRouter()
+
+# How long a finished explanation stays fetchable, and a hard cap on how
+# many are tracked so abandoned tokens can't grow memory without bound.
+DEFERRED_TTL_SECONDS = float(os.getenv("DEFERRED_EXPLANATION_TTL_SECONDS", "900"))
+DEFERRED_MAX_ENTRIES = int(os.getenv("DEFERRED_EXPLANATION_MAX", "10000"))
+SSE_HEARTBEAT_SECONDS = 15
+# How often a stream for an explanation running on another worker re-reads
+# its status from the shared store
+SSE_POLL_SECONDS = 0.5
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class DeferredExplanations:
+    # The explanation runs as a task on the worker that took the request.
+    # With EXPLANATION_CACHE_DB set, its status and result are also written
+    # to the shared SQLite file so a poll or stream that lands on another
+    # uvicorn worker finds it. Without it, IDs are only known to their own
+    # worker and deployments must run a single worker.
+    def __init__(self, ttl: float, max_entries: int, store: Optional[SQLiteStore] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self._tasks: "OrderedDict[str, asyncio.Task]" = OrderedDict()
+        self._created: Dict[str, float] = {}
+        self._writes = set()
+
+    def submit(self, coro: Awaitable[Dict]) -> str:
+        self._prune()
+        explanation_id = uuid.uuid4().hex
+        self._tasks[explanation_id] = asyncio.ensure_future(coro)
+        self._created[explanation_id] = time.monotonic()
+        return explanation_id
+
+    async def submit_many(self, coro: Awaitable[List[Dict]], count: int) -> List[str]:
+        # One background call whose result list fans out to `count` IDs
+        batch = asyncio.ensure_future(coro)
+        ids = [self.submit(_nth(batch, i)) for i in range(count)]
+        if self.store is not None:
+            # Recorded before the IDs are handed out, so no worker can 404
+            await asyncio.to_thread(self.store.set_deferred, {i: (PENDING, None) for i in ids}, self.ttl)
+            batch.add_done_callback(lambda _: self._publish(ids, batch))
+        return ids
+
+    def _publish(self, ids: List[str], batch: asyncio.Future):
+        if batch.cancelled() or batch.exception() is not None:
+            records = {i: (FAILED, None) for i in ids}
+        else:
+            records = {i: (READY, value) for i, value in zip(ids, batch.result())}
+        write = asyncio.ensure_future(asyncio.to_thread(self.store.set_deferred, records, self.ttl))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    def get(self, explanation_id: str) -> Optional[asyncio.Task]:
+        return self._tasks.get(explanation_id)
+
+    async def lookup(self, explanation_id: str) -> Optional[Dict]:
+        # Status payload from this worker's task, else from the shared store
+        task = self._tasks.get(explanation_id)
+        if task is not None:
+            return _payload(explanation_id, task)
+        if self.store is None:
+            return None
+        record = await asyncio.to_thread(self.store.get_deferred, explanation_id)
+        if record is None:
+            return None
+        status, value = record
+        payload = {"explanation_id": explanation_id, "status": status}
+        if status == READY:
+            payload["explanation"] = value
+        return payload
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._tasks:
+            oldest = next(iter(self._tasks))
+            expired = now - self._created[oldest] > self.ttl
+            if not expired and len(self._tasks) < self.max_entries:
+                break
+            task = self._tasks.pop(oldest)
+            del self._created[oldest]
+            if not task.done():
+                task.cancel()
+
+
+async def _nth(batch: asyncio.Future, i: int) -> Dict:
+    # shield: pruning one ID must not cancel the others' shared call
+    return (await asyncio.shield(batch))[i]
+
+
+deferred_explanations = DeferredExplanations(
+    DEFERRED_TTL_SECONDS, DEFERRED_MAX_ENTRIES, explanation_cache.store
+)
+
+
+def pending_explanation(explanation_id: str) -> Dict:
+    return {
+        "summary": "",
+        "mechanism": "",
+        "citations": [],
+        "status": "pending",
+        "explanation_id": explanation_id
+    }
+
+
+def _payload(explanation_id: str, task: asyncio.Task) -> Dict:
+    if not task.done():
+        return {"explanation_id": explanation_id, "status": PENDING}
+    if task.cancelled() or task.exception() is not None:
+        return {"explanation_id": explanation_id, "status": FAILED}
+    return {"explanation_id": explanation_id, "status": READY, "explanation": task.result()}
+
+
+@router.get("/{explanation_id}")
+async def get_explanation(explanation_id: str):
+    payload = await deferred_explanations.lookup(explanation_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Explanation not found or expired")
+    return payload
+
+
+@router.get("/{explanation_id}/stream")
+async def stream_explanation(explanation_id: str):
+    payload = await deferred_explanations.lookup(explanation_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Explanation not found or expired")
+
+    task = deferred_explanations.get(explanation_id)
+    if task is None:
+        # Running on another worker: follow it through the shared store
+        return _event_stream(_poll_events(explanation_id, payload))
+
+    async def events():
+        # Comment lines keep proxies from closing an idle connection
+        while not task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+                break
+            except Exception:
+                break
+        yield f"event: explanation\ndata: {json.dumps(_payload(explanation_id, task))}\n\n"
+
+    return _event_stream(events())
+
+
+async def _poll_events(explanation_id: str, payload: Dict):
+    last_sent = time.monotonic()
+    while payload["status"] == PENDING:
+        await asyncio.sleep(SSE_POLL_SECONDS)
+        payload = await deferred_explanations.lookup(explanation_id)
+        if payload is None:
+            payload = {"explanation_id": explanation_id, "status": FAILED}
+        if time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+    yield f"event: explanation\ndata: {json.dumps(payload)}\n\n"
+
+
+def _event_stream(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,244 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "2048"))
+EXPLANATION_CACHE_TTL_SECONDS = float(os.getenv("EXPLANATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Optional SQLite file shared by all workers on the host; unset = memory only
+EXPLANATION_CACHE_DB = os.getenv("EXPLANATION_CACHE_DB")
+
+
+def explanation_key(gene: str, phenotype: str, drug: str, variants: List) -> str:
+    # Only the inputs that reach the prompt; variant order and duplicates
+    # don't change the explanation.
+    normalized = {
+        "gene": (gene or "").upper(),
+        "phenotype": phenotype or "",
+        "drug": (drug or "").upper(),
+        "variants": sorted({(v.rsid or "", v.star or "") for v in variants})
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS explanations "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # Deferred explanation status, so any worker can answer a poll
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS deferred_explanations "
+            "(id TEXT PRIMARY KEY, status TEXT NOT NULL, value TEXT, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM explanations WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict]:
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM explanations WHERE key IN ({placeholders}) AND expires_at > ?",
+                (*keys, time.time())
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, key: str, value: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO explanations (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl)
+            )
+            self._conn.commit()
+
+    def set_many(self, values: Dict[str, Dict]):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO explanations (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires_at) for key, value in values.items()]
+            )
+            self._conn.commit()
+
+    def set_deferred(self, records: Dict[str, Tuple[str, Optional[Dict]]], ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM deferred_explanations WHERE expires_at <= ?", (now,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO deferred_explanations (id, status, value, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(explanation_id, status, json.dumps(value) if value is not None else None, now + ttl)
+                 for explanation_id, (status, value) in records.items()]
+            )
+            self._conn.commit()
+
+    def get_deferred(self, explanation_id: str) -> Optional[Tuple[str, Optional[Dict]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, value FROM deferred_explanations WHERE id = ? AND expires_at > ?",
+                (explanation_id, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]) if row[1] is not None else None
+
+
+class ExplanationCache:
+    """In-process LRU in front of an optional persistent store.
+
+    Concurrent lookups for the same key share one in-flight computation.
+    Computed values come with a ``cacheable`` flag so fallback text
+    produced while the LLM is failing is served but never stored.
+    """
+
+    def __init__(self, memory: TTLCache, store: Optional[SQLiteStore] = None):
+        self.memory = memory
+        self.store = store
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loads = set()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_compute_many(
+            self, keys: List[str],
+            compute_many: Callable[[List[str]], Awaitable[Dict[str, Tuple[Dict, bool]]]]) -> List[Dict]:
+        """Cached values for ``keys``, with one ``compute_many`` call for all misses.
+
+        ``compute_many`` receives the keys that are neither cached nor in
+        flight and returns ``{key: (value, cacheable)}``. Keys it leaves out
+        fail with KeyError for their callers.
+        """
+        found: Dict[str, Dict] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            value = self.memory.get(key)
+            if value is not None:
+                self.hits += 1
+                found[key] = value
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[key] = self._inflight[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            # One future per key, so overlapping batches can join this one
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            for key, fut in futures.items():
+                self._inflight[key] = fut
+                fut.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+            waiting.update(futures)
+            load = asyncio.ensure_future(self._load_many(futures, compute_many))
+            # The loop only holds tasks weakly
+            self._loads.add(load)
+            load.add_done_callback(self._loads.discard)
+
+        # shield: one caller disconnecting must not cancel the shared call.
+        # Awaited together so a failed batch doesn't leave unread exceptions
+        values = await asyncio.gather(*(asyncio.shield(fut) for fut in waiting.values()))
+        found.update(zip(waiting, values))
+        return [found[key] for key in keys]
+
+    async def _load_many(self, futures: Dict[str, asyncio.Future], compute_many):
+        try:
+            keys = list(futures)
+            if self.store is not None:
+                stored = await asyncio.to_thread(self.store.get_many, keys)
+                for key, value in stored.items():
+                    self.persistent_hits += 1
+                    self.memory.set(key, value)
+                    futures[key].set_result(value)
+                keys = [key for key in keys if key not in stored]
+
+            if keys:
+                self.misses += len(keys)
+                computed = await compute_many(keys)
+                stored = {}
+                for key in keys:
+                    if key not in computed:
+                        futures[key].set_exception(KeyError(key))
+                        continue
+                    value, cacheable = computed[key]
+                    if cacheable:
+                        self.memory.set(key, value)
+                        stored[key] = value
+                    futures[key].set_result(value)
+                if stored and self.store is not None:
+                    await asyncio.to_thread(self.store.set_many, stored)
+        except BaseException as e:
+            for fut in futures.values():
+                if fut.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    fut.cancel()
+                else:
+                    fut.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.persistent_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.memory),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0
+        }
+
+
+explanation_cache = ExplanationCache(
+    TTLCache(EXPLANATION_CACHE_SIZE, EXPLANATION_CACHE_TTL_SECONDS),
+    SQLiteStore(EXPLANATION_CACHE_DB, EXPLANATION_CACHE_TTL_SECONDS) if EXPLANATION_CACHE_DB else None
+)
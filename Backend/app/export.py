@@ -0,0 +1,213 @@
+"""Columnar export of analysis results.
+
+Assessments (the /analyze response objects) are flattened to one row per
+patient and drug and written in row groups to Parquet or an Arrow IPC file.
+Only one row group is held in memory at a time, so exports of any cohort
+size run in constant memory. Gene, drug, phenotype and the other
+low-cardinality columns are dictionary-encoded and load as categoricals in
+pandas or polars. Arrow files are written uncompressed so they can be
+memory-mapped and read zero-copy.
+
+    cd Backend
+    python -m app.export <job_id> cohort.parquet
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+import argparse
+import os
+
+EXPORT_FORMATS = ("parquet", "arrow")
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "10000"))
+EXPORT_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file"
+}
+EXPORT_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+DICTIONARY_COLUMNS = [
+    "drug", "primary_gene", "diplotype", "phenotype", "risk_label", "severity",
+    "knowledge_base_version"
+]
+
+
+def export_schema():
+    import pyarrow as pa
+
+    category = pa.dictionary(pa.int32(), pa.string())
+    variant = pa.struct([
+        ("rsid", pa.string()),
+        ("gene", pa.string()),
+        ("chromosome", pa.string()),
+        ("position", pa.string())
+    ])
+    return pa.schema([
+        ("patient_id", pa.string()),
+        ("drug", category),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("knowledge_base_version", category),
+        # risk_assessment
+        ("risk_label", category),
+        ("confidence_score", pa.float32()),
+        ("severity", category),
+        # pharmacogenomic_profile
+        ("primary_gene", category),
+        ("diplotype", category),
+        ("phenotype", category),
+        ("detected_variants", pa.list_(variant)),
+        # quality_metrics
+        ("vcf_parsing_success", pa.bool_()),
+        ("variants_detected", pa.int32()),
+        ("genes_identified", pa.list_(pa.string()))
+    ])
+
+
+class _Dictionary:
+    # Codes for one column. The dictionary only ever grows, so each batch's
+    # dictionary extends the previous one and Arrow files get delta batches
+    # instead of a replacement.
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: str) -> int:
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ResultExportWriter:
+    def __init__(self, path: str, fmt: str = "parquet", row_group_size: int = EXPORT_ROW_GROUP_SIZE):
+        import pyarrow as pa
+
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {EXPORT_FORMATS}")
+        self.path = path
+        self.format = fmt
+        self.row_group_size = row_group_size
+        self.schema = export_schema()
+        self.rows = 0
+        self._dictionaries = {name: _Dictionary() for name in DICTIONARY_COLUMNS}
+        self._columns: Dict[str, List] = {name: [] for name in self.schema.names}
+
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(
+                self._sink, self.schema,
+                options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, assessment: Dict):
+        risk = assessment["risk_assessment"]
+        profile = assessment["pharmacogenomic_profile"]
+        metrics = assessment["quality_metrics"]
+        values = {
+            "patient_id": assessment["patient_id"],
+            "drug": assessment["drug"],
+            "timestamp": datetime.fromisoformat(assessment["timestamp"].rstrip("Z")).replace(
+                tzinfo=timezone.utc
+            ),
+            "knowledge_base_version": assessment.get("knowledge_base_version") or "",
+            "risk_label": risk["risk_label"],
+            "confidence_score": risk["confidence_score"],
+            "severity": risk["severity"],
+            "primary_gene": profile["primary_gene"],
+            "diplotype": profile["diplotype"],
+            "phenotype": profile["phenotype"],
+            "detected_variants": profile["detected_variants"],
+            "vcf_parsing_success": metrics["vcf_parsing_success"],
+            "variants_detected": metrics["variants_detected"],
+            "genes_identified": metrics["genes_identified"]
+        }
+        for name, value in values.items():
+            dictionary = self._dictionaries.get(name)
+            self._columns[name].append(dictionary.code(value) if dictionary else value)
+
+        self.rows += 1
+        if len(self._columns["patient_id"]) >= self.row_group_size:
+            self._flush()
+
+    def write_many(self, assessments: Iterable[Dict]):
+        for assessment in assessments:
+            self.write(assessment)
+
+    def _flush(self):
+        import pyarrow as pa
+
+        if not self._columns["patient_id"]:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self._columns[field.name]
+            dictionary = self._dictionaries.get(field.name)
+            if dictionary is not None:
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(values, type=pa.int32()), pa.array(dictionary.values, type=pa.string())
+                ))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+            values.clear()
+        # One row group per flush
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._flush()
+        self._writer.close()
+        self._writer = None
+        if self.format == "arrow":
+            self._sink.close()
+
+
+def export_job(job_id: str, path: str, fmt: str = "parquet") -> int:
+    """Write a finished job's results to path; returns the number of rows."""
+    from app.jobs import iter_job_results
+
+    # Written beside the target and renamed, so a failed export never
+    # leaves a truncated file behind
+    tmp_path = path + ".part"
+    try:
+        with ResultExportWriter(tmp_path, fmt) as writer:
+            for _sample, assessments in iter_job_results(job_id):
+                writer.write_many(assessments)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return writer.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a finished job's results")
+    parser.add_argument("job_id")
+    parser.add_argument("path", help="output file; .arrow/.feather writes Arrow IPC, else Parquet")
+    args = parser.parse_args()
+
+    from app.jobs import SUCCEEDED, get_job
+
+    job = get_job(args.job_id)
+    if job is None or job["status"] != SUCCEEDED:
+        raise SystemExit(f"job {args.job_id} is {job['status'] if job else 'not found'}")
+
+    fmt = "arrow" if args.path.endswith((".arrow", ".feather")) else "parquet"
+    rows = export_job(args.job_id, args.path, fmt)
+    print(f"wrote {rows} rows to {args.path} ({fmt})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from typing import List, Tuple
+
+# Gene spans (1-based, inclusive) for the pharmacogenes in TARGET_GENES.
+# Both assemblies are listed because uploads arrive on either build; a
+# region that does not exist in a file's index is simply never queried.
+GENE_REGIONS = {
+    "GRCh37": {
+        "CYP2D6": ("22", 42522501, 42526883),
+        "CYP2C19": ("10", 96522463, 96612671),
+        "CYP2C9": ("10", 96698415, 96749147),
+        "SLCO1B1": ("12", 21284128, 21392730),
+        "TPMT": ("6", 18128545, 18155374),
+        "DPYD": ("1", 97543299, 98386615)
+    },
+    "GRCh38": {
+        "CYP2D6": ("22", 42126499, 42130881),
+        "CYP2C19": ("10", 94762681, 94855547),
+        "CYP2C9": ("10", 94938658, 94990091),
+        "SLCO1B1": ("12", 21130388, 21239796),
+        "TPMT": ("6", 18128311, 18155305),
+        "DPYD": ("1", 97077743, 97921049)
+    }
+}
+
+# Flanking sequence kept around each gene so upstream/promoter alleles
+# (e.g. CYP2C19*17) are not cut off.
+REGION_PADDING = 10_000
+
+
+def normalize_chrom(chrom: str) -> str:
+    return chrom[3:] if chrom.lower().startswith("chr") else chrom
+
+
+def target_regions(genes=None) -> List[Tuple[str, int, int, str]]:
+    regions = []
+    for build in GENE_REGIONS.values():
+        for gene, (chrom, start, end) in build.items():
+            if genes is not None and gene not in genes:
+                continue
+            regions.append((chrom, max(1, start - REGION_PADDING), end + REGION_PADDING, gene))
+    return sorted(regions)
@@ -0,0 +1,208 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import base64
+
+from app.auth import get_current_user
+from app.database import db
+from app.persistence import ANALYSES_COLLECTION
+
+router = APIRouter()
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Every query is limited to the caller's own assessments, the ones saved
+# with their account as owner. With AUTH_REQUIRED off, anonymous callers
+# share the "" owner, as they share result cache entries.
+
+# Fields a page may project; "result" is the full stored response and is
+# only returned when asked for.
+SUMMARY_FIELDS = ["patient_id", "drug", "gene", "diplotype", "phenotype", "risk_label", "timestamp"]
+ALLOWED_FIELDS = set(SUMMARY_FIELDS) | {"result"}
+
+
+def _collection():
+    if db.db is None:
+        raise HTTPException(status_code=503, detail="History storage is not configured")
+    return db.db[ANALYSES_COLLECTION]
+
+
+def _projection(fields: Optional[str]) -> Dict:
+    if not fields:
+        names = SUMMARY_FIELDS
+    else:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in names if f not in ALLOWED_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # timestamp and _id are always needed to build the next cursor
+    projection = {name: 1 for name in names}
+    projection["timestamp"] = 1
+    return projection
+
+
+def _parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.rstrip("Z"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} timestamp")
+
+
+# ==============================
+# KEYSET CURSORS
+# ==============================
+# Pages are ordered by (timestamp, _id) descending. The cursor is the sort
+# key of the last row returned, so the next page is a range scan on the
+# compound index instead of a skip over everything already seen.
+def encode_cursor(timestamp: datetime, object_id) -> str:
+    raw = f"{timestamp.isoformat()}|{object_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, object]:
+    # (timestamp, ObjectId); bson comes with pymongo, so it's imported here
+    # rather than when the app starts
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        timestamp, object_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after_cursor(query: Dict, cursor: Optional[str]) -> Dict:
+    if not cursor:
+        return query
+    timestamp, object_id = decode_cursor(cursor)
+    return {
+        "$and": [query, {
+            "$or": [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": object_id}}
+            ]
+        }]
+    }
+
+
+def _serialize(doc: Dict) -> Dict:
+    doc["id"] = str(doc.pop("_id"))
+    if isinstance(doc.get("timestamp"), datetime):
+        doc["timestamp"] = doc["timestamp"].isoformat() + "Z"
+    return doc
+
+
+async def _page(query: Dict, cursor: Optional[str], limit: int, fields: Optional[str]) -> Dict:
+    collection = _collection()
+    projection = _projection(fields)
+
+    # One extra row tells whether another page exists
+    docs: List[Dict] = await collection.find(
+        _after_cursor(query, cursor), projection
+    ).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last["timestamp"], last["_id"])
+
+    return {"items": [_serialize(d) for d in docs], "next_cursor": next_cursor}
+
+
+def _owner(user: Optional[Dict]) -> str:
+    return user["sub"] if user else ""
+
+
+def _time_range(since: Optional[str], until: Optional[str]) -> Dict:
+    bounds = {}
+    start = _parse_time(since, "since")
+    end = _parse_time(until, "until")
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return {"timestamp": bounds} if bounds else {}
+
+
+# ==============================
+# HISTORY ENDPOINTS
+# ==============================
+@router.get("/patients/{patient_id}")
+async def patient_history(
+    patient_id: str,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = None,
+    user: Dict | None = Depends(get_current_user)
+):
+    # This caller's assessments of the patient, newest first
+    return await _page({"owner": _owner(user), "patient_id": patient_id}, cursor, limit, fields)
+
+
+@router.get("/assessments")
+async def search_assessments(
+    drug: str | None = None,
+    gene: str | None = None,
+    risk_label: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = None,
+    user: Dict | None = Depends(get_current_user)
+):
+    # e.g. ?drug=CLOPIDOGREL&risk_label=Toxic&since=2026-10-01, over this
+    # caller's assessments
+    query = {"owner": _owner(user), **_time_range(since, until)}
+    if drug:
+        query["drug"] = drug.upper()
+    if gene:
+        query["gene"] = gene.upper()
+    if risk_label:
+        query["risk_label"] = risk_label
+    return await _page(query, cursor, limit, fields)
+
+
+@router.get("/summary")
+async def risk_summary(
+    drug: str | None = None,
+    gene: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    user: Dict | None = Depends(get_current_user)
+):
+    # Risk-label counts per (drug, gene) of this caller's assessments,
+    # computed by the database
+    match = {"owner": _owner(user), **_time_range(since, until)}
+    if drug:
+        match["drug"] = drug.upper()
+    if gene:
+        match["gene"] = gene.upper()
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"drug": "$drug", "gene": "$gene", "risk_label": "$risk_label"},
+            "count": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": {"drug": "$_id.drug", "gene": "$_id.gene"},
+            "total": {"$sum": "$count"},
+            "risk_labels": {"$push": {"k": "$_id.risk_label", "v": "$count"}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "drug": "$_id.drug",
+            "gene": "$_id.gene",
+            "total": 1,
+            "risk_labels": {"$arrayToObject": "$risk_labels"}
+        }},
+        {"$sort": {"drug": 1, "gene": 1}}
+    ]
+    groups = await _collection().aggregate(pipeline).to_list(length=None)
+    return {"groups": groups}
@@ -0,0 +1,617 @@
+from contextlib import closing, contextmanager
+from datetime import datetime
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+import orjson
+
+from app.analysis import UnsupportedDrugError, analyze_cohort, gene_for_drug, parse_drug_list
+from app.knowledge_base import KnowledgeBase, current_knowledge_base
+from app.result_cache import rules_version
+from app.vcf_parser import MAX_JOB_VCF_BYTES, CohortGenotypes, VCFFormatError, read_cohort
+
+router = APIRouter()
+
+# ==============================
+# DURABLE JOB QUEUE
+# ==============================
+# Long analyses (WGS files, large cohorts) run as jobs: the upload is
+# stored under JOBS_DIR, the job is a row in a local SQLite database in WAL
+# mode, and a pool of worker processes claims jobs with a renewable lease.
+# Each worker checkpoints finished samples in batches; a job whose worker
+# died is picked up again once its lease lapses and only the samples
+# without a checkpoint are analyzed. Submitting the same file for the same
+# drugs and rules returns the existing job.
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.getcwd(), "jobs"))
+JOBS_DB_PATH = os.path.join(JOBS_DIR, "jobs.sqlite3")
+JOBS_INPUT_DIR = os.path.join(JOBS_DIR, "inputs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_CHECKPOINT_SAMPLES = int(os.getenv("JOB_CHECKPOINT_SAMPLES", "100"))
+# A job that has taken down its worker this many times is failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = 1.0
+RESULT_PAGE_SIZE = 200
+
+VCF_EXTENSIONS = (".vcf", ".vcf.gz", ".vcf.bgz")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    drugs TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total_samples INTEGER,
+    completed_samples INTEGER NOT NULL DEFAULT 0,
+    knowledge_base_version TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_samples (
+    job_id TEXT NOT NULL,
+    sample_index INTEGER NOT NULL,
+    sample TEXT NOT NULL,
+    assessments BLOB NOT NULL,
+    PRIMARY KEY (job_id, sample_index)
+);
+"""
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    # Autocommit; writes go through transaction() below
+    conn = sqlite3.connect(path or JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL a commit survives a process crash; only a power loss can
+    # drop the last few, and those samples are simply redone
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    # IMMEDIATE takes the write lock up front, so two workers can't both
+    # read a job as claimable
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def init_store():
+    os.makedirs(JOBS_INPUT_DIR, exist_ok=True)
+    with closing(connect()) as conn:
+        conn.executescript(SCHEMA)
+
+
+def job_view(row: sqlite3.Row) -> Dict:
+    total = row["total_samples"]
+    return {
+        "job_id": row["job_id"],
+        "status": row["status"],
+        "filename": row["filename"],
+        "drugs": row["drugs"].split(","),
+        "total_samples": total,
+        "completed_samples": row["completed_samples"],
+        "progress": round(row["completed_samples"] / total, 4) if total else 0.0,
+        "knowledge_base_version": row["knowledge_base_version"],
+        "attempts": row["attempts"],
+        "error": row["error"],
+        "created_at": datetime.utcfromtimestamp(row["created_at"]).isoformat() + "Z",
+        "finished_at": (
+            datetime.utcfromtimestamp(row["finished_at"]).isoformat() + "Z"
+            if row["finished_at"] else None
+        )
+    }
+
+
+# ==============================
+# STORE OPERATIONS (API side)
+# ==============================
+def submit_job(staged_path: str, content_hash: str, filename: str, drugs: List[str],
+               rules: str) -> Tuple[sqlite3.Row, bool]:
+    """Queue a job for a staged upload; returns (job row, created)."""
+    key = hashlib.sha256(f"{content_hash}|{','.join(drugs)}|{rules}".encode("utf-8")).hexdigest()
+    now = time.time()
+    with closing(connect()) as conn:
+        with transaction(conn):
+            row = conn.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()
+            if row is not None and row["status"] not in (FAILED, CANCELLED):
+                created = False
+            else:
+                job_id = row["job_id"] if row is not None else str(uuid.uuid4())
+                input_path = os.path.join(JOBS_INPUT_DIR, job_id + _extension(filename))
+                os.replace(staged_path, input_path)
+                if row is None:
+                    conn.execute(
+                        "INSERT INTO jobs (job_id, idempotency_key, content_hash, drugs, filename,"
+                        " input_path, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, key, content_hash, ",".join(drugs), filename, input_path,
+                         QUEUED, now, now)
+                    )
+                else:
+                    # Resubmitting a failed or cancelled job resumes it; its
+                    # checkpointed samples are kept
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, input_path = ?, error = NULL, attempts = 0,"
+                        " lease_owner = NULL, finished_at = NULL, updated_at = ? WHERE job_id = ?",
+                        (QUEUED, input_path, now, job_id)
+                    )
+                created = True
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+
+    if not created:
+        os.unlink(staged_path)
+    return row, created
+
+
+def get_job(job_id: str) -> Optional[sqlite3.Row]:
+    with closing(connect()) as conn:
+        return conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+
+def cancel_job(job_id: str) -> Optional[sqlite3.Row]:
+    # A running worker notices at its next checkpoint, stops and removes
+    # the input; a queued job's input is removed here
+    with closing(connect()) as conn:
+        with transaction(conn):
+            before = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if before is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, finished_at = ?, updated_at = ?"
+                " WHERE job_id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), time.time(), job_id, QUEUED, RUNNING)
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if before["status"] == QUEUED:
+        _remove_input(before)
+    return row
+
+
+def result_page(job_id: str, after: int) -> List[sqlite3.Row]:
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT sample_index, sample, assessments FROM job_samples"
+            " WHERE job_id = ? AND sample_index > ? ORDER BY sample_index LIMIT ?",
+            (job_id, after, RESULT_PAGE_SIZE)
+        ).fetchall()
+
+
+def iter_job_results(job_id: str) -> Iterator[Tuple[str, List[Dict]]]:
+    """(sample, assessments) for every checkpointed sample of a job, a page
+    at a time."""
+    after = -1
+    while True:
+        rows = result_page(job_id, after)
+        if not rows:
+            return
+        for row in rows:
+            yield row["sample"], orjson.loads(row["assessments"])
+        after = rows[-1]["sample_index"]
+
+
+def status_counts() -> Dict[str, int]:
+    with closing(connect()) as conn:
+        return {
+            row["status"]: row["count"]
+            for row in conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+        }
+
+
+def _remove_input(job: sqlite3.Row):
+    try:
+        os.unlink(job["input_path"])
+    except OSError:
+        pass
+
+
+def _extension(filename: str) -> str:
+    for ext in VCF_EXTENSIONS:
+        if filename.endswith(ext):
+            return ext
+    return ".vcf"
+
+
+# ==============================
+# WORKER (runs in its own process)
+# ==============================
+class _LeaseKeeper(threading.Thread):
+    # Renews the job's lease while the worker is busy, including during the
+    # long single parse of the input file
+    def __init__(self, job_id: str, owner: str):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.owner = owner
+        self._stopped = threading.Event()
+
+    def run(self):
+        with closing(connect()) as conn:
+            while not self._stopped.wait(JOB_LEASE_SECONDS / 3):
+                conn.execute(
+                    "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND lease_owner = ?",
+                    (time.time() + JOB_LEASE_SECONDS, self.job_id, self.owner)
+                )
+
+    def stop(self):
+        self._stopped.set()
+
+
+def claim_job(conn: sqlite3.Connection) -> Optional[sqlite3.Row]:
+    now = time.time()
+    with transaction(conn):
+        candidates = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?)"
+            " ORDER BY created_at",
+            (QUEUED, RUNNING, now)
+        )
+        for row in candidates.fetchall():
+            if row["attempts"] >= JOB_MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, finished_at = ?,"
+                    " updated_at = ? WHERE job_id = ?",
+                    (FAILED, "Worker process crashed repeatedly", now, now, row["job_id"])
+                )
+                continue
+            owner = str(uuid.uuid4())
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                (RUNNING, owner, now + JOB_LEASE_SECONDS, now, row["job_id"])
+            )
+            return conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+    return None
+
+
+def load_job_cohort(path: str, filename: str) -> CohortGenotypes:
+    with open(path, "rb") as f:
+        cohort = read_cohort(f, max_bytes=MAX_JOB_VCF_BYTES)
+    if not cohort.samples:
+        # Sites-only VCF: one sample carrying every record once, as /analyze
+        # treats records without a GT column
+        import numpy as np
+
+        return CohortGenotypes(
+            [os.path.basename(filename)],
+            cohort.sites,
+            {gene: np.ones((1, len(sites)), dtype=np.int8) for gene, sites in cohort.sites.items()}
+        )
+    return cohort
+
+
+def analyze_samples(cohort: CohortGenotypes, indexes: List[int], drugs: List[str],
+                    kb: KnowledgeBase) -> List[Tuple[int, str, bytes]]:
+    """(sample index, sample, assessments JSON) for a subset of the cohort."""
+    from app.batch import sample_assessments
+    from app.llm_engine import fallback_explanation
+
+    subset = CohortGenotypes(
+        [cohort.samples[i] for i in indexes],
+        cohort.sites,
+        {gene: matrix[indexes] for gene, matrix in cohort.genotypes.items()}
+    )
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    rows = []
+    for i, sample, results in zip(indexes, subset.samples, analyze_cohort(subset, drugs, kb)):
+        explanations = [
+            fallback_explanation(r["gene"], r["phenotype"], r["drug"], "LLM explanation not requested for jobs.")
+            for r in results
+        ]
+        _, assessments = sample_assessments(sample, timestamp, results, explanations)
+        rows.append((i, sample, orjson.dumps(assessments)))
+    return rows
+
+
+def _finish(conn: sqlite3.Connection, job: sqlite3.Row, status: str, error: Optional[str] = None):
+    now = time.time()
+    with transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, finished_at = ?,"
+            " updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+            (status, error, now, now, job["job_id"], job["lease_owner"])
+        )
+        current = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job["job_id"],)).fetchone()
+    # By status, not lease: a cancel that clears the lease after the last
+    # checkpoint still ends the job, and its input is no longer needed
+    if current is not None and current["status"] in (SUCCEEDED, FAILED, CANCELLED):
+        _remove_input(job)
+
+
+def run_job(conn: sqlite3.Connection, job: sqlite3.Row, stop: threading.Event):
+    job_id, owner = job["job_id"], job["lease_owner"]
+    lease = _LeaseKeeper(job_id, owner)
+    lease.start()
+    try:
+        kb = current_knowledge_base()
+        drugs = job["drugs"].split(",")
+        cohort = load_job_cohort(job["input_path"], job["filename"])
+
+        with transaction(conn):
+            if job["knowledge_base_version"] not in (None, kb.tag):
+                # Checkpoints from other rules can't be mixed into this run
+                conn.execute("DELETE FROM job_samples WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET total_samples = ?, knowledge_base_version = ?,"
+                " completed_samples = (SELECT COUNT(*) FROM job_samples WHERE job_id = ?)"
+                " WHERE job_id = ?",
+                (len(cohort.samples), kb.tag, job_id, job_id)
+            )
+        done = {
+            row[0] for row in
+            conn.execute("SELECT sample_index FROM job_samples WHERE job_id = ?", (job_id,))
+        }
+        remaining = [i for i in range(len(cohort.samples)) if i not in done]
+
+        for start in range(0, len(remaining), JOB_CHECKPOINT_SAMPLES):
+            if stop.is_set():
+                # Shutting down: hand the job back now rather than waiting
+                # for the lease to lapse. A clean stop isn't a crash, so the
+                # attempt taken at claim time is given back too.
+                with transaction(conn):
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, lease_owner = NULL, attempts = attempts - 1,"
+                        " updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                        (QUEUED, time.time(), job_id, owner)
+                    )
+                return
+
+            rows = analyze_samples(cohort, remaining[start:start + JOB_CHECKPOINT_SAMPLES], drugs, kb)
+            with transaction(conn):
+                current = conn.execute(
+                    "SELECT status, lease_owner FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                if current["status"] != RUNNING or current["lease_owner"] != owner:
+                    # Cancelled, or the lease lapsed and another worker took over
+                    if current["status"] == CANCELLED:
+                        _remove_input(job)
+                    return
+                conn.executemany(
+                    "INSERT OR IGNORE INTO job_samples (job_id, sample_index, sample, assessments)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(job_id, i, sample, blob) for i, sample, blob in rows]
+                )
+                conn.execute(
+                    "UPDATE jobs SET updated_at = ?,"
+                    " completed_samples = (SELECT COUNT(*) FROM job_samples WHERE job_id = ?)"
+                    " WHERE job_id = ?",
+                    (time.time(), job_id, job_id)
+                )
+
+        _finish(conn, job, SUCCEEDED)
+    except (VCFFormatError, UnsupportedDrugError) as e:
+        _finish(conn, job, FAILED, str(e))
+    except Exception as e:
+        print("JOB ERROR:", job_id, str(e))
+        _finish(conn, job, FAILED, "Analysis failed")
+    finally:
+        lease.stop()
+
+
+def worker_main(stop):
+    # Entry point of each worker process; stop is a multiprocessing.Event
+    with closing(connect()) as conn:
+        while not stop.is_set():
+            job = claim_job(conn)
+            if job is None:
+                stop.wait(JOB_POLL_SECONDS)
+                continue
+            run_job(conn, job, stop)
+
+
+class JobWorkers:
+    # Owns the worker processes of this server process and replaces any
+    # that exit, so a crash only delays the job it was running
+    def __init__(self, count: int):
+        self.count = count
+        self.restarts = 0
+        self._processes: List[multiprocessing.Process] = []
+        self._stop = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _spawn(self) -> multiprocessing.Process:
+        # spawn, not fork: the server process already runs threads
+        process = multiprocessing.get_context("spawn").Process(
+            target=worker_main, args=(self._stop,), daemon=True, name="pharmaguard-job-worker"
+        )
+        process.start()
+        return process
+
+    def start(self):
+        init_store()
+        if self.count <= 0:
+            return
+        self._stop = multiprocessing.get_context("spawn").Event()
+        self._processes = [self._spawn() for _ in range(self.count)]
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(5)
+            for i, process in enumerate(self._processes):
+                if not process.is_alive() and not self._stop.is_set():
+                    print("JOB WORKER ERROR:", f"pid {process.pid} exited with {process.exitcode}")
+                    self._processes[i] = self._spawn()
+                    self.restarts += 1
+
+    async def stop(self, timeout: float = 10.0):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self._stop is None:
+            return
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                # Its job's lease lapses and another worker resumes it
+                process.terminate()
+        self._processes = []
+
+    def stats(self) -> Dict:
+        return {
+            "workers": sum(1 for p in self._processes if p.is_alive()),
+            "restarts": self.restarts
+        }
+
+
+job_workers = JobWorkers(JOB_WORKERS)
+
+
+# ==============================
+# JOB ENDPOINTS
+# ==============================
+def _stage_upload(fileobj) -> Tuple[str, str]:
+    # Copy the spooled upload next to the job inputs, hashing it on the way
+    hasher = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix=".upload-", dir=JOBS_INPUT_DIR)
+    try:
+        fileobj.seek(0)
+        total = 0
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+                # Same limit the worker applies, checked before the job exists
+                total += len(chunk)
+                if total > MAX_JOB_VCF_BYTES:
+                    raise VCFFormatError(f"File exceeds {MAX_JOB_VCF_BYTES // (1024 * 1024)}MB limit")
+                hasher.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, hasher.hexdigest()
+
+
+@router.post("", status_code=202)
+async def submit(
+    drug: str = Form(...),
+    vcf_file: UploadFile = File(...)
+):
+    drugs = parse_drug_list(drug)
+    if not drugs:
+        raise HTTPException(status_code=400, detail="No drug specified")
+
+    kb = current_knowledge_base()
+    try:
+        for d in drugs:
+            gene_for_drug(kb, d)
+    except UnsupportedDrugError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not vcf_file.filename.endswith(VCF_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only .vcf or .vcf.gz files allowed")
+
+    try:
+        staged, content_hash = await run_in_threadpool(_stage_upload, vcf_file.file)
+    except VCFFormatError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    row, created = await run_in_threadpool(
+        submit_job, staged, content_hash, os.path.basename(vcf_file.filename), drugs,
+        rules_version(kb)
+    )
+    return {**job_view(row), "created": created}
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    row = await run_in_threadpool(get_job, job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(row)
+
+
+@router.post("/{job_id}/cancel")
+async def cancel(job_id: str):
+    row = await run_in_threadpool(cancel_job, job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(row)
+
+
+async def _stream_results(job_id: str):
+    # Stored assessments are already JSON; pages are spliced into NDJSON
+    # lines without decoding them
+    after = -1
+    while True:
+        rows = await run_in_threadpool(result_page, job_id, after)
+        if not rows:
+            return
+        yield b"".join(
+            b'{"sample":' + orjson.dumps(row["sample"]) + b',"status":"ok","assessments":'
+            + row["assessments"] + b"}\n"
+            for row in rows
+        )
+        after = rows[-1]["sample_index"]
+
+
+async def _finished_job(job_id: str) -> sqlite3.Row:
+    row = await run_in_threadpool(get_job, job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if row["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {row['status']}")
+    return row
+
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str):
+    await _finished_job(job_id)
+    return StreamingResponse(_stream_results(job_id), media_type="application/x-ndjson")
+
+
+@router.get("/{job_id}/export")
+async def job_export(job_id: str, format: str = "parquet"):
+    # Columnar file of every assessment, one row per sample and drug
+    from app.export import EXPORT_EXTENSIONS, EXPORT_FORMATS, EXPORT_MEDIA_TYPES, export_job
+
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    row = await _finished_job(job_id)
+
+    fd, path = tempfile.mkstemp(prefix=".export-", suffix=EXPORT_EXTENSIONS[format], dir=JOBS_DIR)
+    os.close(fd)
+    try:
+        await run_in_threadpool(export_job, job_id, path, format)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    filename = row["filename"].split(".")[0] + EXPORT_EXTENSIONS[format]
+    return FileResponse(
+        path, media_type=EXPORT_MEDIA_TYPES[format], filename=filename,
+        background=BackgroundTask(os.unlink, path)
+    )
+
@@ -0,0 +1,347 @@
+"""Versioned pharmacogenomic knowledge base.
+
+The rules (star-allele function, drug rules, recommendations, alternatives)
+live in a JSON data file. It is compiled into one immutable snapshot file:
+
+    8 bytes   magic
+    4 bytes   header length (little-endian)
+    header    JSON: version, digests, the rule dicts and the table layout
+    padding   to an 8-byte boundary
+    tables    int8 phenotype and risk tables (see decision_table.py)
+
+Every worker memory-maps the same snapshot, so the compiled int8 tables sit
+in the page cache once per host. The header (rule and recommendation dicts,
+a few KB) is parsed into each worker's own memory. A new snapshot is written to a temporary file
+and renamed over the old one; workers notice the new inode on their next
+check and swap it in, while requests already running keep the snapshot they
+started with.
+
+    cd Backend
+    python -m app.knowledge_base                  # compile the default file
+    python -m app.knowledge_base rules.json --snapshot /srv/pgx/kb.snapshot
+"""
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Optional, Tuple
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from app.auth import require_admin
+from app.decision_table import PHENOTYPES, DecisionTable, compile_tables
+
+router = APIRouter()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", os.path.join(DATA_DIR, "knowledge_base.json"))
+KNOWLEDGE_BASE_SNAPSHOT_PATH = os.getenv(
+    "KNOWLEDGE_BASE_SNAPSHOT_PATH", os.path.splitext(KNOWLEDGE_BASE_PATH)[0] + ".snapshot"
+)
+# How often a worker stats the snapshot and source file for a new version
+KNOWLEDGE_BASE_RELOAD_SECONDS = float(os.getenv("KNOWLEDGE_BASE_RELOAD_SECONDS", "5"))
+
+SNAPSHOT_MAGIC = b"PGXKB\x00\x00\x01"
+_HEADER_LENGTH = struct.Struct("<I")
+
+STAR_FUNCTIONS = {"normal", "reduced", "no_function", "increased"}
+
+
+class KnowledgeBaseError(ValueError):
+    """Raised when a knowledge base file or snapshot can't be used."""
+
+
+# ==============================
+# SOURCE FILE
+# ==============================
+def validate_source(data: Dict):
+    for key in ("version", "star_function", "drug_rules", "recommendations", "alternatives"):
+        if key not in data:
+            raise KnowledgeBaseError(f"Knowledge base is missing '{key}'")
+
+    for gene, alleles in data["star_function"].items():
+        for allele, function in alleles.items():
+            if function not in STAR_FUNCTIONS:
+                raise KnowledgeBaseError(f"{gene} {allele}: unknown allele function '{function}'")
+
+    for drug, rule in data["drug_rules"].items():
+        if drug != drug.upper():
+            raise KnowledgeBaseError(f"Drug names must be upper case: {drug}")
+        if rule.get("gene") not in data["star_function"]:
+            raise KnowledgeBaseError(f"{drug}: gene '{rule.get('gene')}' has no star-allele functions")
+        for phenotype, risk in rule.get("risk_map", {}).items():
+            if phenotype not in PHENOTYPES:
+                raise KnowledgeBaseError(f"{drug}: unknown phenotype '{phenotype}'")
+            if risk not in data["recommendations"]:
+                raise KnowledgeBaseError(f"{drug}: risk '{risk}' has no recommendation")
+
+    if "Unknown" not in data["recommendations"]:
+        raise KnowledgeBaseError("Knowledge base needs an 'Unknown' recommendation")
+
+
+def source_digest(data: Dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_source(path: str = KNOWLEDGE_BASE_PATH) -> Dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise KnowledgeBaseError(f"Cannot read knowledge base {path}: {e}")
+    validate_source(data)
+    return data
+
+
+# ==============================
+# SNAPSHOT
+# ==============================
+def compile_snapshot(data: Dict, snapshot_path: str = KNOWLEDGE_BASE_SNAPSHOT_PATH) -> str:
+    """Compile validated source data into a snapshot; returns its version tag."""
+    layout, tables = compile_tables(data["star_function"], data["drug_rules"])
+    digest = source_digest(data)
+    header = {
+        "version": data["version"],
+        "digest": digest,
+        "guideline": data.get("guideline", "CPIC"),
+        "compiled_at": datetime.utcnow().isoformat() + "Z",
+        "star_function": data["star_function"],
+        "drug_rules": data["drug_rules"],
+        "recommendations": data["recommendations"],
+        "alternatives": data["alternatives"],
+        "layout": layout
+    }
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    prefix = len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size + len(header_bytes)
+    padding = b"\x00" * (-prefix % 8)
+
+    # Written beside the target and renamed over it, so readers only ever
+    # see a complete old or a complete new snapshot.
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".kb-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+            f.write(header_bytes)
+            f.write(padding)
+            f.write(tables)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return version_tag(data["version"], digest)
+
+
+def version_tag(version: str, digest: str) -> str:
+    # "1.0.0+3f2a9c0d41b7": the content digest catches edits made without
+    # bumping the version number
+    return f"{version}+{digest[:12]}"
+
+
+class KnowledgeBase:
+    # One immutable, memory-mapped snapshot. Never mutated after load; a
+    # new version is a new KnowledgeBase object.
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise KnowledgeBaseError(f"Empty knowledge base snapshot: {path}")
+
+        view = memoryview(self._mmap)
+        if bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise KnowledgeBaseError(f"Not a knowledge base snapshot: {path}")
+        start = len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack_from(view, len(SNAPSHOT_MAGIC))
+        header = json.loads(bytes(view[start:start + header_length]))
+        tables_offset = start + header_length
+        tables_offset += -tables_offset % 8
+
+        self.path = path
+        self.version: str = header["version"]
+        self.digest: str = header["digest"]
+        self.tag = version_tag(self.version, self.digest)
+        self.guideline: str = header["guideline"]
+        self.compiled_at: str = header["compiled_at"]
+        self.recommendations: Dict[str, str] = header["recommendations"]
+        self.alternatives: Dict = header["alternatives"]
+        self.table = DecisionTable(
+            header["layout"], view[tables_offset:], header["star_function"], header["drug_rules"]
+        )
+        self.loaded_at = time.time()
+
+    @property
+    def drug_rules(self) -> Dict:
+        return self.table.drug_rules
+
+    @property
+    def star_function(self) -> Dict:
+        return self.table.star_function
+
+    def recommendation(self, risk: str) -> str:
+        return self.recommendations.get(risk, "Consult clinical guidelines")
+
+    def alternatives_for(self, drug: str):
+        return self.alternatives.get(drug, [])
+
+    def info(self) -> Dict:
+        return {
+            "version": self.tag,
+            "guideline": self.guideline,
+            "compiled_at": self.compiled_at,
+            "genes": self.table.genes,
+            "drugs": self.table.drugs
+        }
+
+
+def _file_id(path: str) -> Optional[Tuple[int, int, int]]:
+    # os.replace gives the new snapshot a new inode, so this changes on
+    # every swap even within one mtime tick
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+# ==============================
+# PER-PROCESS CURRENT SNAPSHOT
+# ==============================
+class KnowledgeBaseStore:
+    def __init__(self, source_path: str, snapshot_path: str, reload_seconds: float):
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path
+        self.reload_seconds = reload_seconds
+        self._kb: Optional[KnowledgeBase] = None
+        self._snapshot_id = None
+        self._source_id = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def current(self) -> KnowledgeBase:
+        """The snapshot to use for one request. Callers hold on to it for
+        the whole request so every lookup sees the same version."""
+        kb = self._kb
+        if kb is not None and time.monotonic() < self._next_check:
+            return kb
+
+        with self._lock:
+            if self._kb is None or time.monotonic() >= self._next_check:
+                try:
+                    self._refresh()
+                except (OSError, KnowledgeBaseError) as e:
+                    if self._kb is None:
+                        raise
+                    # Keep serving the version we have
+                    self.reload_errors += 1
+                    print("KNOWLEDGE BASE ERROR:", str(e))
+                self._next_check = time.monotonic() + self.reload_seconds
+            return self._kb
+
+    def reload(self) -> KnowledgeBase:
+        """Recompile from the source file now and swap the result in."""
+        with self._lock:
+            self._compile(load_source(self.source_path))
+            self._next_check = time.monotonic() + self.reload_seconds
+            return self._kb
+
+    def _refresh(self):
+        # Another worker (or the CLI) may have published a new snapshot
+        snapshot_id = _file_id(self.snapshot_path)
+        broken = False
+        if snapshot_id is not None and snapshot_id != self._snapshot_id:
+            try:
+                self._swap(KnowledgeBase(self.snapshot_path), snapshot_id)
+            except (ValueError, KeyError, struct.error) as e:
+                # Unreadable or from an older layout: rebuilt from source below
+                print("KNOWLEDGE BASE ERROR:", f"snapshot {self.snapshot_path}: {e}")
+                broken = True
+
+        # The source file was edited: recompile unless the snapshot already
+        # holds the same content
+        source_id = _file_id(self.source_path)
+        if broken or source_id != self._source_id or self._kb is None:
+            data = load_source(self.source_path)
+            if broken or self._kb is None or self._kb.digest != source_digest(data):
+                self._compile(data)
+            self._source_id = source_id
+
+    def _compile(self, data: Dict):
+        compile_snapshot(data, self.snapshot_path)
+        snapshot_id = _file_id(self.snapshot_path)
+        self._swap(KnowledgeBase(self.snapshot_path), snapshot_id)
+
+    def _swap(self, kb: KnowledgeBase, snapshot_id):
+        # A plain reference swap: requests holding the old object keep its
+        # mapping alive until they finish
+        if self._kb is not None and self._kb.tag != kb.tag:
+            self.reloads += 1
+            print("KNOWLEDGE BASE:", f"{self._kb.tag} -> {kb.tag}")
+        self._kb = kb
+        self._snapshot_id = snapshot_id
+
+    def stats(self) -> Dict:
+        kb = self._kb
+        return {
+            "version": kb.tag if kb else None,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors
+        }
+
+
+knowledge_base = KnowledgeBaseStore(
+    KNOWLEDGE_BASE_PATH, KNOWLEDGE_BASE_SNAPSHOT_PATH, KNOWLEDGE_BASE_RELOAD_SECONDS
+)
+
+
+def current_knowledge_base() -> KnowledgeBase:
+    return knowledge_base.current()
+
+
+# ==============================
+# ADMIN ENDPOINTS
+# ==============================
+@router.get("")
+def knowledge_base_info():
+    return {**current_knowledge_base().info(), **knowledge_base.stats()}
+
+
+@router.post("/reload", dependencies=[Depends(require_admin)])
+def reload_knowledge_base():
+    # Other workers pick the new snapshot up on their next check
+    try:
+        kb = knowledge_base.reload()
+    except KnowledgeBaseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return kb.info()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a knowledge base snapshot")
+    parser.add_argument("source", nargs="?", default=KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--snapshot", default=None,
+                        help="output path (default: KNOWLEDGE_BASE_SNAPSHOT_PATH)")
+    args = parser.parse_args()
+
+    snapshot = args.snapshot or KNOWLEDGE_BASE_SNAPSHOT_PATH
+    tag = compile_snapshot(load_source(args.source), snapshot)
+    print(f"compiled {args.source} -> {snapshot} ({tag})")
+
+
+if __name__ == "__main__":
+    main()
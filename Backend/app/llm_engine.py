@@ -1,57 +1,282 @@
 import os
 import json
-from google import genai
+import time
+import asyncio
+import threading
 from dotenv import load_dotenv
 
+from app.explanation_cache import explanation_cache, explanation_key
+from app.metrics import LLM_BATCH_ITEMS, LLM_FALLBACKS, LLM_SECONDS
+
 load_dotenv()
 
 api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key) if api_key and api_key != "YOUR_API_KEY_HERE" else None
+LLM_ENABLED = bool(api_key) and api_key != "YOUR_API_KEY_HERE"
 
-def safe_generate_explanation(gene, phenotype, drug, variants):
-    if not client:
-        return {
-            "summary": f"{gene} affects metabolism of {drug}. Phenotype: {phenotype}.",
-            "mechanism": "LLM explanation unavailable (API Key missing).",
-            "citations": ["CPIC guidelines"]
-        }
+# google-genai takes ~0.5s to import, so the client is built on first use
+# (or by the startup warm-up) instead of at import time
+_client = None
+_client_lock = threading.Lock()
 
-    try:
-        prompt = f"""
-        You are a pharmacogenomics expert. Output strictly JSON. Include three keys: 'summary' (max 200 chars), 'mechanism' (max 400 chars), and 'citations' (an array of strings). Keep explanations accurate, clinical, and easy to understand.
-        
-        Explain the pharmacogenomic interaction.
-        Gene: {gene}
-        Phenotype: {phenotype}
-        Drug: {drug}
-        Variants: {variants}
-        """
-
-        response = client.models.generate_content(
+
+def get_client():
+    global _client
+    if _client is None and LLM_ENABLED:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=api_key)
+    return _client
+
+# Deadline for one LLM call, including time spent waiting for a slot
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "8"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failures; after
+    # `reset_seconds` one trial call is let through (half-open) and its
+    # outcome closes or re-opens the breaker.
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+def fallback_explanation(gene, phenotype, drug, mechanism):
+    return {
+        "summary": f"{gene} affects metabolism of {drug}. Phenotype: {phenotype}.",
+        "mechanism": mechanism,
+        "citations": ["CPIC guidelines"]
+    }
+
+
+async def _generate(prompt):
+    async with _llm_slots:
+        from google.genai import types
+
+        return await get_client().aio.models.generate_content(
             model="gemini-2.0-flash",
             contents=prompt,
-            config=genai.types.GenerateContentConfig(response_mime_type="application/json")
+            config=types.GenerateContentConfig(response_mime_type="application/json")
         )
 
-        text = response.text.strip()
-        if text.startswith("```json"):
-            text = text[7:-3]
-        elif text.startswith("```"):
-            text = text[3:-3]
 
-        data = json.loads(text.strip())
+# ==============================
+# BATCHED PROMPTS
+# ==============================
+# All of a request's gene-drug items go to Gemini in one prompt, as one
+# compact JSON object keyed by item id, and come back as one JSON object
+# with the same keys. Items are split across several calls only when they
+# would exceed the token budget, which covers the prompt plus the expected
+# answer. Variants are sent as "rsid:star" strings.
+
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "4000"))
+# Rough answer size of one item: 200 + 400 chars of text plus citations
+LLM_OUTPUT_TOKENS_PER_ITEM = 200
+CHARS_PER_TOKEN = 4
+
+PROMPT_HEADER = (
+    "You are a pharmacogenomics expert. Output strictly JSON. For each item of the input "
+    "object, explain the pharmacogenomic interaction between the drug and the patient's "
+    "gene phenotype. Answer with one JSON object using the same keys as the input; each "
+    "value has three keys: 'summary' (max 200 chars), 'mechanism' (max 400 chars), and "
+    "'citations' (an array of strings). Variants are given as \"rsid:star\". Keep "
+    "explanations accurate, clinical, and easy to understand.\n\nInput: "
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def compact_variants(variants) -> list:
+    # Same normalization as explanation_key: order and duplicates don't matter
+    return sorted({f"{v.rsid or '?'}:{v.star or '?'}" for v in variants})
+
+
+def prompt_item(result) -> dict:
+    return {
+        "drug": result["drug"],
+        "gene": result["gene"],
+        "phenotype": result["phenotype"],
+        "variants": compact_variants(result["variants"])
+    }
+
+
+def build_prompt(items: dict) -> str:
+    # items: item id -> prompt_item
+    return PROMPT_HEADER + json.dumps(items, separators=(",", ":"))
+
+
+def plan_prompts(entries: list, budget: int = LLM_PROMPT_TOKEN_BUDGET) -> list:
+    """Pack (key, result) entries into chunks of {item id: (key, result)}.
+
+    Ids are the drug name, suffixed when one chunk holds the same drug for
+    several patients. A chunk is closed once the next item would take it
+    over budget; an item bigger than the budget on its own still gets a
+    chunk of its own.
+    """
+    chunks = []
+    chunk, used = {}, estimate_tokens(PROMPT_HEADER)
+    for key, result in entries:
+        cost = estimate_tokens(json.dumps(prompt_item(result), separators=(",", ":")))
+        cost += LLM_OUTPUT_TOKENS_PER_ITEM
+        if chunk and used + cost > budget:
+            chunks.append(chunk)
+            chunk, used = {}, estimate_tokens(PROMPT_HEADER)
+        item_id = drug = result["drug"].upper()
+        n = 1
+        while item_id in chunk:
+            n += 1
+            item_id = f"{drug}.{n}"
+        chunk[item_id] = (key, result)
+        used += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _fallback(result, mechanism):
+    return fallback_explanation(result["gene"], result["phenotype"], result["drug"], mechanism)
+
+
+def _parse_response(text: str) -> dict:
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:-3]
+    elif text.startswith("```"):
+        text = text[3:-3]
+    data = json.loads(text.strip())
+    if not isinstance(data, dict):
+        raise ValueError("LLM response is not a JSON object")
+    return data
+
+
+def _explanation(data):
+    # None when the item's answer is missing or malformed
+    if not isinstance(data, dict) or not isinstance(data.get("summary"), str):
+        return None
+    citations = data.get("citations")
+    if not isinstance(citations, list):
+        citations = ["Gemini AI", "CPIC guidelines"]
+    return {
+        "summary": data["summary"],
+        "mechanism": data.get("mechanism") or "Mechanism unavailable.",
+        "citations": [str(c) for c in citations]
+    }
+
+
+async def safe_generate_explanations(results):
+    """One explanation per analysis result (gene, phenotype, drug, variants).
+
+    Cached items are served from the explanation cache; the rest share as
+    few Gemini calls as the token budget allows. Any item the LLM doesn't
+    answer gets fallback text, which is never cached.
+    """
+    if not results:
+        return []
+    if not LLM_ENABLED:
+        LLM_FALLBACKS.inc(len(results), reason="no_api_key")
+        return [_fallback(r, "LLM explanation unavailable (API Key missing).") for r in results]
+
+    keys = [explanation_key(r["gene"], r["phenotype"], r["drug"], r["variants"]) for r in results]
+    by_key = dict(zip(keys, results))
+    return await explanation_cache.get_or_compute_many(
+        keys, lambda missing: _generate_explanations([(k, by_key[k]) for k in missing])
+    )
+
+
+async def _generate_explanations(entries):
+    # {key: (explanation, cacheable)} over every chunk, run concurrently
+    computed = {}
+    for chunk_result in await asyncio.gather(*(
+        _generate_chunk(chunk) for chunk in plan_prompts(entries)
+    )):
+        computed.update(chunk_result)
+    return computed
+
+
+async def _generate_chunk(chunk):
+    # One Gemini call for a chunk from plan_prompts
+    def fallback_all(reason, mechanism):
+        LLM_FALLBACKS.inc(len(chunk), reason=reason)
+        return {key: (_fallback(r, mechanism), False) for key, r in chunk.values()}
+
+    if not breaker.allow():
+        return fallback_all("breaker_open", "LLM explanation temporarily unavailable.")
+
+    try:
+        prompt = build_prompt({item_id: prompt_item(r) for item_id, (_, r) in chunk.items()})
+
+        LLM_BATCH_ITEMS.observe(len(chunk))
+        start = time.perf_counter()
+        response = await asyncio.wait_for(_generate(prompt), timeout=LLM_TIMEOUT_SECONDS)
+        LLM_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+
+        data = _parse_response(response.text)
+        breaker.record_success()
+
+    except asyncio.CancelledError:
+        # Caller went away; don't leave a half-open trial slot taken
+        breaker.trial_in_flight = False
+        raise
 
-        return {
-            "summary": data.get("summary", f"{gene} affects metabolism of {drug}."),
-            "mechanism": data.get("mechanism", "Mechanism unavailable."),
-            "citations": data.get("citations", ["Gemini AI", "CPIC guidelines"])
-        }
+    except asyncio.TimeoutError:
+        print("GEMINI TIMEOUT:", ", ".join(chunk))
+        LLM_SECONDS.observe(time.perf_counter() - start, outcome="timeout")
+        breaker.record_failure()
+        return fallback_all("timeout", "Fallback explanation due to LLM timeout.")
 
     except Exception as e:
         print("GEMINI ERROR:", str(e))
+        breaker.record_failure()
+        return fallback_all("error", "Fallback explanation due to LLM error.")
 
-        return {
-            "summary": f"{gene} affects metabolism of {drug}. Phenotype: {phenotype}.",
-            "mechanism": "Fallback explanation due to LLM error.",
-            "citations": ["CPIC guidelines"]
-        }
+    # Partial answers: items the response left out or mangled fall back on
+    # their own, and are retried on the next request since they aren't cached
+    computed = {}
+    for item_id, (key, r) in chunk.items():
+        explanation = _explanation(data.get(item_id))
+        if explanation is None:
+            LLM_FALLBACKS.inc(reason="missing_item")
+            computed[key] = (_fallback(r, "Fallback explanation, item missing from LLM response."), False)
+        else:
+            computed[key] = (explanation, True)
+    return computed
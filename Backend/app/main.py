@@ -1,35 +1,118 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Depends, UploadFile, File, Form, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from datetime import datetime
-import uuid
+from typing import Dict, List
+import asyncio
+import hashlib
+from app.admission import AdmissionMiddleware, admission_controller
 from app.database import db
-from app.auth import router as auth_router
-
-from app.llm_engine import safe_generate_explanation
-from app.vcf_parser import parse_vcf
-from app.phenotype_engine import infer_diplotype, infer_phenotype
-from app.drug_rules import assess_drug_risk
-from app.recommendations import RECOMMENDATIONS
+from app.auth import get_current_user, require_user, router as auth_router, token_cache
+from app.batch import router as batch_router, shutdown_executor
+
+from app.llm_engine import LLM_ENABLED, fallback_explanation, get_client, safe_generate_explanations
+from app.explanation_cache import explanation_cache
+from app.history import router as history_router
+from app.jobs import job_workers, router as jobs_router, status_counts
+from app.knowledge_base import current_knowledge_base, knowledge_base, router as knowledge_base_router
+from app.deferred import router as deferred_router, deferred_explanations, pending_explanation
+from app.models import AnalyzeResponse
+from app.metrics import (
+    SERVER_TIMING_ENABLED,
+    UPLOAD_BYTES,
+    VARIANTS_PER_FILE,
+    StageTimer,
+    metric_lines,
+    register_collector,
+    render_metrics
+)
+from app.persistence import analysis_writer, ensure_indexes
+from app.warmup import STARTUP_TIMINGS, WARMUP_ENABLED, warm_up
+from app.result_cache import (
+    ensure_cache_indexes,
+    make_etag,
+    panel_key,
+    parse_if_none_match,
+    result_cache,
+    result_key,
+    rules_version
+)
+from app.vcf_parser import parse_vcf, VCFFormatError
+from app.analysis import (
+    InvalidPatientIdError,
+    UnsupportedDrugError,
+    analyze_drugs,
+    build_drug_assessment,
+    parse_drug_list,
+    quality_metrics,
+    resolve_patient_id,
+    with_patient_id
+)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
+# Added first so CORS wraps it and 429s stay readable from the browser
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Batch-ID", "Server-Timing", "Retry-After"],
 )
 
-# @app.on_event("startup")
-# async def startup_db_client():
-#     db.connect()
+STARTUP_TIMINGS["import"] = time.perf_counter() - _import_started
+
 
-# @app.on_event("shutdown")
-# async def shutdown_db_client():
-#     db.close()
+@app.on_event("startup")
+async def warm_up_caches():
+    if WARMUP_ENABLED:
+        await asyncio.to_thread(warm_up)
+    if LLM_ENABLED:
+        # Slow import; built in the background so startup isn't held up
+        asyncio.get_running_loop().run_in_executor(None, get_client)
+    print("STARTUP:", ", ".join(f"{k}={v:.3f}s" for k, v in STARTUP_TIMINGS.items()))
+
+@app.on_event("startup")
+async def startup_db_client():
+    db.connect()
+    await ensure_indexes()
+    await ensure_cache_indexes()
+    analysis_writer.start()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_workers.start()
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    await analysis_writer.stop()
+    db.close()
+
+@app.on_event("shutdown")
+async def shutdown_batch_workers():
+    shutdown_executor()
+    await job_workers.stop()
 
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
+protected = [Depends(get_current_user)]
+# Jobs, explanations and the knowledge base admin routes need a token even
+# when AUTH_REQUIRED is off
+authenticated = [Depends(require_user)]
+app.include_router(batch_router, prefix="/analyze/batch", tags=["Batch"], dependencies=protected)
+# The SSE stream needs the Authorization header too, so clients read it
+# with fetch() rather than EventSource
+app.include_router(deferred_router, prefix="/explanations", tags=["Explanations"], dependencies=authenticated)
+app.include_router(history_router, prefix="/history", tags=["History"], dependencies=protected)
+app.include_router(jobs_router, prefix="/jobs", tags=["Jobs"], dependencies=authenticated)
+app.include_router(
+    knowledge_base_router, prefix="/knowledge-base", tags=["Knowledge Base"], dependencies=authenticated
+)
 
 # ==============================
 # HEALTH CHECK
@@ -44,150 +127,296 @@ def health():
     return {"status": "ok"}
 
 
-# ==============================
-# VCF VALIDATION FUNCTION
-# ==============================
-async def validate_vcf(file: UploadFile):
-    if not file.filename.endswith(".vcf"):
-        raise HTTPException(status_code=400, detail="Only .vcf files allowed")
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "explanations": explanation_cache.stats(),
+        "results": result_cache.stats(),
+        "persistence": analysis_writer.stats(),
+        "auth_tokens": token_cache.stats(),
+        "knowledge_base": knowledge_base.stats(),
+        "admission": admission_controller.stats()
+    }
 
-    content = (await file.read()).decode("utf-8", errors="ignore")
 
-    if "##fileformat=VCF" not in content:
-        raise HTTPException(status_code=400, detail="Invalid VCF format")
+def _cache_metrics():
+    lines = []
+    caches = {
+        "explanations": explanation_cache.stats(),
+        "results": result_cache.stats(),
+        "auth_tokens": token_cache.stats()
+    }
+    lookups = {}
+    for cache, stats in caches.items():
+        for result in ("hits", "persistent_hits", "misses", "coalesced"):
+            if result in stats:
+                lookups[(("cache", cache), ("result", result))] = stats[result]
+    lines += metric_lines(
+        "pharmaguard_cache_lookups_total", "Cache lookups by cache and result", "counter", lookups
+    )
+    lines += metric_lines(
+        "pharmaguard_cache_entries", "Entries held in each in-memory cache", "gauge",
+        {(("cache", cache),): stats["entries"] for cache, stats in caches.items()}
+    )
+    return lines
 
-    if len(content) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File exceeds 5MB limit")
 
-    file.file.seek(0)
+def _startup_metrics():
+    return metric_lines(
+        "pharmaguard_startup_seconds", "Module import and warm-up time by phase", "gauge",
+        {(("phase", phase),): round(seconds, 6) for phase, seconds in STARTUP_TIMINGS.items()}
+    )
 
 
-# ==============================
-# MAIN ANALYSIS ENDPOINT
-# ==============================
-@app.post("/analyze")
-async def analyze_vcf(
-    vcf_file: UploadFile = File(...),
-    drug: str = Form(...)
-):
+def _knowledge_base_metrics():
+    stats = knowledge_base.stats()
+    lines = metric_lines(
+        "pharmaguard_knowledge_base_info", "Knowledge base version this worker serves", "gauge",
+        {(("version", stats["version"]),): 1} if stats["version"] else {}
+    )
+    lines += metric_lines(
+        "pharmaguard_knowledge_base_reloads_total", "Knowledge base reloads by result", "counter",
+        {(("result", "ok"),): stats["reloads"], (("result", "error"),): stats["reload_errors"]}
+    )
+    return lines
 
-    # STEP 1: Validate file
-    await validate_vcf(vcf_file)
-    vcf_file.file.seek(0)
 
-    # STEP 2: Parse VCF
-    variants = await parse_vcf(vcf_file)
+def _admission_metrics():
+    stats = admission_controller.stats()
+    return metric_lines(
+        "pharmaguard_admission_requests", "Upload requests in flight and waiting", "gauge",
+        {(("state", "active"),): stats["active"], (("state", "queued"),): stats["queued"]}
+    ) + metric_lines(
+        "pharmaguard_admission_buffered_bytes", "Declared upload bytes held by admitted requests",
+        "gauge", {(): stats["buffered_bytes"]}
+    )
 
-    if not variants:
-        raise HTTPException(status_code=400, detail="No pharmacogenomic variants detected")
 
-    # STEP 3: Multi-drug parsing
-    drug_list = [d.strip().upper() for d in drug.split(",")]
+def _job_metrics():
+    return metric_lines(
+        "pharmaguard_jobs", "Durable analysis jobs by status", "gauge",
+        {(("status", status),): count for status, count in status_counts().items()}
+    ) + metric_lines(
+        "pharmaguard_job_worker_restarts_total", "Job worker processes replaced after exiting",
+        "counter", {(): job_workers.stats()["restarts"]}
+    )
 
-    patient_id = str(uuid.uuid4())
-    timestamp = datetime.utcnow().isoformat() + "Z"
 
-    drug_assessments = []
+register_collector(_cache_metrics)
+register_collector(_startup_metrics)
+register_collector(_knowledge_base_metrics)
+register_collector(_admission_metrics)
+register_collector(_job_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
-    # STEP 4: Process first drug only (Single Object Requirement)
-    single_drug = drug_list[0]
+# ==============================
+# VCF VALIDATION FUNCTION
+# ==============================
+VCF_EXTENSIONS = (".vcf", ".vcf.gz", ".vcf.bgz")
+INDEX_EXTENSIONS = (".tbi", ".csi")
+
+# Header and size checks happen while the upload is streamed by parse_vcf,
+# so only the cheap filename check runs up front.
 
-    rule_check = assess_drug_risk(single_drug, "NM")
+def validate_vcf(file: UploadFile, index_file: UploadFile | None = None):
+    if not file.filename.endswith(VCF_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only .vcf or .vcf.gz files allowed")
 
-    if not rule_check or not rule_check[1]:
-        raise HTTPException(status_code=400, detail=f"Unsupported drug: {single_drug}")
+    if index_file is not None and not index_file.filename.endswith(INDEX_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Index must be a .tbi or .csi file")
 
-    gene = rule_check[1].get("gene")
 
-    # STEP 5: Genetics inference
-    # Detect if gene is completely missing from VCF (Safety Check)
-    genes_found_in_vcf = set(v.get("gene") for v in variants if v.get("gene"))
-    
-    if gene not in genes_found_in_vcf:
-        # If the gene for this drug wasn't found in the VCF, assume missing data
-        diplotype = "Unknown"
-        phenotype = "Indeterminate"
-        risk = "Unknown"
-        rule = {"severity": "none"}
+# ==============================
+# MAIN ANALYSIS ENDPOINT
+# ==============================
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_vcf(
+    response: Response,
+    user: Dict | None = Depends(get_current_user),
+    drug: str = Form(...),
+    vcf_file: UploadFile | None = File(None),
+    index_file: UploadFile | None = File(None),
+    multi_drug: bool = Form(False),
+    defer_explanation: bool = Form(False),
+    patient_id: str | None = Form(None),
+    if_none_match: str | None = Header(None)
+):
+    timer = StageTimer()
+    outcome = "error"
+    try:
+        result, outcome = await _analyze(
+            timer, response, drug, vcf_file, index_file,
+            multi_drug, defer_explanation, patient_id, if_none_match, user
+        )
+        if not isinstance(result, Response):
+            # The body is built in the documented shape already, so it goes
+            # straight to orjson instead of through response_model
+            # validation and jsonable_encoder
+            with timer.stage("serialize"):
+                result = ORJSONResponse(result, headers={
+                    k: v for k, v in response.headers.items() if k != "content-length"
+                })
+    finally:
+        timer.finish(outcome)
+
+    if SERVER_TIMING_ENABLED:
+        result.headers["Server-Timing"] = timer.server_timing()
+    return result
+
+
+def _from_cache(cached, patient_id: str, owner: str):
+    # A cache hit is still a new assessment for this patient: it gets its
+    # own timestamp and goes into their history like a fresh analysis
+    result = with_patient_id(cached, patient_id, datetime.utcnow().isoformat() + "Z")
+    analysis_writer.submit(result if isinstance(result, list) else [result], owner)
+    return result
+
+
+def _save_explained(explain: asyncio.Future, patient_id: str, timestamp: str,
+                    results: List[Dict], metrics: Dict, owner: str):
+    if explain.cancelled() or explain.exception() is not None:
+        explanations = [
+            fallback_explanation(r["gene"], r["phenotype"], r["drug"], "LLM explanation failed.")
+            for r in results
+        ]
     else:
-        diplotype = infer_diplotype(variants, gene)
-        phenotype = infer_phenotype(gene, diplotype)
+        explanations = explain.result()
+    analysis_writer.submit([
+        build_drug_assessment(patient_id, timestamp, r, explanation, metrics)
+        for r, explanation in zip(results, explanations)
+    ], owner)
+
+
+async def _analyze(timer: StageTimer, response: Response, drug: str,
+                   vcf_file: UploadFile | None, index_file: UploadFile | None,
+                   multi_drug: bool, defer_explanation: bool, patient_id: str | None,
+                   if_none_match: str | None, user: Dict | None):
+    # Returns (response body, outcome label for the latency histogram)
+
+    try:
+        patient_id = resolve_patient_id(patient_id)
+    except InvalidPatientIdError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # STEP 1: Multi-drug parsing
+    drug_list = parse_drug_list(drug)
+
+    if not drug_list:
+        raise HTTPException(status_code=400, detail="No drug specified")
+
+    # Single mode keeps the first drug only (Single Object Requirement)
+    if not multi_drug:
+        drug_list = drug_list[:1]
+
+    panel = panel_key(drug_list, multi_drug)
+
+    # One knowledge base snapshot for the whole request, even if a new
+    # version is swapped in meanwhile
+    kb = current_knowledge_base()
+    rules = rules_version(kb)
+    owner = user["sub"] if user else ""
+
+    # Re-analysis without re-sending the file: the client presents the ETag
+    # of an earlier response for the same upload.
+    if vcf_file is None:
+        with timer.stage("cache"):
+            for tag, content_hash in parse_if_none_match(if_none_match):
+                etag = make_etag(content_hash, panel, rules)
+                if etag == tag:
+                    return Response(status_code=304, headers={"ETag": etag}), "not_modified"
+                cached = await result_cache.get(result_key(content_hash, panel, rules, owner))
+                if cached is not None:
+                    response.headers["ETag"] = etag
+                    return _from_cache(cached, patient_id, owner), "cached"
+        if if_none_match:
+            raise HTTPException(status_code=412, detail="VCF upload required")
+        raise HTTPException(status_code=400, detail="vcf_file is required")
+
+    # STEP 2: Validate file
+    with timer.stage("validate"):
+        validate_vcf(vcf_file, index_file)
+
+    # STEP 3: Parse VCF (single streaming pass: header, size limit, records),
+    # hashing the upload on the way through for the result cache
+    hasher = hashlib.sha256()
+    with timer.stage("parse"):
+        try:
+            variants = await parse_vcf(vcf_file, index_file, hasher)
+        except VCFFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if vcf_file.size is not None:
+        UPLOAD_BYTES.observe(vcf_file.size)
+    VARIANTS_PER_FILE.observe(len(variants))
 
-        # STEP 6: Risk assessment
-        if phenotype == "Unknown":
-            risk = "Unknown"
-            rule = {}
-        else:
-            result = assess_drug_risk(single_drug, phenotype)
-            if not result:
-                risk = "Unknown"
-                rule = {}
-            else:
-                risk, rule = result
-
-    # STEP 7: Filter gene-specific variants
-    gene_variants = [v for v in variants if v.get("gene") == gene]
-
-    # STEP 8: LLM explanation
-    llm_explanation = safe_generate_explanation(
-        gene,
-        phenotype,
-        single_drug,
-        gene_variants
-    )
+    if not variants:
+        raise HTTPException(status_code=400, detail="No pharmacogenomic variants detected")
+
+    # Indexed uploads are only partly read, so they have no content hash
+    cache_key = None
+    if index_file is None:
+        content_hash = hasher.hexdigest()
+        etag = make_etag(content_hash, panel, rules)
+        if any(tag == etag for tag, _ in parse_if_none_match(if_none_match)):
+            return Response(status_code=304, headers={"ETag": etag}), "not_modified"
+        response.headers["ETag"] = etag
+
+        cache_key = result_key(content_hash, panel, rules, owner)
+        with timer.stage("cache"):
+            cached = await result_cache.get(cache_key)
+        if cached is not None:
+            return _from_cache(cached, patient_id, owner), "cached"
 
-    # STEP 9: Build drug assessment object (SINGLE OBJECT - EXACT SCHEMA)
-    response = {
-        "patient_id": patient_id,
-        "drug": single_drug,
-        "timestamp": timestamp,
-
-        "risk_assessment": {
-            "risk_label": risk,
-            "confidence_score": 0.95,
-            "severity": rule.get("severity", "none")
-        },
-
-        "pharmacogenomic_profile": {
-            "primary_gene": gene,
-            "diplotype": diplotype,
-            "phenotype": phenotype,
-            "detected_variants": [
-                {
-                    "rsid": v.get("rsid", "N/A"),
-                    "gene": v.get("gene", "Unknown"),
-                    "chromosome": v.get("chromosome", "Unknown"),
-                    "position": v.get("position", "Unknown")
-                }
-                for v in gene_variants
+    timestamp = datetime.utcnow().isoformat() + "Z"
+
+    # STEP 4-7: Rule lookup, genetics inference and risk assessment, with
+    # diplotype/phenotype computed once per gene shared by the drug panel
+    with timer.stage("genotype"):
+        try:
+            results = analyze_drugs(variants, drug_list, kb)
+        except UnsupportedDrugError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # STEP 8: LLM explanations, all drugs in one batched prompt. In deferred
+    # mode it runs in the background and the response carries their IDs.
+    with timer.stage("llm"):
+        if defer_explanation:
+            explain = asyncio.ensure_future(safe_generate_explanations(results))
+            llm_explanations = [
+                pending_explanation(explanation_id)
+                for explanation_id in await deferred_explanations.submit_many(explain, len(results))
             ]
-        },
-
-        "clinical_recommendation": {
-            "guideline": "CPIC",
-            "action": RECOMMENDATIONS.get(
-                risk, "Consult clinical guidelines"
-            ),
-            "alternatives": {
-                "CODEINE": ["Morphine", "Non-opioid analgesics"],
-                "WARFARIN": ["Direct Oral Anticoagulants"],
-                "CLOPIDOGREL": ["Prasugrel", "Ticagrelor"]
-            }.get(single_drug, [])
-        },
-
-        "llm_generated_explanation": {
-            "summary": llm_explanation.get("summary", ""),
-            "mechanism": llm_explanation.get("mechanism", ""),
-            "citations": llm_explanation.get("citations", ["CPIC guidelines"])
-        },
-
-        "quality_metrics": {
-            "vcf_parsing_success": True,
-            "variants_detected": len(variants),
-            "genes_identified": list(
-                set(v.get("gene") for v in variants if v.get("gene"))
+        else:
+            llm_explanations = await safe_generate_explanations(results)
+
+    # STEP 9: Build drug assessment objects
+    with timer.stage("build"):
+        metrics = quality_metrics(variants)
+        assessments = [
+            build_drug_assessment(patient_id, timestamp, r, explanation, metrics)
+            for r, explanation in zip(results, llm_explanations)
+        ]
+
+        result = assessments if multi_drug else assessments[0]
+
+        # Buffered; written by the background flusher, not awaited here.
+        # Deferred assessments are saved once their explanations are in, so
+        # history never keeps the pending placeholders.
+        if defer_explanation:
+            explain.add_done_callback(
+                lambda done: _save_explained(done, patient_id, timestamp, results, metrics, owner)
             )
-        }
-    }
+        else:
+            analysis_writer.submit(assessments, owner)
+
+    # Deferred responses hold pending explanation IDs, so they aren't cached
+    if cache_key and not defer_explanation:
+        result_cache.set(cache_key, result, rules)
 
-    return response
+    return result, "ok"
@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import os
+import threading
+import time
+
+# Minimal Prometheus text-format metrics (no client library). Counters and
+# histograms are process-local; with several workers each one serves its
+# own /metrics and the scraper aggregates.
+
+# Adds a Server-Timing header with per-stage durations to /analyze responses
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 1e8, 1e9)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 500, 1000)
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # label values -> [per-bucket counts..., sum, count]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labelnames + ("le",), key + (f"{bound:g}",))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _labels(self.labelnames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{inf} {series[-1]}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+# ==============================
+# METRICS
+# ==============================
+STAGE_SECONDS = Histogram(
+    "pharmaguard_analyze_stage_seconds", "Time spent in each /analyze stage",
+    LATENCY_BUCKETS, ["stage"]
+)
+REQUEST_SECONDS = Histogram(
+    "pharmaguard_analyze_request_seconds", "End-to-end /analyze latency by outcome",
+    LATENCY_BUCKETS, ["outcome"]
+)
+UPLOAD_BYTES = Histogram("pharmaguard_upload_bytes", "Size of uploaded VCF files", BYTES_BUCKETS)
+VARIANTS_PER_FILE = Histogram(
+    "pharmaguard_variants_per_file", "Pharmacogenomic variants found per VCF", COUNT_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    "pharmaguard_llm_request_seconds", "Latency of LLM explanation calls",
+    LATENCY_BUCKETS, ["outcome"]
+)
+LLM_BATCH_ITEMS = Histogram(
+    "pharmaguard_llm_batch_items", "Gene-drug items explained per LLM call", COUNT_BUCKETS
+)
+LLM_FALLBACKS = Counter(
+    "pharmaguard_llm_fallbacks_total", "Explanations served from fallback text", ["reason"]
+)
+ADMISSION_REJECTIONS = Counter(
+    "pharmaguard_admission_rejections_total", "Upload requests turned away by admission control",
+    ["reason"]
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "pharmaguard_admission_wait_seconds", "Time admitted uploads spent queued", LATENCY_BUCKETS
+)
+
+METRICS = [
+    STAGE_SECONDS, REQUEST_SECONDS, UPLOAD_BYTES, VARIANTS_PER_FILE, LLM_SECONDS, LLM_BATCH_ITEMS,
+    LLM_FALLBACKS, ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+]
+
+# Callables returning exposition lines, read at scrape time for counters
+# that other modules already keep (cache stats).
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            print("METRICS ERROR:", str(e))
+    return "\n".join(lines) + "\n"
+
+
+def metric_lines(name: str, documentation: str, kind: str,
+                samples: Dict[Tuple[Tuple[str, str], ...], float]) -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples.items():
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+        lines.append(f"{name}{label_text} {value}")
+    return lines
+
+
+# ==============================
+# PER-REQUEST STAGE TIMING
+# ==============================
+class StageTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages.append((name, elapsed))
+            STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def finish(self, outcome: str):
+        REQUEST_SECONDS.observe(time.perf_counter() - self.started, outcome=outcome)
+
+    def server_timing(self) -> str:
+        # e.g. "parse;dur=12.3, llm;dur=850.1"
+        return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in self.stages)
@@ -1,11 +1,14 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 
 
+# Shapes of the /analyze response as built by analysis.build_drug_assessment.
+# Used for the OpenAPI schema; responses are serialized straight to JSON
+# by orjson rather than re-validated through these models.
+
 class VariantModel(BaseModel):
     rsid: str
     gene: str
-    star: Optional[str]
     chromosome: str
     position: str
 
@@ -24,7 +27,24 @@ class PharmacogenomicProfile(BaseModel):
 
 
 class ClinicalRecommendation(BaseModel):
-    recommendation_text: str
+    guideline: str
+    action: str
+    alternatives: List[str]
+
+
+class LLMExplanation(BaseModel):
+    summary: str
+    mechanism: str
+    citations: List[str]
+    # Only present when the explanation was deferred
+    status: Optional[str] = None
+    explanation_id: Optional[str] = None
+
+
+class QualityMetrics(BaseModel):
+    vcf_parsing_success: bool
+    variants_detected: int
+    genes_identified: List[str]
 
 
 class FullResponse(BaseModel):
@@ -34,5 +54,11 @@ class FullResponse(BaseModel):
     risk_assessment: RiskAssessment
     pharmacogenomic_profile: PharmacogenomicProfile
     clinical_recommendation: ClinicalRecommendation
-    llm_generated_explanation: str
-    quality_metrics: dict
+    llm_generated_explanation: LLMExplanation
+    quality_metrics: QualityMetrics
+    # "<version>+<content digest>" of the knowledge base the result used
+    knowledge_base_version: str
+
+
+# Single-drug requests return one object, multi_drug requests a list
+AnalyzeResponse = Union[FullResponse, List[FullResponse]]
@@ -0,0 +1,155 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+import asyncio
+import os
+
+from app.database import db
+
+ANALYSES_COLLECTION = "analyses"
+
+# pymongo index directions, without importing pymongo for stateless runs
+ASCENDING = 1
+DESCENDING = -1
+
+# Results are queued in memory and written with insert_many off the request
+# path. A full queue drops new results (counted in stats) rather than
+# slowing /analyze down while the database is unavailable.
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "500"))
+PERSIST_FLUSH_SECONDS = float(os.getenv("PERSIST_FLUSH_SECONDS", "1.0"))
+PERSIST_QUEUE_MAX = int(os.getenv("PERSIST_QUEUE_MAX", "50000"))
+
+
+async def ensure_indexes():
+    if db.db is None:
+        return
+    collection = db.db[ANALYSES_COLLECTION]
+    # History queries are always scoped to one owner. Each compound index
+    # starts with owner and ends in (timestamp, _id) so the filter + sort +
+    # keyset cursor are answered by one index range scan.
+    owner = ("owner", ASCENDING)
+    newest = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+    try:
+        await collection.create_index([owner, ("patient_id", ASCENDING)] + newest)
+        # Drug or gene alone, and each with a risk label
+        await collection.create_index([owner, ("drug", ASCENDING)] + newest)
+        await collection.create_index([owner, ("gene", ASCENDING)] + newest)
+        await collection.create_index([owner, ("drug", ASCENDING), ("risk_label", ASCENDING)] + newest)
+        await collection.create_index([owner, ("gene", ASCENDING), ("risk_label", ASCENDING)] + newest)
+        await collection.create_index([owner] + newest)
+    except Exception as e:
+        print("PERSISTENCE ERROR:", str(e))
+
+
+def analysis_document(assessment: Dict, owner: str = "") -> Dict:
+    # Queried fields are lifted to the top level; the full response is kept
+    # as returned to the client. owner is the account that ran the analysis
+    # ("" when auth is off), the only one that can read it back.
+    profile = assessment["pharmacogenomic_profile"]
+    return {
+        "owner": owner,
+        "patient_id": assessment["patient_id"],
+        "drug": assessment["drug"],
+        "gene": profile["primary_gene"],
+        "diplotype": profile["diplotype"],
+        "phenotype": profile["phenotype"],
+        "risk_label": assessment["risk_assessment"]["risk_label"],
+        "timestamp": datetime.fromisoformat(assessment["timestamp"].rstrip("Z")),
+        "result": assessment
+    }
+
+
+class AnalysisWriter:
+    def __init__(self, batch_size: int, flush_seconds: float, max_queued: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queued = max_queued
+        self._queue: List[Dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def start(self):
+        if db.db is None or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Final drain so results accepted before shutdown aren't lost
+        while self._queue:
+            if not await self._flush():
+                break
+
+    def submit(self, assessments: List[Dict], owner: str = ""):
+        if self._task is None:
+            return
+        for assessment in assessments:
+            if len(self._queue) >= self.max_queued:
+                self.dropped += 1
+                continue
+            self._queue.append(analysis_document(assessment, owner))
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                if not await self._flush():
+                    break
+
+    async def _flush(self) -> bool:
+        from pymongo.errors import BulkWriteError
+
+        batch = self._queue[:self.batch_size]
+        del self._queue[:self.batch_size]
+        try:
+            await db.db[ANALYSES_COLLECTION].insert_many(batch, ordered=False)
+        except asyncio.CancelledError:
+            self._queue[:0] = batch
+            raise
+        except BulkWriteError as e:
+            # The server processed the batch; per-document errors (including
+            # duplicates from a retried batch) won't succeed on a retry.
+            details = e.details or {}
+            self.written += details.get("nInserted", 0)
+            self.dropped += sum(
+                1 for err in details.get("writeErrors", []) if err.get("code") != 11000
+            )
+            return True
+        except Exception as e:
+            print("PERSISTENCE ERROR:", str(e))
+            self.failed_batches += 1
+            # Requeue once room allows and retry on the next tick
+            room = self.max_queued - len(self._queue)
+            self.dropped += max(0, len(batch) - room)
+            self._queue[:0] = batch[:max(0, room)]
+            return False
+        self.written += len(batch)
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self._task is not None,
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches
+        }
+
+
+analysis_writer = AnalysisWriter(PERSIST_BATCH_SIZE, PERSIST_FLUSH_SECONDS, PERSIST_QUEUE_MAX)
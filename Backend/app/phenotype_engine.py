@@ -1,42 +1,17 @@
-STAR_FUNCTION = {
-    "CYP2D6": {
-        "*1": "normal",
-        "*2": "normal",
-        "*4": "no_function",
-        "*10": "reduced"
-    },
-    "CYP2C19": {
-        "*1": "normal",
-        "*2": "no_function",
-        "*3": "no_function",
-        "*17": "increased"
-    },
-    "CYP2C9": {
-        "*1": "normal",
-        "*2": "reduced",
-        "*3": "reduced"
-    },
-    "SLCO1B1": {
-        "*1": "normal",
-        "*5": "reduced",
-        "*15": "reduced"
-    },
-    "TPMT": {
-        "*1": "normal",
-        "*3A": "no_function",
-        "*3C": "no_function"
-    },
-    "DPYD": {
-        "*1": "normal",
-        "*2A": "no_function"
-    }
-}
+def _called_stars(stars, dosages):
+    # Hom-ref calls and no-calls (-1) carry no allele; hom-alt calls carry it
+    # twice. Records without a GT column (dosage None) count once, as before.
+    called = []
+    for star, dosage in zip(stars, dosages):
+        if not star or dosage == 0 or dosage == -1:
+            continue
+        called.append(star)
+        if dosage == 2:
+            called.append(star)
+    return called
 
 
-def infer_diplotype(variants, gene):
-    gene_vars = [v for v in variants if v["gene"] == gene]
-    stars = [v["star"] for v in gene_vars if v["star"]]
-
+def _diplotype(stars):
     if len(stars) >= 2:
         return f"{stars[0]}/{stars[1]}"
     elif len(stars) == 1:
@@ -45,12 +20,37 @@ def infer_diplotype(variants, gene):
         return "*1/*1"
 
 
-def infer_phenotype(gene, diplotype):
+def infer_diplotype(variants, gene):
+    gene_vars = [v for v in variants if v.gene == gene]
+    return _diplotype(_called_stars(
+        [v.star for v in gene_vars],
+        [v.dosage for v in gene_vars]
+    ))
+
+
+def infer_cohort_diplotypes(stars, genotypes):
+    # stars: one star allele (or None) per site; genotypes: int8 dosage
+    # matrix, samples x sites. Samples with identical genotype rows share
+    # one inference, which is most of a cohort at pharmacogene sites.
+    diplotypes = []
+    seen = {}
+    for row in genotypes:
+        key = row.tobytes()
+        diplotype = seen.get(key)
+        if diplotype is None:
+            diplotype = _diplotype(_called_stars(stars, row.tolist()))
+            seen[key] = diplotype
+        diplotypes.append(diplotype)
+    return diplotypes
+
+
+def infer_phenotype(gene, diplotype, star_function):
+    # star_function: gene -> star allele -> function, from the knowledge base
     alleles = diplotype.split("/")
     functions = []
 
     for allele in alleles:
-        functions.append(STAR_FUNCTION.get(gene, {}).get(allele, "unknown"))
+        functions.append(star_function.get(gene, {}).get(allele, "unknown"))
 
     if functions.count("no_function") == 2:
         return "PM"
@@ -1,7 +0,0 @@
-RECOMMENDATIONS = {
-    "Ineffective": "Avoid drug due to lack of therapeutic effect.",
-    "Toxic": "Avoid drug due to toxicity risk.",
-    "Adjust Dosage": "Dose adjustment recommended per CPIC guidelines.",
-    "Safe": "Standard dosing recommended.",
-    "Unknown": "Insufficient pharmacogenomic data."
-}
@@ -0,0 +1,138 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+
+from app.annotation import ALLELE_DEFINITIONS_PATH
+from app.database import db
+from app.explanation_cache import TTLCache
+from app.knowledge_base import KnowledgeBase, current_knowledge_base
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Persisted entries are removed by a Mongo TTL index this long after writing
+RESULT_CACHE_PERSIST_TTL_SECONDS = int(os.getenv("RESULT_CACHE_PERSIST_TTL_SECONDS", str(30 * 24 * 3600)))
+RESULT_CACHE_COLLECTION = "analysis_cache"
+
+
+@lru_cache(maxsize=None)
+def _allele_definitions_digest() -> str:
+    with open(ALLELE_DEFINITIONS_PATH, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def rules_version(kb: Optional[KnowledgeBase] = None) -> str:
+    # Any change to the knowledge base or allele definitions changes every
+    # key, so stale results are never served after a rules update. Callers
+    # pass the snapshot their request runs against.
+    kb = kb or current_knowledge_base()
+    combined = f"{kb.digest}|{_allele_definitions_digest()}"
+    return hashlib.sha256(combined.encode("utf-8")).hexdigest()[:12]
+
+
+def panel_key(drugs: List[str], multi_drug: bool) -> str:
+    return ("multi:" if multi_drug else "single:") + ",".join(drugs)
+
+
+def result_key(content_hash: str, panel: str, rules: str, owner: str = "") -> str:
+    # Scoped to the caller: an ETag-only request proves knowledge of the
+    # upload's hash, not possession of the file, so it may only reach
+    # results the same user computed.
+    return hashlib.sha256(f"{owner}|{content_hash}|{panel}|{rules}".encode("utf-8")).hexdigest()
+
+
+def make_etag(content_hash: str, panel: str, rules: str) -> str:
+    # "<upload sha256>.<panel digest>.<rules version>": the server can tell
+    # which file a client already holds results for without the file itself.
+    panel_digest = hashlib.sha256(panel.encode("utf-8")).hexdigest()[:16]
+    return f'"{content_hash}.{panel_digest}.{rules}"'
+
+
+def parse_if_none_match(header: Optional[str]) -> List[Tuple[str, str]]:
+    """Return (etag, content_hash) pairs from an If-None-Match header."""
+    tags = []
+    for raw in (header or "").split(","):
+        tag = raw.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        parts = tag.strip('"').split(".")
+        if len(parts) == 3 and len(parts[0]) == 64:
+            tags.append((tag, parts[0]))
+    return tags
+
+
+async def ensure_cache_indexes():
+    if db.db is None:
+        return
+    try:
+        await db.db[RESULT_CACHE_COLLECTION].create_index(
+            "created_at", expireAfterSeconds=RESULT_CACHE_PERSIST_TTL_SECONDS
+        )
+    except Exception as e:
+        print("RESULT CACHE ERROR:", str(e))
+
+
+class ResultCache:
+    # Bounded in-memory LRU, backed by the Mongo database when connected
+    def __init__(self, memory: TTLCache):
+        self.memory = memory
+        self._writes = set()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Dict]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if db.db is not None:
+            try:
+                doc = await db.db[RESULT_CACHE_COLLECTION].find_one({"_id": key})
+            except Exception as e:
+                print("RESULT CACHE ERROR:", str(e))
+                doc = None
+            if doc:
+                self.persistent_hits += 1
+                self.memory.set(key, doc["response"])
+                return doc["response"]
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value, rules: str):
+        # Cached responses are shared between requests and must not be mutated
+        self.memory.set(key, value)
+
+        # The Mongo write runs in the background, off the request path
+        if db.db is not None:
+            task = asyncio.ensure_future(self._persist(key, value, rules))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _persist(self, key: str, value, rules: str):
+        try:
+            await db.db[RESULT_CACHE_COLLECTION].replace_one(
+                {"_id": key},
+                {"_id": key, "rules_version": rules, "response": value, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            print("RESULT CACHE ERROR:", str(e))
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "rules_version": rules_version()
+        }
+
+
+result_cache = ResultCache(TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SECONDS))
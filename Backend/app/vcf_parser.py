@@ -1,4 +1,13 @@
-from typing import List, Dict
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional
+import asyncio
+import os
+import struct
+import sys
+import zlib
+
+from app.annotation import AnnotationIndex, get_annotation_index
+from app.bgzf import GZIP_MAGIC, BGZFReader, IndexFormatError, inflate_stream, merge_chunks, parse_index
+from app.gene_regions import normalize_chrom, target_regions
 
 TARGET_GENES = {
     "CYP2D6",
@@ -9,30 +18,292 @@ TARGET_GENES = {
     "DPYD"
 }
 
+MAX_VCF_BYTES = 5 * 1024 * 1024
+MAX_COMPRESSED_VCF_BYTES = int(os.getenv("MAX_COMPRESSED_VCF_MB", "2048")) * 1024 * 1024
+# Job inputs (WGS files, cohorts) go through the queue, not /analyze, and
+# get their own limit for plain and compressed files alike
+MAX_JOB_VCF_BYTES = int(os.getenv("JOB_MAX_VCF_MB", "4096")) * 1024 * 1024
+MAX_INDEX_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
 
-async def parse_vcf(upload_file) -> List[Dict]:
-    contents = await upload_file.read()
 
-    if not contents:
-        return []
+class VCFFormatError(ValueError):
+    """Raised when an upload is not a readable VCF or breaks an ingest limit."""
 
-    text = contents.decode("utf-8", errors="ignore")
-    lines = text.split("\n")
 
-    variants = []
+def _size_error(max_bytes: int) -> VCFFormatError:
+    return VCFFormatError(f"File exceeds {max_bytes // (1024 * 1024)}MB limit")
 
-    for line in lines:
-        if line.startswith("#") or not line.strip():
-            continue
 
-        # split by ANY whitespace (more robust than \t)
-        columns = line.strip().split()
+def is_gzipped(stream: BinaryIO) -> bool:
+    position = stream.tell()
+    magic = stream.read(2)
+    stream.seek(position)
+    return magic == GZIP_MAGIC
 
-        if len(columns) < 8:
-            continue
 
-        chrom, pos, rsid, ref, alt, qual, flt, info = columns[:8]
+def _read_chunks(stream: BinaryIO, max_bytes: int, chunk_size: int, hasher=None) -> Iterator[bytes]:
+    # Size limit is enforced as bytes arrive, so an oversized upload is never
+    # held in memory in full. The optional hasher sees the raw upload bytes.
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        total += len(chunk)
+        if total > max_bytes:
+            raise _size_error(max_bytes)
+
+        if hasher is not None:
+            hasher.update(chunk)
+        yield chunk
+
+
+def _split_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    # The ##fileformat header must precede any data line.
+    pending = b""
+    header_seen = False
+
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+
+        for raw in lines:
+            line = raw.decode("utf-8", errors="ignore")
+            if not header_seen:
+                if "##fileformat=VCF" in line:
+                    header_seen = True
+                elif line.strip() and not line.startswith("#"):
+                    raise VCFFormatError("Invalid VCF format")
+            yield line
+
+    if pending:
+        line = pending.decode("utf-8", errors="ignore")
+        if not header_seen and "##fileformat=VCF" in line:
+            header_seen = True
+        if header_seen:
+            yield line
+
+    if not header_seen:
+        raise VCFFormatError("Invalid VCF format")
+
+
+def iter_vcf_lines(stream: BinaryIO, max_bytes: Optional[int] = None,
+                   chunk_size: int = CHUNK_SIZE, hasher=None) -> Iterator[str]:
+    # Plain or gzip/bgzip input, decompressed on the fly without an index.
+    compressed = is_gzipped(stream)
+    if max_bytes is None:
+        max_bytes = MAX_COMPRESSED_VCF_BYTES if compressed else MAX_VCF_BYTES
+
+    chunks = _read_chunks(stream, max_bytes, chunk_size, hasher)
+    if compressed:
+        chunks = inflate_stream(chunks)
+
+    try:
+        yield from _split_lines(chunks)
+    except Exception as e:
+        if isinstance(e, VCFFormatError):
+            raise
+        raise VCFFormatError("Corrupt compressed VCF") from e
+
+
+def iter_indexed_lines(stream: BinaryIO, index_bytes: bytes,
+                       genes: Iterable[str] = TARGET_GENES) -> Iterator[str]:
+    # Seek straight to the pharmacogene windows of a bgzipped VCF, inflating
+    # only the BGZF blocks the tabix/CSI index points at.
+    stream.seek(0, os.SEEK_END)
+    if stream.tell() > MAX_COMPRESSED_VCF_BYTES:
+        raise _size_error(MAX_COMPRESSED_VCF_BYTES)
+    stream.seek(0)
+
+    reader = BGZFReader(stream)
+
+    try:
+        header_seen = False
+        contigs = []
+        header = []
+        for raw in reader.iter_lines(0):
+            line = raw.decode("utf-8", errors="ignore")
+            if not line.startswith("#"):
+                break
+            header.append(line)
+            if "##fileformat=VCF" in line:
+                header_seen = True
+            elif line.startswith("##contig=<ID="):
+                contigs.append(line[13:].split(",", 1)[0].rstrip(">"))
+
+        if not header_seen:
+            raise VCFFormatError("Invalid VCF format")
+
+        # An unreadable index costs the seek, not the upload: fall back to
+        # the full streamed parse before any line has gone downstream
+        try:
+            index = parse_index(index_bytes, contigs)
+        except IndexFormatError as e:
+            print("INDEX ERROR:", e)
+            stream.seek(0)
+            yield from iter_vcf_lines(stream)
+            return
+
+        # Header lines go downstream too (the #CHROM line names the samples)
+        yield from header
+
+        windows = {}
+        chunks = []
+        for chrom, start, end, _gene in target_regions(genes):
+            windows.setdefault(chrom, []).append((start, end))
+            for name in (chrom, "chr" + chrom):
+                chunks.extend(index.chunks(name, start, end))
+
+        for beg, end in merge_chunks(chunks):
+            for raw in reader.read_range(beg, end).split(b"\n"):
+                columns = raw.split(None, 2)
+                if len(columns) < 3 or not columns[1].isdigit():
+                    continue
+                chrom = normalize_chrom(columns[0].decode("utf-8", errors="ignore"))
+                pos = int(columns[1])
+                if any(start <= pos <= end for start, end in windows.get(chrom, ())):
+                    yield raw.decode("utf-8", errors="ignore")
+
+    except IndexFormatError as e:
+        raise VCFFormatError(str(e)) from e
+    except (OSError, EOFError, zlib.error, struct.error) as e:
+        raise VCFFormatError("Corrupt compressed VCF") from e
+
+
+# ==============================
+# GENOTYPE (GT) DECODING
+# ==============================
+# A call is reduced to its alt-allele dosage: 0 hom-ref, 1 het, 2 hom-alt,
+# -1 missing. Any non-reference allele counts, so on multi-allelic sites
+# the dosage covers all ALTs.
+MISSING_DOSAGE = -1
+_GT_DOSAGE: Dict[str, int] = {}
+
+
+def gt_dosage(gt: str) -> int:
+    dosage = _GT_DOSAGE.get(gt)
+    if dosage is None:
+        alleles = gt.replace("|", "/").split("/")
+        if any(a in (".", "") for a in alleles):
+            dosage = MISSING_DOSAGE
+        else:
+            dosage = min(2, sum(a != "0" for a in alleles))
+        # Only a handful of distinct GT strings exist in practice
+        if len(_GT_DOSAGE) < 4096:
+            _GT_DOSAGE[gt] = dosage
+    return dosage
+
+
+def sample_dosages(format_field: str, samples: List[str]) -> List[int]:
+    keys = format_field.split(":")
+    if "GT" not in keys:
+        return [MISSING_DOSAGE] * len(samples)
+
+    gt_index = keys.index("GT")
+    if gt_index == 0:
+        return [gt_dosage(s.split(":", 1)[0]) for s in samples]
+
+    dosages = []
+    for s in samples:
+        parts = s.split(":")
+        dosages.append(gt_dosage(parts[gt_index]) if gt_index < len(parts) else MISSING_DOSAGE)
+    return dosages
+
+
+# ==============================
+# VARIANT RECORDS
+# ==============================
+class Variant(NamedTuple):
+    # gene/star/chromosome are interned, so a large file holds one copy of
+    # each distinct value; dosage is None when the record has no GT.
+    # position is kept as an int in memory but reported as a string.
+    rsid: str
+    gene: str
+    star: Optional[str]
+    chromosome: str
+    position: int
+    dosage: Optional[int] = None
+
+    def detected(self) -> Dict:
+        # detected_variants entry in the response
+        return {
+            "rsid": self.rsid,
+            "gene": self.gene,
+            "chromosome": self.chromosome,
+            "position": str(self.position)
+        }
+
+
+class VariantCalls:
+    """Pharmacogene variants of one file, bucketed by gene as they're parsed."""
+
+    __slots__ = ("by_gene", "count")
+
+    def __init__(self):
+        self.by_gene: Dict[str, List[Variant]] = {}
+        self.count = 0
+
+    def add(self, variant: Variant):
+        bucket = self.by_gene.get(variant.gene)
+        if bucket is None:
+            bucket = self.by_gene[variant.gene] = []
+        bucket.append(variant)
+        self.count += 1
+
+    def gene(self, gene: str) -> List[Variant]:
+        return self.by_gene.get(gene, [])
+
+    def __len__(self):
+        return self.count
 
+    def __iter__(self) -> Iterator[Variant]:
+        for bucket in self.by_gene.values():
+            yield from bucket
+
+
+_intern = sys.intern
+
+
+def parse_vcf_line(line: str, index: Optional[AnnotationIndex] = None) -> Optional[Variant]:
+    if not line or line[0] == "#":
+        return None
+
+    # split by ANY whitespace (more robust than \t); CHROM/POS first so that
+    # records outside the pharmacogene windows cost one split and a bisect
+    head = line.split(None, 2)
+    if len(head) < 3:
+        return None
+
+    chrom, pos, rest = head
+
+    if index is None:
+        index = get_annotation_index()
+
+    # Malformed POS: skipped like any other broken record
+    if not pos.isdigit():
+        return None
+
+    chrom_key = normalize_chrom(chrom)
+    position = int(pos)
+    in_window = index.gene_at(chrom_key, position) is not None
+
+    # Records outside every pharmacogene window are dropped before the rest
+    # of the line or INFO is touched, unless their rsID defines a star allele.
+    if not in_window and rest.split(None, 1)[0] not in index.by_rsid:
+        return None
+
+    columns = rest.split(None, 6)
+    if len(columns) < 6:
+        return None
+
+    rsid, ref, alt, qual, flt, info = columns[:6]
+    samples = columns[6] if len(columns) > 6 else None
+
+    if not in_window:
+        gene, star = index.by_rsid[rsid]
+    else:
         info_dict = {}
 
         # parse INFO safely
@@ -43,14 +314,127 @@ async def parse_vcf(upload_file) -> List[Dict]:
 
         gene = info_dict.get("GENE")
         star = info_dict.get("STAR")
+        if gene:
+            gene = _intern(gene)
+        if star:
+            star = _intern(star)
+
+        # Unannotated caller output: resolve gene/star from the allele index
+        if not gene or not star:
+            hit = index.lookup(chrom_key, position, ref, alt, rsid)
+            if hit and (not gene or gene == hit[0]):
+                gene, star = hit
+
+    if not gene or gene not in TARGET_GENES:
+        return None
+
+    # FORMAT + first sample: zygosity of the call, when the file has one
+    dosage = None
+    if samples:
+        fields = samples.split(None, 2)
+        if len(fields) >= 2:
+            dosage = sample_dosages(fields[0], fields[1:2])[0]
+
+    return Variant(rsid, gene, star, _intern(chrom), position, dosage)
+
+
+def _iter_lines(stream: BinaryIO, index_bytes: Optional[bytes], hasher=None,
+                max_bytes: Optional[int] = None) -> Iterator[str]:
+    if index_bytes is not None:
+        if not is_gzipped(stream):
+            raise VCFFormatError("Index files require a bgzip-compressed VCF")
+        return iter_indexed_lines(stream, index_bytes)
+    return iter_vcf_lines(stream, max_bytes, hasher=hasher)
+
+
+def iter_variants(stream: BinaryIO, index_bytes: Optional[bytes] = None, hasher=None) -> Iterator[Variant]:
+    lines = _iter_lines(stream, index_bytes, hasher)
+
+    annotation_index = get_annotation_index()
+    for line in lines:
+        variant = parse_vcf_line(line, annotation_index)
+        if variant is not None:
+            yield variant
+
+
+def read_variants(stream: BinaryIO, index_bytes: Optional[bytes] = None, hasher=None) -> VariantCalls:
+    calls = VariantCalls()
+    for variant in iter_variants(stream, index_bytes, hasher):
+        calls.add(variant)
+    return calls
+
+
+class CohortGenotypes:
+    """Columnar genotypes of a multi-sample VCF, grouped by gene.
+
+    ``sites[gene]`` lists the pharmacogene records (Variants without a
+    per-sample dosage) and ``genotypes[gene]``
+    is an int8 matrix of shape (samples, sites) holding alt-allele dosages.
+    """
+
+    def __init__(self, samples: List[str], sites: Dict[str, List[Variant]], genotypes: Dict):
+        self.samples = samples
+        self.sites = sites
+        self.genotypes = genotypes
+
+
+def read_cohort(stream: BinaryIO, index_bytes: Optional[bytes] = None, hasher=None,
+                max_bytes: Optional[int] = None) -> CohortGenotypes:
+    import numpy as np
+
+    annotation_index = get_annotation_index()
+    samples: List[str] = []
+    sites: Dict[str, List[Variant]] = {}
+    columns: Dict[str, List] = {}
+
+    for line in _iter_lines(stream, index_bytes, hasher, max_bytes):
+        if line.startswith("#CHROM"):
+            samples = line.split()[9:]
+            continue
+
+        variant = parse_vcf_line(line, annotation_index)
+        if variant is None:
+            continue
+
+        variant = variant._replace(dosage=None)
+        fields = line.split()
+        if samples and len(fields) >= 9 + len(samples):
+            dosages = sample_dosages(fields[8], fields[9:9 + len(samples)])
+        else:
+            dosages = [MISSING_DOSAGE] * len(samples)
+
+        gene = variant.gene
+        sites.setdefault(gene, []).append(variant)
+        columns.setdefault(gene, []).append(np.array(dosages, dtype=np.int8))
+
+    genotypes = {
+        gene: np.stack(cols, axis=1) if samples else np.zeros((0, len(cols)), dtype=np.int8)
+        for gene, cols in columns.items()
+    }
+    return CohortGenotypes(samples, sites, genotypes)
+
+
+async def _read_index(index_file) -> Optional[bytes]:
+    if index_file is None:
+        return None
+    index_bytes = await index_file.read(MAX_INDEX_BYTES + 1)
+    if len(index_bytes) > MAX_INDEX_BYTES:
+        raise VCFFormatError("Index file exceeds 64MB limit")
+    return index_bytes
+
+
+async def parse_vcf(upload_file, index_file=None, hasher=None) -> VariantCalls:
+    # hasher (e.g. hashlib.sha256()) is fed the whole upload as it streams;
+    # indexed reads skip most of the file, so it is left untouched then.
+    index_bytes = await _read_index(index_file)
+
+    # Single streaming pass over the spooled upload; runs off the event loop
+    # because large spooled files are read from disk.
+    upload_file.file.seek(0)
+    return await asyncio.to_thread(read_variants, upload_file.file, index_bytes, hasher)
 
-        if gene and gene in TARGET_GENES:
-            variants.append({
-                "rsid": rsid,
-                "gene": gene,
-                "star": star,
-                "chromosome": chrom,
-                "position": pos
-            })
 
-    return variants
+async def parse_cohort(upload_file, index_file=None) -> CohortGenotypes:
+    index_bytes = await _read_index(index_file)
+    upload_file.file.seek(0)
+    return await asyncio.to_thread(read_cohort, upload_file.file, index_bytes)
@@ -0,0 +1,59 @@
+from typing import Dict
+import io
+import os
+import time
+
+# Run at startup so the first request doesn't pay for building lookup
+# tables or importing numpy. Everything here is also built lazily on first
+# use, so turning warm-up off only moves the cost.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_WARMUP_VCF = (
+    b"##fileformat=VCFv4.2\n"
+    b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE\n"
+    b"22\t42128945\trs3892097\tC\tT\t.\tPASS\t.\tGT\t0/1\n"
+)
+
+# phase -> seconds, reported on /metrics
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+
+def _timed(name: str, fn):
+    start = time.perf_counter()
+    fn()
+    STARTUP_TIMINGS[f"warmup_{name}"] = time.perf_counter() - start
+
+
+def _decision_tables():
+    from app.knowledge_base import current_knowledge_base
+
+    # Loads (or compiles) the knowledge base snapshot and maps its tables
+    table = current_knowledge_base().table
+    for gene in table.genes:
+        table.phenotype_matrix(gene)
+    for drug in table.drugs:
+        table.risk_vector(drug)
+
+
+def _parser():
+    from app.analysis import analyze_drugs
+    from app.vcf_parser import read_variants
+
+    analyze_drugs(read_variants(io.BytesIO(_WARMUP_VCF)), ["CODEINE"])
+
+
+def _password_context():
+    from app.auth import get_pwd_context
+
+    get_pwd_context()
+
+
+def warm_up():
+    from app.annotation import get_annotation_index
+
+    start = time.perf_counter()
+    _timed("annotation_index", get_annotation_index)
+    _timed("decision_tables", _decision_tables)
+    _timed("parser", _parser)
+    _timed("password_context", _password_context)
+    STARTUP_TIMINGS["warmup"] = time.perf_counter() - start
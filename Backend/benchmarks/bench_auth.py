@@ -0,0 +1,96 @@
+"""Login throughput and event-loop stall benchmark.
+
+Runs N logins at a given concurrency against the login path of app/auth.py
+(password verification + token issue), once with bcrypt on the event loop
+and once through the bounded hashing executor, while a probe task measures
+how late the loop wakes it up.
+
+    cd Backend
+    python -m benchmarks.bench_auth --logins 200 --concurrency 32 --rounds 12
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor")
+    parser.add_argument("--workers", type=int, default=None, help="hashing threads")
+    parser.add_argument("--probe-ms", type=float, default=5.0, help="loop probe interval")
+    return parser.parse_args()
+
+
+async def probe(interval: float, lags: list, stop: asyncio.Event):
+    # Sleeps `interval` repeatedly; any extra delay is time the loop was busy
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run(mode: str, args, auth) -> dict:
+    hashed = auth.get_password_hash("correct horse battery staple")
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def login():
+        async with semaphore:
+            if mode == "inline":
+                ok = auth.verify_password("correct horse battery staple", hashed)
+            else:
+                ok = await auth.verify_password_async("correct horse battery staple", hashed)
+            assert ok
+            auth._issue_token("bench@example.com")
+
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(args.probe_ms / 1000, lags, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "mode": mode,
+        "logins": args.logins,
+        "elapsed_seconds": round(elapsed, 3),
+        "logins_per_second": round(args.logins / elapsed, 2),
+        "loop_stall_ms": {
+            "mean": round(statistics.fmean(lags_ms), 2),
+            "p99": round(lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))], 2),
+            "max": round(lags_ms[-1], 2)
+        }
+    }
+
+
+def main():
+    args = parse_args()
+    # Settings are read at import, so they must be in place first
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.workers:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import auth
+
+    results = [asyncio.run(run(mode, args, auth)) for mode in ("inline", "executor")]
+    print(json.dumps({
+        "benchmark": "auth_login",
+        "bcrypt_rounds": auth.BCRYPT_ROUNDS,
+        "hash_workers": auth.PASSWORD_HASH_WORKERS,
+        "concurrency": args.concurrency,
+        "results": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Offline benchmarks for the analysis pipeline.
+
+Generates synthetic VCFs (see synth_vcf.py) and times, in-process:
+  parse      read_variants over the whole file
+  phenotype  infer_diplotype + infer_phenotype for each pharmacogene
+  risk       knowledge base risk lookup for every drug and phenotype
+  analyze    the full POST /analyze route with the LLM stubbed out
+
+Each benchmark runs in a fresh process and reports throughput, p50/p95/p99
+latency and that process's peak RSS (imports included), so one stage's
+memory isn't hidden behind an earlier stage's high-water mark. The run is
+printed and optionally saved as JSON so releases can be compared.
+
+    cd Backend
+    python -m benchmarks.bench_pipeline --records 10000,100000,1000000 --output bench.json
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Every /analyze iteration must do the full work, and nothing is persisted
+os.environ["RESULT_CACHE_SIZE"] = "0"
+os.environ.pop("MONGODB_URL", None)
+os.environ["AUTH_REQUIRED"] = "false"
+
+from benchmarks.synth_vcf import COMPRESSIONS, write_vcf  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS. It is the high-water mark of
+    # the whole process, hence one process per benchmark (see isolated).
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _init_benchmark_process():
+    from app import vcf_parser
+
+    # Offline runs are not bound by the upload limit for plain-text VCFs
+    vcf_parser.MAX_VCF_BYTES = vcf_parser.MAX_COMPRESSED_VCF_BYTES
+
+
+def isolated(fn: Callable[..., Dict], *args) -> Dict:
+    # Spawned, not forked, so the child starts without the parent's memory
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context, initializer=_init_benchmark_process) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn: Callable[[], int], repeat: int, warmup: int = 1) -> Dict:
+    """Run fn `repeat` times; fn returns the number of items it processed."""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items += fn()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": repeat,
+        "items_per_second": round(items / total, 2) if total else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(timings) * 1000, 4),
+            "p50": round(percentile(timings, 0.50) * 1000, 4),
+            "p95": round(percentile(timings, 0.95) * 1000, 4),
+            "p99": round(percentile(timings, 0.99) * 1000, 4),
+            "max": round(timings[-1] * 1000, 4)
+        },
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+# ==============================
+# BENCHMARKS
+# ==============================
+def bench_parse(path: str, records: int, repeat: int) -> Dict:
+    from app.vcf_parser import read_variants
+
+    def run():
+        with open(path, "rb") as f:
+            read_variants(f)
+        return records
+
+    # items_per_second is VCF records per second here
+    result = measure(run, repeat)
+    with open(path, "rb") as f:
+        result["variants"] = len(read_variants(f))
+    result["mb_per_second"] = round(
+        os.path.getsize(path) / (1024 * 1024) * result["items_per_second"] / records, 2
+    )
+    return result
+
+
+def bench_phenotype(path: str, calls: int) -> Dict:
+    from app.knowledge_base import current_knowledge_base
+    from app.phenotype_engine import infer_diplotype
+    from app.vcf_parser import read_variants
+
+    with open(path, "rb") as f:
+        variants = read_variants(f)
+    table = current_knowledge_base().table
+
+    def run():
+        for gene in table.genes:
+            table.phenotype_for(gene, infer_diplotype(variants, gene))
+        return len(table.genes)
+
+    return measure(run, calls)
+
+
+def bench_risk(calls: int) -> Dict:
+    from app.knowledge_base import current_knowledge_base
+
+    table = current_knowledge_base().table
+    pairs = [(d, p) for d in table.drugs for p in ("PM", "IM", "NM", "UM", "Indeterminate")]
+
+    def run():
+        for drug, phenotype in pairs:
+            table.risk_for(drug, phenotype)
+        return len(pairs)
+
+    return measure(run, calls)
+
+
+def bench_analyze(path: str, repeat: int, drugs: str) -> Dict:
+    from fastapi.testclient import TestClient
+
+    from app import main
+    from app.llm_engine import fallback_explanation
+
+    async def stub_explanations(results):
+        return [
+            fallback_explanation(r["gene"], r["phenotype"], r["drug"], "LLM stubbed for benchmarks.")
+            for r in results
+        ]
+
+    main.safe_generate_explanations = stub_explanations
+    # No `with`: startup hooks (database, warm-up) are not part of the timing
+    client = TestClient(main.app)
+
+    with open(path, "rb") as f:
+        payload = f.read()
+    filename = os.path.basename(path)
+
+    def run():
+        response = client.post(
+            "/analyze",
+            data={"drug": drugs, "multi_drug": "true"},
+            files={"vcf_file": (filename, payload)}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"/analyze returned {response.status_code}: {response.text[:200]}")
+        return 1
+
+    return measure(run, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", default="10000,100000",
+                        help="comma-separated record counts, one synthetic file each")
+    parser.add_argument("--pgx-density", type=float, default=0.01)
+    parser.add_argument("--samples", type=int, default=1)
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="gzip")
+    parser.add_argument("--repeat", type=int, default=5, help="iterations for parse and analyze")
+    parser.add_argument("--calls", type=int, default=2000, help="iterations for phenotype and risk")
+    parser.add_argument("--drugs", default="CODEINE,CLOPIDOGREL,WARFARIN,SIMVASTATIN")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "risk": isolated(bench_risk, args.calls),
+        "files": []
+    }
+
+    suffix = {"none": ".vcf", "gzip": ".vcf.gz", "bgzf": ".vcf.gz"}[args.compression]
+    with tempfile.TemporaryDirectory(prefix="pgx_bench_") as workdir:
+        for records in (int(r) for r in args.records.split(",")):
+            path = os.path.join(workdir, f"synthetic_{records}{suffix}")
+            start = time.perf_counter()
+            size = write_vcf(path, records, args.pgx_density, args.samples, args.compression, args.seed)
+            print(f"generated {records} records ({size} bytes) in {time.perf_counter() - start:.1f}s",
+                  file=sys.stderr)
+
+            report["files"].append({
+                "records": records,
+                "bytes": size,
+                "parse": isolated(bench_parse, path, records, args.repeat),
+                "phenotype": isolated(bench_phenotype, path, args.calls),
+                "analyze": isolated(bench_analyze, path, args.repeat, args.drugs)
+            })
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
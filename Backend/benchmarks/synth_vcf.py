@@ -0,0 +1,205 @@
+"""Synthetic VCF generator for benchmarks.
+
+Writes a coordinate-sorted GRCh38 VCF with a configurable number of
+records, fraction of records inside pharmacogene windows, sample count and
+compression (none, gzip or BGZF). Every star-allele site from
+app/data/allele_definitions.tsv is included once, so files always exercise
+the annotation path. The same seed always produces the same file.
+
+    cd Backend
+    python -m benchmarks.synth_vcf out.vcf.gz --records 1000000 --samples 4 --compression bgzf
+"""
+import argparse
+import gzip
+import os
+import random
+import struct
+import sys
+import zlib
+from typing import BinaryIO, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.annotation import ALLELE_DEFINITIONS_PATH  # noqa: E402
+from app.gene_regions import GENE_REGIONS, REGION_PADDING  # noqa: E402
+
+CHROMOSOMES = [str(c) for c in range(1, 23)]
+# Rough GRCh38 lengths, only used to spread background records out
+CHROM_LENGTH = 150_000_000
+BASES = "ACGT"
+COMPRESSIONS = ("none", "gzip", "bgzf")
+
+# Genotype mix for each sample column: hom-ref, het, hom-alt, no-call
+GT_VALUES = ["0/0", "0/1", "1/1", "./."]
+GT_WEIGHTS = [0.70, 0.22, 0.06, 0.02]
+
+
+# ==============================
+# BGZF WRITER
+# ==============================
+BGZF_BLOCK_DATA = 0xFF00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+class BGZFWriter:
+    # Blocked gzip as written by bgzip: each block is a gzip member whose
+    # extra field records its compressed size, so readers can seek to it.
+    def __init__(self, fileobj: BinaryIO, level: int = 6):
+        self.fileobj = fileobj
+        self.level = level
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.buffer += data
+        while len(self.buffer) >= BGZF_BLOCK_DATA:
+            self._write_block(bytes(self.buffer[:BGZF_BLOCK_DATA]))
+            del self.buffer[:BGZF_BLOCK_DATA]
+
+    def _write_block(self, data: bytes):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        block_size = len(cdata) + 25 + 1
+        self.fileobj.write(
+            b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+            + struct.pack("<H", block_size - 1)
+            + cdata
+            + struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data))
+        )
+
+    def close(self):
+        if self.buffer:
+            self._write_block(bytes(self.buffer))
+            self.buffer.clear()
+        self.fileobj.write(BGZF_EOF)
+
+
+# ==============================
+# RECORD GENERATION
+# ==============================
+def load_star_sites() -> Dict[str, List[Tuple[int, str, str, str, str]]]:
+    # chrom -> [(pos, rsid, ref, alt, gene)] for GRCh38
+    sites: Dict[str, List[Tuple[int, str, str, str, str]]] = {}
+    with open(ALLELE_DEFINITIONS_PATH, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            gene, _star, rsid, build, chrom, pos, ref, alt = line.rstrip("\n").split("\t")
+            if build == "GRCh38":
+                sites.setdefault(chrom, []).append((int(pos), rsid, ref, alt, gene))
+    return sites
+
+
+def gene_windows() -> Dict[str, List[Tuple[int, int]]]:
+    windows: Dict[str, List[Tuple[int, int]]] = {}
+    for chrom, start, end in GENE_REGIONS["GRCh38"].values():
+        windows.setdefault(chrom, []).append((start - REGION_PADDING, end + REGION_PADDING))
+    return windows
+
+
+def _sample_columns(rng: random.Random, samples: int) -> str:
+    if not samples:
+        return ""
+    return "\tGT\t" + "\t".join(rng.choices(GT_VALUES, GT_WEIGHTS, k=samples))
+
+
+def _record(chrom: str, pos: int, rsid: str, ref: str, alt: str, samples: str) -> str:
+    return f"{chrom}\t{pos}\t{rsid}\t{ref}\t{alt}\t50\tPASS\t.{samples}\n"
+
+
+def generate_lines(records: int, pgx_density: float, samples: int, seed: int):
+    rng = random.Random(seed)
+    star_sites = load_star_sites()
+    windows = gene_windows()
+
+    sample_names = "".join(f"\tSAMPLE{i + 1}" for i in range(samples))
+    yield "##fileformat=VCFv4.2\n"
+    yield "##source=pharmaguard-benchmarks\n"
+    for chrom in CHROMOSOMES:
+        yield f"##contig=<ID={chrom},length={CHROM_LENGTH}>\n"
+    if samples:
+        yield '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+        header = "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO" + ("\tFORMAT" + sample_names)
+    else:
+        header = "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO"
+    yield header + "\n"
+
+    fixed_sites = sum(len(s) for s in star_sites.values())
+    remaining = max(0, records - fixed_sites)
+    window_records = int(remaining * pgx_density)
+    background_records = remaining - window_records
+
+    all_windows = [(c, s, e) for c, spans in windows.items() for s, e in spans]
+    window_total = sum(e - s for _, s, e in all_windows)
+
+    # Spread records over chromosomes, then sort positions per chromosome so
+    # only one chromosome is ever held in memory
+    for chrom in CHROMOSOMES:
+        background = background_records // len(CHROMOSOMES)
+        if chrom == CHROMOSOMES[-1]:
+            background += background_records % len(CHROMOSOMES)
+
+        positions = [rng.randrange(1, CHROM_LENGTH) for _ in range(background)]
+        for c, start, end in all_windows:
+            if c == chrom:
+                share = int(window_records * (end - start) / window_total)
+                positions += [rng.randrange(start, end) for _ in range(share)]
+
+        sites = {pos: (rsid, ref, alt) for pos, rsid, ref, alt, _gene in star_sites.get(chrom, [])}
+        positions = sorted(set(positions) - set(sites) | set(sites))
+
+        for pos in positions:
+            site = sites.get(pos)
+            if site:
+                rsid, ref, alt = site
+            else:
+                ref = rng.choice(BASES)
+                alt = BASES[(BASES.index(ref) + rng.randrange(1, 4)) % 4]
+                rsid = "."
+            yield _record(chrom, pos, rsid, ref, alt, _sample_columns(rng, samples))
+
+
+def write_vcf(path: str, records: int, pgx_density: float = 0.01, samples: int = 1,
+              compression: str = "none", seed: int = 0) -> int:
+    """Write a synthetic VCF and return its size in bytes."""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {COMPRESSIONS}")
+
+    with open(path, "wb") as raw:
+        if compression == "gzip":
+            out = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+        elif compression == "bgzf":
+            out = BGZFWriter(raw)
+        else:
+            out = raw
+
+        batch = []
+        for line in generate_lines(records, pgx_density, samples, seed):
+            batch.append(line)
+            if len(batch) >= 4096:
+                out.write("".join(batch).encode("ascii"))
+                batch.clear()
+        out.write("".join(batch).encode("ascii"))
+
+        if out is not raw:
+            out.close()
+
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--pgx-density", type=float, default=0.01,
+                        help="fraction of records placed inside pharmacogene windows")
+    parser.add_argument("--samples", type=int, default=1)
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    size = write_vcf(args.path, args.records, args.pgx_density, args.samples, args.compression, args.seed)
+    print(f"wrote {args.path} ({size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
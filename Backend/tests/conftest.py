@@ -0,0 +1,47 @@
+import os
+import sys
+from contextlib import closing
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+FIXTURES = os.path.join(BACKEND_DIR, "tests", "fixtures")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Job queue in a throwaway JOBS_DIR; yields a connection to it
+    from app import jobs
+
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "JOBS_INPUT_DIR", str(tmp_path / "inputs"))
+    monkeypatch.setattr(jobs, "JOB_CHECKPOINT_SAMPLES", 1)
+    jobs.init_store()
+    with closing(jobs.connect()) as conn:
+        yield conn
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # The API without startup hooks (no Mongo, job workers or warm-up) and
+    # with the LLM off, so explanations are the deterministic fallback
+    from fastapi.testclient import TestClient
+
+    from app import llm_engine
+    from app.explanation_cache import TTLCache
+    from app.main import app
+    from app.result_cache import result_cache
+
+    monkeypatch.setattr(llm_engine, "LLM_ENABLED", False)
+    monkeypatch.setattr(result_cache, "memory", TTLCache(64, 60))
+    return TestClient(app)
+
+
+def auth_header(email: str) -> dict:
+    from app.auth import create_access_token
+
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
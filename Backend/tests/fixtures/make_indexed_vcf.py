@@ -0,0 +1,68 @@
+"""Regenerate the bgzipped VCF and .tbi/.csi fixtures used by test_bgzf.py.
+
+Needs pysam (not an app dependency):  python tests/fixtures/make_indexed_vcf.py
+"""
+import os
+
+import pysam
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NAME = "indexed.vcf"
+
+CONTIGS = ["1", "2", "6", "10", "12", "22"]
+
+# GRCh38 star-allele sites, all inside their gene windows
+SITES = {
+    "1": [(97450058, "rs3918290", "C", "T", "GENE=DPYD;STAR=*2A", "0/1")],
+    "6": [(18130687, "rs1142345", "T", "C", "GENE=TPMT;STAR=*3C", "1/1")],
+    "10": [(94781859, "rs4244285", "G", "A", "GENE=CYP2C19;STAR=*2", "0/1"),
+           (94942290, "rs1799853", "C", "T", "GENE=CYP2C9;STAR=*2", "0/1")],
+    "12": [(21178615, "rs4149056", "T", "C", "GENE=SLCO1B1;STAR=*5", "0/1")],
+    # Unannotated: gene/star come from the allele table
+    "22": [(42128945, "rs3892097", "C", "T", ".", "0/1"),
+           (42130692, "rs1065852", "G", "A", "GENE=CYP2D6;STAR=*10", "1/1")],
+}
+
+# Unnamed filler outside every window (either build), so the file spans many
+# BGZF blocks and the windows share blocks with records that must be dropped
+FILLER = {
+    "1": range(100_000, 300_000, 50),
+    "2": range(1_000_000, 1_600_000, 100),
+    "6": range(18_000_000, 18_100_000, 50),
+    "10": list(range(94_700_000, 94_750_000, 25)) + list(range(95_000_000, 95_050_000, 25)),
+    "12": range(21_000_000, 21_100_000, 50),
+    "22": list(range(42_050_000, 42_115_000, 20)) + list(range(42_145_000, 42_200_000, 20)),
+}
+
+
+def records():
+    for chrom in CONTIGS:
+        rows = [(pos, ".", "A", "G", ".", "0/1") for pos in FILLER.get(chrom, ())]
+        rows += SITES.get(chrom, [])
+        for pos, rsid, ref, alt, info, gt in sorted(rows):
+            yield f"{chrom}\t{pos}\t{rsid}\t{ref}\t{alt}\t50\tPASS\t{info}\tGT\t{gt}\n"
+
+
+def main():
+    plain = os.path.join(HERE, NAME)
+    with open(plain, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        for chrom in CONTIGS:
+            f.write(f"##contig=<ID={chrom},assembly=GRCh38>\n")
+        f.write('##INFO=<ID=GENE,Number=1,Type=String,Description="Gene">\n')
+        f.write('##INFO=<ID=STAR,Number=1,Type=String,Description="Star allele">\n')
+        f.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE1\n")
+        f.writelines(records())
+
+    bgz = plain + ".gz"
+    pysam.tabix_compress(plain, bgz, force=True)
+    os.remove(plain)
+
+    # Tabix .tbi and a tabix-style .csi (contig names in the aux block)
+    pysam.tabix_index(bgz, preset="vcf", force=True, keep_original=True)
+    pysam.tabix_index(bgz, preset="vcf", force=True, keep_original=True, csi=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app import admission
+from app.admission import AdmissionController, AdmissionMiddleware, AdmissionRejected
+
+
+def _controller(**overrides):
+    options = {"max_concurrent": 2, "max_buffered_bytes": 100, "max_queued": 4, "queue_timeout": 1.0}
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_waiters_are_admitted_in_order_as_slots_free():
+    async def run():
+        controller = _controller(max_concurrent=1)
+        await controller.acquire(10)
+        order = []
+
+        async def waiter(name):
+            await controller.acquire(10)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(waiter(n)) for n in "abc"]
+        await asyncio.sleep(0)
+        assert (controller.active, controller.queued) == (1, 3)
+        for _ in range(3):
+            controller.release(10)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["a", "b", "c"]
+    assert (stats["active"], stats["queued"], stats["admitted"]) == (1, 0, 4)
+
+
+def test_byte_budget_is_fifo_and_a_leaving_waiter_unblocks_the_rest():
+    async def run():
+        controller = _controller(max_buffered_bytes=100)
+        await controller.acquire(60)
+        big = asyncio.ensure_future(controller.acquire(80))
+        await asyncio.sleep(0)
+        # Fits the budget, but may not jump ahead of the big upload
+        small = asyncio.ensure_future(controller.acquire(30))
+        await asyncio.sleep(0)
+        assert not small.done()
+
+        big.cancel()
+        await asyncio.sleep(0)
+        await small
+        return controller.buffered_bytes, controller.queued
+
+    assert asyncio.run(run()) == (90, 0)
+
+
+def test_rejections():
+    async def run():
+        controller = _controller(max_concurrent=1, max_queued=1, queue_timeout=0.05)
+        errors = []
+        try:
+            await controller.acquire(1000)
+        except AdmissionRejected as e:
+            errors.append((e.status_code, e.reason))
+
+        await controller.acquire(10)
+        waiting = asyncio.ensure_future(controller.acquire(10))
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire(10)
+        except AdmissionRejected as e:
+            errors.append((e.status_code, e.reason))
+        try:
+            await waiting
+        except AdmissionRejected as e:
+            errors.append((e.status_code, e.reason))
+        return errors, controller.stats()
+
+    errors, stats = asyncio.run(run())
+    assert errors == [(413, "too_large"), (429, "queue_full"), (429, "timeout")]
+    assert stats["queued"] == 0 and stats["active"] == 1
+    assert stats["rejected"] == {"too_large": 1, "queue_full": 1, "timeout": 1}
+
+
+def test_retry_after_tracks_hold_times():
+    controller = _controller(max_concurrent=2)
+    assert controller.retry_after() == admission.ADMISSION_RETRY_AFTER_SECONDS
+    controller._admit(1)
+    controller._admit(1)
+    controller.release(1, held_seconds=10)
+    controller.release(1, held_seconds=20)
+    # 0.8 * 10 + 0.2 * 20
+    assert controller._hold_seconds == pytest.approx(12)
+    controller._admit(1)
+    controller._admit(1)
+    assert controller.retry_after() == 12
+
+
+# ==============================
+# MIDDLEWARE
+# ==============================
+@pytest.fixture
+def upload_app(monkeypatch):
+    monkeypatch.setitem(admission.ADMITTED_PATHS, "/upload", 50)
+    controller = _controller(max_concurrent=1, max_queued=0, max_buffered_bytes=1000)
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        body = await request.body()
+        return {"bytes": len(body), "active": controller.active}
+
+    @app.post("/other")
+    async def other():
+        return {"active": controller.active}
+
+    return TestClient(app), controller
+
+
+def test_middleware_holds_a_slot_for_the_request(upload_app):
+    client, controller = upload_app
+    response = client.post("/upload", content=b"x" * 20)
+    assert response.json() == {"bytes": 20, "active": 1}
+    assert controller.stats()["active"] == 0 and controller.buffered_bytes == 0
+    assert client.post("/other", content=b"x" * 500).json() == {"active": 0}
+
+
+def test_middleware_rejects_before_reading_the_body(upload_app):
+    client, controller = upload_app
+    assert client.post("/upload", content=b"x" * 51).status_code == 413
+
+    def chunks():
+        yield b"x"
+
+    assert client.post("/upload", content=chunks()).status_code == 411
+
+    controller._admit(0)
+    busy = client.post("/upload", content=b"x")
+    assert busy.status_code == 429
+    assert busy.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
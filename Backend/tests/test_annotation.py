@@ -0,0 +1,50 @@
+import pytest
+
+from app.annotation import get_annotation_index
+from app.vcf_parser import parse_vcf_line
+
+
+@pytest.fixture(scope="module")
+def index():
+    return get_annotation_index()
+
+
+def test_gene_windows_cover_both_builds(index):
+    assert index.gene_at("22", 42128945) == "CYP2D6"
+    assert index.gene_at("22", 42524947) == "CYP2D6"
+    # Padding keeps flanking alleles inside the window
+    assert index.gene_at("10", 94762681 - 5000) == "CYP2C19"
+    assert index.gene_at("10", 1) is None
+    assert index.gene_at("X", 42128945) is None
+
+
+def test_lookup_by_allele_then_rsid(index):
+    assert index.lookup("10", 94781859, "g", "a", ".") == ("CYP2C19", "*2")
+    assert index.lookup("10", 96541616, "G", "C,A", ".") == ("CYP2C19", "*2")
+    # Wrong allele at the site: only the rsID can still identify it
+    assert index.lookup("10", 94781859, "G", "T", ".") is None
+    assert index.lookup("10", 94781859, "G", "T", "rs4244285") == ("CYP2C19", "*2")
+
+
+@pytest.mark.parametrize("line", [
+    "chr22\t42128945\t.\tC\tT\t50\tPASS\t.",
+    "22\t42524947\trs3892097\tC\tT\t50\tPASS\tDP=12",
+    "22 42128945 . C T 50 PASS .",
+])
+def test_unannotated_records_are_resolved(line):
+    variant = parse_vcf_line(line)
+    assert (variant.gene, variant.star) == ("CYP2D6", "*4")
+
+
+def test_info_annotation_wins_over_the_table():
+    variant = parse_vcf_line("22\t42128945\trs3892097\tC\tT\t50\tPASS\tGENE=CYP2D6;STAR=*4M")
+    assert variant.star == "*4M"
+
+
+def test_records_outside_windows():
+    # Kept only when the rsID defines an allele
+    variant = parse_vcf_line("22\t1000\trs3892097\tC\tT\t50\tPASS\t.")
+    assert (variant.gene, variant.star, variant.position) == ("CYP2D6", "*4", 1000)
+    assert parse_vcf_line("22\t1000\trs1\tC\tT\t50\tPASS\tGENE=CYP2D6;STAR=*4") is None
+    assert parse_vcf_line("22\t42128945\t.\tC\tG\t50\tPASS\t.") is None
+    assert parse_vcf_line("22\tPOS\t.\tC\tT\t50\tPASS\t.") is None
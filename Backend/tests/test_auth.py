@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth
+from app.auth import TokenCache, create_access_token, decode_token
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\n"
+)
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    cache = TokenCache(maxsize=2, ttl=300)
+    monkeypatch.setattr(auth, "token_cache", cache)
+    return cache
+
+
+def _analyze(client, headers=None):
+    return client.post(
+        "/analyze", data={"drug": "CLOPIDOGREL"}, files={"vcf_file": ("p.vcf", VCF)}, headers=headers or {}
+    )
+
+
+def test_decoded_tokens_are_cached(tokens):
+    token = create_access_token({"sub": "alice@example.com"}, timedelta(minutes=5))
+    assert decode_token(token)["sub"] == "alice@example.com"
+    assert decode_token(token)["sub"] == "alice@example.com"
+    assert (tokens.hits, tokens.misses) == (1, 1)
+    # Never cached past the token's own expiry
+    (expires_at, claims), = tokens._data.values()
+    assert expires_at == claims["exp"]
+
+
+@pytest.mark.parametrize("token", [
+    "not-a-jwt",
+    create_access_token({"sub": "alice@example.com"}, timedelta(minutes=-1)),
+    create_access_token({"role": "admin"}),
+    create_access_token({"sub": "alice@example.com"}).replace(".", "x.", 1),
+])
+def test_bad_tokens_are_rejected(tokens, token):
+    with pytest.raises(HTTPException) as e:
+        decode_token(token)
+    assert e.value.status_code == 401
+    assert tokens.failures == 1 and not tokens._data
+
+
+def test_analyze_requires_a_token_by_default(client, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_REQUIRED", True)
+    assert _analyze(client).status_code == 401
+    assert _analyze(client, {"Authorization": "Bearer nope"}).status_code == 401
+    assert _analyze(client, auth_header("alice@example.com")).status_code == 200
+
+    monkeypatch.setattr(auth, "AUTH_REQUIRED", False)
+    assert _analyze(client).status_code == 200
+    # A bad token is still rejected when anonymous access is allowed
+    assert _analyze(client, {"Authorization": "Bearer nope"}).status_code == 401
+
+
+@pytest.mark.parametrize("path, found", [
+    ("/explanations/missing", 404), ("/jobs/missing", 404), ("/knowledge-base", 200)
+])
+def test_account_routes_always_need_a_token(client, store, monkeypatch, path, found):
+    monkeypatch.setattr(auth, "AUTH_REQUIRED", False)
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=auth_header("alice@example.com")).status_code == found
+
+
+def test_mock_login_issues_a_usable_token(client, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_REQUIRED", True)
+    account = {"email": "alice@example.com", "password": "pw"}
+    # No user store and no dev flag: no tokens for unchecked passwords
+    assert client.post("/auth/login", json=account).status_code == 503
+    assert client.post("/auth/signup", json=account).status_code == 503
+
+    monkeypatch.setattr(auth, "AUTH_MOCK_LOGIN", True)
+    response = client.post("/auth/login", json=account)
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    assert decode_token(token)["sub"] == "alice@example.com"
+    assert _analyze(client, {"Authorization": f"Bearer {token}"}).status_code == 200
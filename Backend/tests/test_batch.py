@@ -0,0 +1,122 @@
+import io
+import tarfile
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from app import batch
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT\t1/1\n"
+)
+HEADERS = auth_header("alice@example.com")
+
+
+def _tar(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+def test_archive_keeps_only_vcf_members_by_basename(tmp_path):
+    archive = _tar([("../../etc/a.vcf", VCF), ("notes.txt", b"x"), ("run/b.vcf.gz", b"gz")])
+    sources = batch._extract_archive(archive, str(tmp_path))
+    assert [name for name, _ in sources] == ["../../etc/a.vcf", "run/b.vcf.gz"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a0_a.vcf", "a2_b.vcf.gz"]
+    assert (tmp_path / "a0_a.vcf").read_bytes() == VCF
+
+
+def test_archive_size_caps(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "MAX_COMPRESSED_VCF_BYTES", 100)
+    with pytest.raises(HTTPException) as e:
+        batch._extract_archive(_tar([("big.vcf", b"x" * 101)]), str(tmp_path))
+    assert e.value.status_code == 413
+
+    monkeypatch.setattr(batch, "BATCH_MAX_ARCHIVE_BYTES", 150)
+    with pytest.raises(HTTPException) as e:
+        batch._extract_archive(_tar([("a.vcf", b"x" * 100), ("b.vcf", b"x" * 60)]), str(tmp_path))
+    assert e.value.status_code == 413
+
+    with pytest.raises(HTTPException) as e:
+        batch._extract_archive(io.BytesIO(b"not a tar"), str(tmp_path))
+    assert e.value.status_code == 400
+
+
+def test_copy_limited_counts_bytes_written():
+    out = io.BytesIO()
+    assert batch._copy_limited(io.BytesIO(b"x" * 10), out, 10) == 10
+    with pytest.raises(HTTPException):
+        batch._copy_limited(io.BytesIO(b"x" * 11), io.BytesIO(), 10)
+
+
+def test_directory_input_stays_under_the_local_root(tmp_path, monkeypatch):
+    with pytest.raises(HTTPException):
+        batch._list_directory("run")
+
+    root = tmp_path / "root"
+    (root / "run").mkdir(parents=True)
+    (root / "run" / "b.vcf").write_bytes(VCF)
+    (root / "run" / "a.vcf.gz").write_bytes(b"")
+    (root / "run" / "readme.txt").write_bytes(b"")
+    (tmp_path / "outside").mkdir()
+    monkeypatch.setattr(batch, "BATCH_LOCAL_ROOT", str(root))
+
+    assert [name for name, _ in batch._list_directory("run")] == ["a.vcf.gz", "b.vcf"]
+    for directory in ("../outside", str(tmp_path / "outside"), "missing"):
+        with pytest.raises(HTTPException):
+            batch._list_directory(directory)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # The real spawn pool, kept small; torn down so no workers outlive the test
+    monkeypatch.setattr(batch, "BATCH_WORKERS", 1)
+    monkeypatch.setattr(batch, "BATCH_MAX_IN_FLIGHT", 1)
+    batch.shutdown_executor()
+    yield
+    batch.shutdown_executor()
+
+
+def test_batch_streams_one_line_per_file(client, pool):
+    files = [
+        ("vcf_files", ("p1.vcf", VCF)),
+        ("vcf_files", ("empty.vcf", b"##fileformat=VCFv4.2\n")),
+    ]
+    response = client.post(
+        "/analyze/batch", headers=HEADERS, files=files,
+        data={"drug": "clopidogrel"}
+    )
+    assert response.status_code == 200
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    by_file = {line["file"]: line for line in lines}
+    assert by_file["empty.vcf"]["status"] == "error"
+    assert by_file["p1.vcf"]["status"] == "ok"
+    assessment = by_file["p1.vcf"]["assessments"][0]
+    assert assessment["patient_id"] == "p1.vcf"
+    assert assessment["pharmacogenomic_profile"]["phenotype"] == "PM"
+
+    status = client.get(f"/analyze/batch/{response.headers['X-Batch-ID']}", headers=HEADERS).json()
+    assert (status["status"], status["total"], status["completed"], status["failed"]) == ("finished", 2, 1, 1)
+
+
+def test_batch_rejects_bad_input_up_front(client):
+    def post(**data):
+        return client.post("/analyze/batch", headers=HEADERS, data=data)
+
+    assert post(drug="nosuchdrug", directory="x").status_code == 400
+    assert post(drug="clopidogrel").status_code == 400
+    bad_name = client.post(
+        "/analyze/batch", headers=HEADERS, data={"drug": "clopidogrel"},
+        files=[("vcf_files", ("p1.txt", VCF))]
+    )
+    assert bad_name.status_code == 400
+    assert client.get("/analyze/batch/missing", headers=HEADERS).status_code == 404
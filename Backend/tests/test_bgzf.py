@@ -0,0 +1,200 @@
+import gzip
+import io
+import os
+import struct
+
+import pytest
+
+from app import vcf_parser
+from app.bgzf import (
+    BGZFReader, IndexFormatError, inflate_stream, merge_chunks, parse_index, split_virtual_offset
+)
+from app.vcf_parser import VCFFormatError, iter_indexed_lines, read_variants
+
+from conftest import FIXTURES
+
+VCF_GZ = os.path.join(FIXTURES, "indexed.vcf.gz")
+
+EXPECTED = {
+    ("DPYD", "rs3918290", "*2A", "1", 97450058, 1),
+    ("TPMT", "rs1142345", "*3C", "6", 18130687, 2),
+    ("CYP2C19", "rs4244285", "*2", "10", 94781859, 1),
+    ("CYP2C9", "rs1799853", "*2", "10", 94942290, 1),
+    ("SLCO1B1", "rs4149056", "*5", "12", 21178615, 1),
+    ("CYP2D6", "rs3892097", "*4", "22", 42128945, 1),
+    ("CYP2D6", "rs1065852", "*10", "22", 42130692, 2),
+}
+
+
+def _fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+def _calls(index_bytes=None):
+    with open(VCF_GZ, "rb") as stream:
+        calls = read_variants(stream, index_bytes)
+    return {(v.gene, v.rsid, v.star, v.chromosome, v.position, v.dosage) for v in calls}
+
+
+def _strip_csi_aux(raw: bytes) -> bytes:
+    # bcftools writes CSI without the tabix aux block; contigs then come
+    # from the ##contig header order
+    buf = gzip.decompress(raw)
+    min_shift, depth, l_aux = struct.unpack_from("<3i", buf, 4)
+    return gzip.compress(buf[:4] + struct.pack("<3i", min_shift, depth, 0) + buf[16 + l_aux:])
+
+
+# ==============================
+# REGION QUERIES
+# ==============================
+def test_streamed_parse_finds_every_site():
+    assert _calls() == EXPECTED
+
+
+@pytest.mark.parametrize("index_name", ["indexed.vcf.gz.tbi", "indexed.vcf.gz.csi"])
+def test_indexed_parse_matches_streamed(index_name):
+    assert _calls(_fixture(index_name)) == EXPECTED
+
+
+def test_csi_without_aux_uses_contig_header_order():
+    raw = _strip_csi_aux(_fixture("indexed.vcf.gz.csi"))
+    index = parse_index(raw, ["1", "2", "6", "10", "12", "22"])
+    assert index.names == ["1", "2", "6", "10", "12", "22"]
+    assert (index.min_shift, index.depth) == (14, 8)
+    assert _calls(raw) == EXPECTED
+
+
+def test_indexed_lines_skip_records_outside_windows():
+    with open(VCF_GZ, "rb") as stream:
+        lines = list(iter_indexed_lines(stream, _fixture("indexed.vcf.gz.tbi"), genes=["CYP2D6"]))
+
+    records = [line for line in lines if not line.startswith("#")]
+    assert lines[0].startswith("##fileformat=VCF")
+    assert any(line.startswith("#CHROM") for line in lines)
+    # The window shares BGZF blocks with filler on either side, which must be dropped
+    positions = [int(line.split("\t")[1]) for line in records]
+    assert positions
+    assert all(42116499 <= pos <= 42140881 for pos in positions)
+    assert {42128945, 42130692} <= set(positions)
+
+
+def test_index_only_touches_a_few_blocks():
+    index = parse_index(_fixture("indexed.vcf.gz.tbi"))
+    chunks = merge_chunks(index.chunks("22", 42116499, 42140881))
+    assert chunks
+
+    starts = []
+    with open(VCF_GZ, "rb") as stream:
+        reader = BGZFReader(stream)
+        coffset = 0
+        while True:
+            _data, next_offset = reader.read_block(coffset)
+            if next_offset == coffset:
+                break
+            starts.append(coffset)
+            coffset = next_offset
+
+    touched = {
+        block for beg, end in chunks for block in starts
+        if split_virtual_offset(beg)[0] <= block <= split_virtual_offset(end)[0]
+    }
+    assert len(starts) > 10
+    assert 0 < len(touched) <= 3
+
+
+def test_unknown_contig_has_no_chunks():
+    index = parse_index(_fixture("indexed.vcf.gz.tbi"))
+    assert index.chunks("chr22", 42116499, 42140881) == []
+    assert index.chunks("X", 1, 1000) == []
+
+
+# ==============================
+# BINNING
+# ==============================
+def test_reg2bins_matches_sam_spec():
+    index = parse_index(_fixture("indexed.vcf.gz.tbi"))
+    # 0-based [0, 1): one bin per level, from the root down to the 16kb leaf
+    assert index.reg2bins(0, 1) == [0, 1, 9, 73, 585, 4681]
+    # A range crossing a 16kb boundary hits two leaves
+    bins = index.reg2bins(16383, 16385)
+    assert 4681 in bins and 4682 in bins
+    assert index.pseudo_bin == 37450
+
+
+def test_reg2bins_csi_levels():
+    index = parse_index(_fixture("indexed.vcf.gz.csi"))
+    bins = index.reg2bins(0, 1)
+    assert len(bins) == index.depth + 1
+    assert bins[0] == 0
+
+
+def test_merge_chunks_joins_overlaps_and_keeps_gaps():
+    assert merge_chunks([(50, 60), (0, 10), (5, 20), (20, 30), (8, 9)]) == [(0, 30), (50, 60)]
+    assert merge_chunks([]) == []
+
+
+# ==============================
+# BAD INPUT
+# ==============================
+@pytest.mark.parametrize("raw", [
+    b"not an index",
+    gzip.compress(b"BAI\x01" + bytes(16)),
+    gzip.compress(b"TBI\x01" + struct.pack("<i", 3)),
+    b"\x1f\x8b\x08\x04garbage",
+])
+def test_parse_index_rejects_corrupt_input(raw):
+    with pytest.raises(IndexFormatError):
+        parse_index(raw)
+
+
+@pytest.mark.parametrize("raw", [
+    b"not an index",
+    gzip.compress(b"TBI\x01" + struct.pack("<i", 3)),
+])
+def test_corrupt_index_falls_back_to_streamed_parse(raw):
+    assert _calls(raw) == EXPECTED
+
+
+def test_inflate_stream_rejects_truncated_input():
+    raw = _fixture("indexed.vcf.gz")
+    assert b"".join(inflate_stream(iter([raw[:1000], raw[1000:]]))) == gzip.decompress(raw)
+    with pytest.raises(EOFError):
+        b"".join(inflate_stream(iter([raw[:-100]])))
+
+
+def _damage_region_block(damage):
+    # Apply damage(raw, coffset) to the first block the CYP2D6 query reads
+    index = parse_index(_fixture("indexed.vcf.gz.tbi"))
+    coffset = split_virtual_offset(merge_chunks(index.chunks("22", 42116499, 42140881))[0][0])[0]
+    return io.BytesIO(damage(bytearray(_fixture("indexed.vcf.gz")), coffset))
+
+
+def _garble_deflate(raw, coffset):
+    raw[coffset + 18:coffset + 26] = b"\xff" * 8
+    return bytes(raw)
+
+
+def _truncate_header(raw, coffset):
+    # Ends inside the block's BC extra field
+    return bytes(raw[:coffset + 17])
+
+
+@pytest.mark.parametrize("damage", [_garble_deflate, _truncate_header])
+def test_corrupt_block_in_an_indexed_region_is_a_format_error(damage):
+    with pytest.raises(VCFFormatError):
+        read_variants(_damage_region_block(damage), _fixture("indexed.vcf.gz.tbi"))
+
+
+def test_index_requires_bgzip_vcf():
+    plain = gzip.decompress(_fixture("indexed.vcf.gz"))
+    with pytest.raises(VCFFormatError):
+        read_variants(io.BytesIO(plain), _fixture("indexed.vcf.gz.tbi"))
+
+
+def test_compressed_size_cap(monkeypatch):
+    monkeypatch.setattr(vcf_parser, "MAX_COMPRESSED_VCF_BYTES", 1024)
+    with pytest.raises(VCFFormatError):
+        _calls(_fixture("indexed.vcf.gz.tbi"))
+    with pytest.raises(VCFFormatError):
+        _calls()
@@ -0,0 +1,74 @@
+import io
+
+import numpy as np
+import pytest
+
+from app.analysis import analyze_cohort, analyze_drugs
+from app.vcf_parser import MISSING_DOSAGE, gt_dosage, read_cohort, read_variants, sample_dosages
+
+HEADER = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{samples}\n"
+SITES = [
+    "10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT:DP",
+    "22\t42128945\trs3892097\tC\tT\t50\tPASS\tGENE=CYP2D6;STAR=*4\tDP:GT",
+    "22\t42130692\trs1065852\tG\tA\t50\tPASS\t.\tGT",
+    "2\t1000000\t.\tA\tG\t50\tPASS\t.\tGT",
+]
+# Per sample, one call per site in the FORMAT layout of that site
+CALLS = {
+    "S1": ["0/1:30", "12:1|1", "0/0", "0/1"],
+    "S2": ["1/1:30", "12:0/0", "1/0", "1/1"],
+    "S3": ["./.:0", "12:./.", "./.", "0/0"],
+    "S4": ["0|0:30", "12", "0/1", "0/1"],
+}
+DRUGS = ["CLOPIDOGREL", "CODEINE"]
+
+
+def _vcf(samples):
+    lines = [HEADER.format(samples="\t".join(samples))]
+    for i, site in enumerate(SITES):
+        lines.append(site + "\t" + "\t".join(CALLS[s][i] for s in samples) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+@pytest.mark.parametrize("gt, dosage", [
+    ("0/0", 0), ("0/1", 1), ("1|0", 1), ("1/1", 2), ("1/2", 2), ("0/2", 1),
+    ("./.", MISSING_DOSAGE), ("0/.", MISSING_DOSAGE), ("1", 1), ("0", 0), ("1/1/1", 2),
+])
+def test_gt_dosage(gt, dosage):
+    assert gt_dosage(gt) == dosage
+
+
+def test_sample_dosages_finds_gt_in_any_format_position():
+    assert sample_dosages("GT:DP", ["0/1:30", "1/1"]) == [1, 2]
+    assert sample_dosages("DP:GT", ["30:1/1", "30"]) == [2, MISSING_DOSAGE]
+    assert sample_dosages("DP", ["30", "31"]) == [MISSING_DOSAGE, MISSING_DOSAGE]
+
+
+def test_read_cohort_builds_gene_matrices():
+    cohort = read_cohort(io.BytesIO(_vcf(list(CALLS))))
+    assert cohort.samples == list(CALLS)
+    assert sorted(cohort.sites) == ["CYP2C19", "CYP2D6"]
+    assert [v.rsid for v in cohort.sites["CYP2D6"]] == ["rs3892097", "rs1065852"]
+    # Sites carry no per-sample dosage; the matrices do
+    assert all(v.dosage is None for v in cohort.sites["CYP2D6"])
+
+    assert cohort.genotypes["CYP2C19"].dtype == np.int8
+    assert cohort.genotypes["CYP2C19"].tolist() == [[1], [2], [MISSING_DOSAGE], [0]]
+    assert cohort.genotypes["CYP2D6"].tolist() == [[2, 0], [0, 1], [MISSING_DOSAGE] * 2, [MISSING_DOSAGE, 1]]
+
+
+def test_sites_only_vcf_has_no_samples():
+    vcf = b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" \
+          b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\n"
+    cohort = read_cohort(io.BytesIO(vcf))
+    assert cohort.samples == []
+    assert cohort.genotypes["CYP2C19"].shape == (0, 1)
+
+
+def test_cohort_matches_single_sample_analysis():
+    cohort_results = analyze_cohort(read_cohort(io.BytesIO(_vcf(list(CALLS)))), DRUGS)
+    for sample, results in zip(CALLS, cohort_results):
+        single = analyze_drugs(read_variants(io.BytesIO(_vcf([sample]))), DRUGS)
+        for cohort_result, single_result in zip(results, single):
+            for field in ("drug", "gene", "diplotype", "phenotype", "risk"):
+                assert cohort_result[field] == single_result[field], (sample, field)
@@ -0,0 +1,88 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from app.decision_table import PHENOTYPES, DecisionTable, compile_tables
+from app.knowledge_base import KNOWLEDGE_BASE_PATH, load_source
+from app.phenotype_engine import infer_cohort_diplotypes, infer_diplotype, infer_phenotype
+from app.vcf_parser import Variant
+
+SOURCE = load_source(KNOWLEDGE_BASE_PATH)
+STAR_FUNCTION = SOURCE["star_function"]
+DRUG_RULES = SOURCE["drug_rules"]
+
+
+@pytest.fixture(scope="module")
+def table():
+    layout, data = compile_tables(STAR_FUNCTION, DRUG_RULES)
+    return DecisionTable(layout, data, STAR_FUNCTION, DRUG_RULES)
+
+
+def _diplotypes(gene):
+    alleles = sorted(STAR_FUNCTION[gene]) + ["*999"]
+    return [f"{a}/{b}" for a, b in itertools.product(alleles, repeat=2)] + [
+        "*1/*2/*3", "*1", "", "*1/"
+    ]
+
+
+@pytest.mark.parametrize("gene", sorted(STAR_FUNCTION))
+def test_phenotypes_match_the_rules(table, gene):
+    for diplotype in _diplotypes(gene):
+        assert table.phenotype_for(gene, diplotype) == infer_phenotype(gene, diplotype, STAR_FUNCTION), diplotype
+
+
+def test_unknown_gene_uses_the_rules(table):
+    assert table.phenotype_for("ABCB1", "*1/*2") == infer_phenotype("ABCB1", "*1/*2", STAR_FUNCTION)
+
+
+def test_risks_match_the_rules(table):
+    for drug, rule in DRUG_RULES.items():
+        for phenotype in PHENOTYPES:
+            assert table.risk_for(drug.lower(), phenotype) == (rule["risk_map"].get(phenotype, "Unknown"), rule)
+        assert table.risk_for(drug, "XM")[0] == "Unknown"
+    assert table.risk_for("ASPIRIN", "NM") == ("Unknown", None)
+
+
+@pytest.mark.parametrize("gene", sorted(STAR_FUNCTION))
+def test_cohort_classification_matches_scalar(table, gene):
+    diplotypes = _diplotypes(gene) * 3
+    drugs = [d for d, rule in DRUG_RULES.items() if rule["gene"] == gene]
+    result = table.classify_diplotypes(gene, diplotypes, drugs)
+
+    assert [PHENOTYPES[c] for c in result["phenotypes"]] == [
+        table.phenotype_for(gene, d) for d in diplotypes
+    ]
+    for drug in drugs:
+        assert [table.risk_labels[c] for c in result["risks"][drug]] == [
+            table.risk_for(drug, PHENOTYPES[c])[0] for c in result["phenotypes"]
+        ]
+
+
+def test_cohort_classification_rejects_unknown_drugs(table):
+    with pytest.raises(KeyError):
+        table.classify_diplotypes("CYP2D6", ["*1/*1"], ["ASPIRIN"])
+
+
+def test_table_reads_from_any_buffer():
+    layout, data = compile_tables(STAR_FUNCTION, DRUG_RULES)
+    # A snapshot maps the tables after a header, with trailing bytes
+    padded = b"\xff" * 8 + data + b"\xff" * 8
+    table = DecisionTable(layout, memoryview(padded)[8:], STAR_FUNCTION, DRUG_RULES)
+    assert table.phenotype_for("CYP2D6", "*4/*4") == "PM"
+    assert table.phenotype_matrix("CYP2D6").flags.writeable is False
+
+
+def test_cohort_diplotypes_match_single_sample_inference():
+    stars = ["*2", "*3", None, "*17"]
+    genotypes = np.array([
+        [0, 0, 0, 0], [1, 0, 1, 0], [2, 0, 0, 0], [1, 1, 0, 1], [-1, 1, 0, 0], [0, 0, 0, 2], [1, 0, 1, 0]
+    ], dtype=np.int8)
+    expected = [
+        infer_diplotype(
+            [Variant("rs", "CYP2C19", star, "10", 1, int(d)) for star, d in zip(stars, row)], "CYP2C19"
+        )
+        for row in genotypes
+    ]
+    assert infer_cohort_diplotypes(stars, genotypes) == expected
+    assert expected[:3] == ["*1/*1", "*2/*1", "*2/*2"]
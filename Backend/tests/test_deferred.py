@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+from app import deferred
+from app.deferred import FAILED, PENDING, READY, DeferredExplanations
+from app.explanation_cache import SQLiteStore
+
+
+async def _explain(event: asyncio.Event, values):
+    await event.wait()
+    if isinstance(values, Exception):
+        raise values
+    return values
+
+
+async def _settle(explanations: DeferredExplanations):
+    # Let the batch finish and its status reach the store
+    await asyncio.sleep(0)
+    while explanations._writes:
+        await asyncio.gather(*explanations._writes)
+
+
+def test_batch_fans_out_to_one_id_per_result():
+    async def run():
+        explanations = DeferredExplanations(ttl=60, max_entries=100)
+        done = asyncio.Event()
+        ids = await explanations.submit_many(_explain(done, [{"summary": "a"}, {"summary": "b"}]), 2)
+        assert len(set(ids)) == 2
+        assert [(await explanations.lookup(i))["status"] for i in ids] == [PENDING, PENDING]
+
+        done.set()
+        await asyncio.sleep(0.01)
+        return [await explanations.lookup(i) for i in ids]
+
+    first, second = asyncio.run(run())
+    assert (first["status"], first["explanation"]) == (READY, {"summary": "a"})
+    assert second["explanation"] == {"summary": "b"}
+
+
+def test_failed_batch_reports_failed():
+    async def run():
+        explanations = DeferredExplanations(ttl=60, max_entries=100)
+        done = asyncio.Event()
+        ids = await explanations.submit_many(_explain(done, RuntimeError("LLM down")), 2)
+        done.set()
+        await asyncio.sleep(0.01)
+        return [await explanations.lookup(i) for i in ids] + [await explanations.lookup("missing")]
+
+    first, second, missing = asyncio.run(run())
+    assert first["status"] == second["status"] == FAILED
+    assert "explanation" not in first
+    assert missing is None
+
+
+def test_other_workers_read_status_from_the_store(tmp_path):
+    path = str(tmp_path / "explanations.sqlite3")
+
+    async def run():
+        owner = DeferredExplanations(ttl=60, max_entries=100, store=SQLiteStore(path, ttl=60))
+        other = DeferredExplanations(ttl=60, max_entries=100, store=SQLiteStore(path, ttl=60))
+        done = asyncio.Event()
+        ids = await owner.submit_many(_explain(done, [{"summary": "a"}]), 1)
+        pending = await other.lookup(ids[0])
+
+        done.set()
+        await owner._tasks[ids[0]]
+        await _settle(owner)
+        return pending, await other.lookup(ids[0])
+
+    pending, ready = asyncio.run(run())
+    assert pending["status"] == PENDING
+    assert (ready["status"], ready["explanation"]) == (READY, {"summary": "a"})
+
+
+def test_stream_from_another_worker_polls_until_ready(tmp_path, monkeypatch):
+    monkeypatch.setattr(deferred, "SSE_POLL_SECONDS", 0.01)
+    path = str(tmp_path / "explanations.sqlite3")
+
+    async def run():
+        owner = DeferredExplanations(ttl=60, max_entries=100, store=SQLiteStore(path, ttl=60))
+        other = DeferredExplanations(ttl=60, max_entries=100, store=SQLiteStore(path, ttl=60))
+        monkeypatch.setattr(deferred, "deferred_explanations", other)
+        done = asyncio.Event()
+        (explanation_id,) = await owner.submit_many(_explain(done, [{"summary": "a"}]), 1)
+
+        async def finish():
+            await asyncio.sleep(0.05)
+            done.set()
+            await owner._tasks[explanation_id]
+            await _settle(owner)
+
+        payload = await other.lookup(explanation_id)
+        events, _ = await asyncio.gather(
+            _collect(deferred._poll_events(explanation_id, payload)), finish()
+        )
+        return events
+
+    events = asyncio.run(run())
+    assert len(events) == 1
+    assert events[0].startswith("event: explanation\ndata: ")
+    payload = json.loads(events[0].split("data: ", 1)[1])
+    assert (payload["status"], payload["explanation"]) == (READY, {"summary": "a"})
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_prune_caps_entries_and_cancels_the_oldest():
+    async def run():
+        explanations = DeferredExplanations(ttl=60, max_entries=2)
+        never = asyncio.Event()
+        first_id = explanations.submit(never.wait())
+        first_task = explanations.get(first_id)
+        ids = [explanations.submit(never.wait()) for _ in range(2)]
+        await asyncio.sleep(0)
+        return first_task, await explanations.lookup(first_id), [await explanations.lookup(i) for i in ids]
+
+    first_task, first, rest = asyncio.run(run())
+    assert first is None
+    assert first_task.cancelled()
+    assert [p["status"] for p in rest] == [PENDING, PENDING]
+
+
+def test_deferred_assessments_are_saved_with_their_explanations(client, monkeypatch):
+    from app import main
+
+    from conftest import auth_header
+
+    saved = []
+    monkeypatch.setattr(main.analysis_writer, "submit", lambda assessments, owner: saved.extend(assessments))
+    vcf = (
+        b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+        b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\n"
+    )
+    response = client.post(
+        "/analyze", data={"drug": "CLOPIDOGREL", "defer_explanation": "true"},
+        files={"vcf_file": ("p.vcf", vcf)}, headers=auth_header("alice@example.com")
+    ).json()
+    assert response["llm_generated_explanation"]["status"] == PENDING
+
+    explanation_id = response["llm_generated_explanation"]["explanation_id"]
+    ready = client.get(f"/explanations/{explanation_id}", headers=auth_header("alice@example.com")).json()
+    saved_explanation, = [a["llm_generated_explanation"] for a in saved]
+    assert "status" not in saved_explanation and saved_explanation == ready["explanation"]
+    assert saved_explanation["summary"]
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from app import explanation_cache as cache_module
+from app.explanation_cache import ExplanationCache, SQLiteStore, TTLCache, explanation_key
+from app.vcf_parser import Variant
+
+STAR2 = Variant("rs4244285", "CYP2C19", "*2", "10", 94781859, 1)
+STAR17 = Variant("rs12248560", "CYP2C19", "*17", "10", 94761900, 1)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+def test_key_ignores_variant_order_duplicates_and_case():
+    key = explanation_key("CYP2C19", "IM", "clopidogrel", [STAR2, STAR17])
+    assert key == explanation_key("cyp2c19", "IM", "CLOPIDOGREL", [STAR17, STAR2, STAR2])
+    # Dosage and position never reach the prompt
+    assert key == explanation_key("CYP2C19", "IM", "CLOPIDOGREL", [STAR2._replace(dosage=2), STAR17])
+    assert key != explanation_key("CYP2C19", "PM", "CLOPIDOGREL", [STAR2, STAR17])
+    assert key != explanation_key("CYP2C19", "IM", "CLOPIDOGREL", [STAR2])
+
+
+def test_ttl_cache_evicts_oldest_and_expires(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.set("c", {"v": 3})
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    clock.now += 11
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+def _counting(values, cacheable=True):
+    calls = []
+
+    async def compute_many(keys):
+        calls.append(list(keys))
+        await asyncio.sleep(0.01)
+        return {k: (values[k], cacheable) for k in keys if k in values}
+
+    compute_many.calls = calls
+    return compute_many
+
+
+def test_concurrent_lookups_share_one_call():
+    cache = ExplanationCache(TTLCache(16, 60))
+    compute_many = _counting({"k": {"summary": "x"}})
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute_many(["k"], compute_many) for _ in range(5)))
+
+    assert asyncio.run(run()) == [[{"summary": "x"}]] * 5
+    assert compute_many.calls == [["k"]]
+    assert cache.stats()["coalesced"] == 4
+    assert asyncio.run(cache.get_or_compute_many(["k"], compute_many)) == [{"summary": "x"}]
+    assert compute_many.calls == [["k"]]
+
+
+def test_uncacheable_values_are_served_not_stored():
+    cache = ExplanationCache(TTLCache(16, 60))
+    compute_many = _counting({"a": {"summary": "fallback"}}, cacheable=False)
+    for _ in range(2):
+        assert asyncio.run(cache.get_or_compute_many(["a"], compute_many)) == [{"summary": "fallback"}]
+    assert compute_many.calls == [["a"], ["a"]]
+
+
+def test_batch_computes_only_misses_once():
+    cache = ExplanationCache(TTLCache(16, 60))
+    values = {k: {"summary": k} for k in "abc"}
+    compute_many = _counting(values)
+
+    asyncio.run(cache.get_or_compute_many(["a"], compute_many))
+    result = asyncio.run(cache.get_or_compute_many(["b", "a", "c", "b"], compute_many))
+    assert [r["summary"] for r in result] == ["b", "a", "c", "b"]
+    assert compute_many.calls == [["a"], ["b", "c"]]
+
+
+def test_overlapping_batch_joins_keys_in_flight():
+    cache = ExplanationCache(TTLCache(16, 60))
+    compute_many = _counting({k: {"summary": k} for k in "abc"})
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_compute_many(["a", "b"], compute_many))
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, cache.get_or_compute_many(["b", "c"], compute_many))
+
+    first, second = asyncio.run(run())
+    assert [r["summary"] for r in first + second] == ["a", "b", "b", "c"]
+    assert compute_many.calls == [["a", "b"], ["c"]]
+
+
+def test_batch_errors_reach_every_caller():
+    cache = ExplanationCache(TTLCache(16, 60))
+
+    async def broken(keys):
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_compute_many(["a", "b"], broken))
+    # Keys left out of the answer fail on their own
+    with pytest.raises(KeyError):
+        asyncio.run(cache.get_or_compute_many(["a", "z"], _counting({"a": {"summary": "a"}})))
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_sqlite_store_is_shared_across_caches(tmp_path):
+    path = str(tmp_path / "explanations.sqlite3")
+    first = ExplanationCache(TTLCache(16, 60), SQLiteStore(path, ttl=60))
+
+    async def fill():
+        await first.get_or_compute_many(["a", "b"], _counting({k: {"summary": k} for k in "ab"}))
+        # Callers get their values before the store write finishes
+        await asyncio.gather(*first._loads)
+
+    asyncio.run(fill())
+
+    # A second worker finds them in the store without computing
+    second = ExplanationCache(TTLCache(16, 60), SQLiteStore(path, ttl=60))
+    compute_many = _counting({"c": {"summary": "c"}})
+    result = asyncio.run(second.get_or_compute_many(["a", "b", "c"], compute_many))
+    assert [r["summary"] for r in result] == ["a", "b", "c"]
+    assert compute_many.calls == [["c"]]
+    assert second.stats()["persistent_hits"] == 2
+
+
+def test_sqlite_store_expires_entries(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    store = SQLiteStore(str(tmp_path / "explanations.sqlite3"), ttl=60)
+    store.set("a", {"summary": "a"})
+    assert store.get_many(["a", "b"]) == {"a": {"summary": "a"}}
+    clock.now += 61
+    assert store.get("a") is None
@@ -0,0 +1,125 @@
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app import export, jobs
+from app.export import DICTIONARY_COLUMNS, ResultExportWriter, export_job
+
+from test_jobs import _submit
+
+GENES = ["CYP2C19", "CYP2D6", "CYP2C9"]
+DRUGS = ["CLOPIDOGREL", "CODEINE", "WARFARIN"]
+
+
+def _assessment(i: int) -> dict:
+    return {
+        "patient_id": f"P{i}",
+        "drug": DRUGS[i % 3],
+        "timestamp": "2026-01-02T03:04:05.678901Z",
+        "knowledge_base_version": "1.0.0",
+        "risk_assessment": {
+            "risk_label": "Adjust Dosage" if i % 2 else "Safe",
+            "confidence_score": 0.5 + i / 100,
+            "severity": "moderate" if i % 2 else "none"
+        },
+        "pharmacogenomic_profile": {
+            "primary_gene": GENES[i % 3],
+            "diplotype": "*1/*2",
+            "phenotype": "IM",
+            "detected_variants": [
+                {"rsid": "rs4244285", "gene": "CYP2C19", "chromosome": "10", "position": "94781859"}
+            ][:i % 2]
+        },
+        "quality_metrics": {
+            "vcf_parsing_success": True,
+            "variants_detected": i % 2,
+            "genes_identified": GENES[:i % 3]
+        }
+    }
+
+
+ASSESSMENTS = [_assessment(i) for i in range(7)]
+
+
+def _check_rows(table: pa.Table):
+    rows = table.to_pylist()
+    assert [r["patient_id"] for r in rows] == [a["patient_id"] for a in ASSESSMENTS]
+    for row, a in zip(rows, ASSESSMENTS):
+        assert row["drug"] == a["drug"]
+        assert row["primary_gene"] == a["pharmacogenomic_profile"]["primary_gene"]
+        assert row["risk_label"] == a["risk_assessment"]["risk_label"]
+        assert row["confidence_score"] == pytest.approx(a["risk_assessment"]["confidence_score"])
+        assert row["detected_variants"] == a["pharmacogenomic_profile"]["detected_variants"]
+        assert row["genes_identified"] == a["quality_metrics"]["genes_identified"]
+        assert row["timestamp"].isoformat() == "2026-01-02T03:04:05.678901+00:00"
+
+
+def test_parquet_round_trip_in_row_groups(tmp_path):
+    path = str(tmp_path / "out.parquet")
+    with ResultExportWriter(path, "parquet", row_group_size=3) as writer:
+        writer.write_many(ASSESSMENTS)
+    assert writer.rows == 7
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 3
+    assert [parquet.metadata.row_group(i).num_rows for i in range(3)] == [3, 3, 1]
+
+    table = parquet.read()
+    assert table.schema.equals(export.export_schema())
+    for name in DICTIONARY_COLUMNS:
+        assert pa.types.is_dictionary(table.schema.field(name).type)
+    _check_rows(table)
+
+
+def test_arrow_round_trip_with_dictionary_deltas(tmp_path):
+    path = str(tmp_path / "out.arrow")
+    # One row per batch, so later batches add new dictionary values
+    with ResultExportWriter(path, "arrow", row_group_size=1) as writer:
+        writer.write_many(ASSESSMENTS)
+
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        assert reader.num_record_batches == 7
+        table = reader.read_all()
+    assert table.schema.equals(export.export_schema())
+    _check_rows(table)
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResultExportWriter(str(tmp_path / "out.csv"), "csv")
+
+
+def test_empty_export_has_schema(tmp_path):
+    path = str(tmp_path / "out.parquet")
+    with ResultExportWriter(path, "parquet"):
+        pass
+    table = pq.read_table(path)
+    assert table.num_rows == 0
+    assert table.schema.equals(export.export_schema())
+
+
+def test_export_job_writes_every_sample(store, tmp_path):
+    row, _ = _submit()
+    jobs.run_job(store, jobs.claim_job(store), threading.Event())
+
+    path = str(tmp_path / "cohort.parquet")
+    assert export_job(row["job_id"], path, "parquet") == 3
+    table = pq.read_table(path)
+    assert table.column("patient_id").to_pylist() == ["S1", "S2", "S3"]
+    assert set(table.column("drug").to_pylist()) == {"CLOPIDOGREL"}
+
+
+def test_failed_export_leaves_no_file(store, tmp_path, monkeypatch):
+    def broken(_job_id):
+        yield "S1", [ASSESSMENTS[0]]
+        raise RuntimeError("store went away")
+
+    monkeypatch.setattr(jobs, "iter_job_results", broken)
+    path = tmp_path / "cohort.arrow"
+    with pytest.raises(RuntimeError):
+        export_job("job", str(path), "arrow")
+    assert not path.exists()
+    assert not (tmp_path / "cohort.arrow.part").exists()
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app import history, persistence
+from app.history import decode_cursor, encode_cursor
+from app.persistence import ANALYSES_COLLECTION
+
+from conftest import auth_header
+
+HEADERS = auth_header("alice@example.com")
+START = datetime(2026, 10, 1)
+
+
+def _matches(doc, query):
+    # Just the operators the history queries build
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(_matches(doc, q) for q in cond):
+                return False
+        elif key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict):
+            ops = {"$lt": lambda a, b: a < b, "$gte": lambda a, b: a >= b}
+            if not all(ops[op](doc[key], value) for op, value in cond.items()):
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.indexes = []
+        self.pipelines = []
+
+    def find(self, query, projection):
+        keep = set(projection) | {"_id"}
+        return _Cursor([
+            {k: v for k, v in d.items() if k in keep}
+            for d in self.docs if _matches(d, query)
+        ])
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return _Cursor([])
+
+    async def create_index(self, keys):
+        self.indexes.append([field for field, _ in keys])
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    # Several rows share a timestamp so pages have to break ties on _id;
+    # bob's copies of every row must never show up in alice's queries
+    docs = [
+        {
+            "_id": ObjectId(), "owner": owner, "patient_id": "P1" if i % 2 else "P2",
+            "drug": "CLOPIDOGREL" if i % 3 else "CODEINE", "gene": "CYP2C19",
+            "risk_label": "Toxic" if i % 4 == 0 else "Safe",
+            "timestamp": START + timedelta(days=i // 3), "result": {"i": i}
+        }
+        for owner in ("alice@example.com", "bob@example.com")
+        for i in range(12)
+    ]
+    collection = _Collection(docs)
+    monkeypatch.setattr(history.db, "db", {ANALYSES_COLLECTION: collection})
+    return collection
+
+
+def test_cursor_round_trip():
+    object_id = ObjectId()
+    assert decode_cursor(encode_cursor(START, object_id)) == (START, object_id)
+    for bad in ("!!", encode_cursor(START, object_id)[:-4], "bm90LWEtY3Vyc29y"):
+        with pytest.raises(HTTPException) as e:
+            decode_cursor(bad)
+        assert e.value.status_code == 400
+
+
+def test_pages_walk_every_row_once(client, collection):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/history/assessments", params=params, headers=HEADERS).json()
+        assert len(page["items"]) <= 5
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 12 and len({item["id"] for item in seen}) == 12
+    keys = [(item["timestamp"], item["id"]) for item in seen]
+    assert keys == sorted(keys, reverse=True)
+    # Summary fields only unless the full result is asked for
+    assert "result" not in seen[0] and seen[0]["timestamp"].endswith("Z")
+
+
+def test_filters_and_projection(client, collection):
+    page = client.get(
+        "/history/assessments",
+        params={"drug": "clopidogrel", "risk_label": "Toxic", "fields": "drug,result"},
+        headers=HEADERS
+    ).json()
+    assert [item["result"]["i"] for item in page["items"]] == [8, 4]
+    assert set(page["items"][0]) == {"id", "drug", "result", "timestamp"}
+
+    page = client.get("/history/patients/P1", headers=HEADERS).json()
+    assert len(page["items"]) == 6 and {item["patient_id"] for item in page["items"]} == {"P1"}
+
+    for params in ({"fields": "drug,password"}, {"since": "yesterday"}, {"limit": 1000}):
+        assert client.get("/history/assessments", params=params, headers=HEADERS).status_code in (400, 422)
+
+
+def test_summary_is_aggregated_by_the_database(client, collection):
+    response = client.get("/history/summary", params={"gene": "cyp2c19", "since": "2026-10-02"}, headers=HEADERS)
+    assert response.json() == {"groups": []}
+    match = collection.pipelines[0][0]["$match"]
+    assert match == {
+        "owner": "alice@example.com", "timestamp": {"$gte": datetime(2026, 10, 2)}, "gene": "CYP2C19"
+    }
+
+
+def test_every_query_shape_has_an_index(collection, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(persistence.db, "db", {ANALYSES_COLLECTION: collection})
+    asyncio.run(persistence.ensure_indexes())
+    for fields in (["patient_id"], ["drug"], ["gene"], ["drug", "risk_label"], ["gene", "risk_label"], []):
+        assert ["owner"] + fields + ["timestamp", "_id"] in collection.indexes
+
+
+def test_history_needs_a_database(client, monkeypatch):
+    monkeypatch.setattr(history.db, "db", None)
+    assert client.get("/history/patients/P1", headers=HEADERS).status_code == 503
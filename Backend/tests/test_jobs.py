@@ -0,0 +1,239 @@
+import io
+import os
+import threading
+import time
+
+import orjson
+import pytest
+
+from app import jobs
+
+COHORT_VCF = b"""##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3
+10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT\t0/1\t1/1\t0/0
+"""
+DRUGS = ["CLOPIDOGREL"]
+
+
+def _submit(content=COHORT_VCF, rules="rules-1"):
+    staged, content_hash = jobs._stage_upload(io.BytesIO(content))
+    return jobs.submit_job(staged, content_hash, "cohort.vcf", DRUGS, rules)
+
+
+def _expire_lease(conn, job_id):
+    conn.execute("UPDATE jobs SET lease_expires = ? WHERE job_id = ?", (time.time() - 1, job_id))
+
+
+def _samples(conn, job_id):
+    return {
+        row["sample_index"]: (row["sample"], row["assessments"])
+        for row in conn.execute("SELECT * FROM job_samples WHERE job_id = ?", (job_id,))
+    }
+
+
+# ==============================
+# SUBMIT / CANCEL
+# ==============================
+def test_submit_is_idempotent(store):
+    first, created = _submit()
+    assert created and first["status"] == jobs.QUEUED
+    assert os.path.exists(first["input_path"])
+
+    again, created = _submit()
+    assert not created
+    assert again["job_id"] == first["job_id"]
+    # Only the first upload is kept
+    assert os.listdir(jobs.JOBS_INPUT_DIR) == [os.path.basename(first["input_path"])]
+
+    other, created = _submit(rules="rules-2")
+    assert created and other["job_id"] != first["job_id"]
+
+
+def test_resubmitting_a_failed_job_requeues_it(store):
+    row, _ = _submit()
+    store.execute(
+        "UPDATE jobs SET status = ?, error = 'boom', attempts = 3 WHERE job_id = ?",
+        (jobs.FAILED, row["job_id"])
+    )
+    again, created = _submit()
+    assert created
+    assert again["job_id"] == row["job_id"]
+    assert (again["status"], again["error"], again["attempts"]) == (jobs.QUEUED, None, 0)
+
+
+def test_cancel_queued_job_removes_input(store):
+    row, _ = _submit()
+    cancelled = jobs.cancel_job(row["job_id"])
+    assert cancelled["status"] == jobs.CANCELLED
+    assert not os.path.exists(row["input_path"])
+    assert jobs.claim_job(store) is None
+    assert jobs.cancel_job("missing") is None
+
+
+def test_stage_upload_enforces_job_limit(store, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_JOB_VCF_BYTES", 10)
+    with pytest.raises(jobs.VCFFormatError):
+        jobs._stage_upload(io.BytesIO(COHORT_VCF))
+    assert os.listdir(jobs.JOBS_INPUT_DIR) == []
+
+
+# ==============================
+# LEASES
+# ==============================
+def test_claim_takes_a_lease(store):
+    row, _ = _submit()
+    job = jobs.claim_job(store)
+    assert job["job_id"] == row["job_id"]
+    assert job["status"] == jobs.RUNNING
+    assert job["attempts"] == 1
+    assert job["lease_expires"] > time.time()
+    # A live lease is not claimable
+    assert jobs.claim_job(store) is None
+
+
+def test_lapsed_lease_is_reclaimed(store):
+    _submit()
+    first = jobs.claim_job(store)
+    _expire_lease(store, first["job_id"])
+
+    second = jobs.claim_job(store)
+    assert second["job_id"] == first["job_id"]
+    assert second["attempts"] == 2
+    assert second["lease_owner"] != first["lease_owner"]
+
+
+def test_job_fails_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    row, _ = _submit()
+    for _ in range(2):
+        job = jobs.claim_job(store)
+        assert job is not None
+        _expire_lease(store, job["job_id"])
+
+    assert jobs.claim_job(store) is None
+    failed = jobs.get_job(row["job_id"])
+    assert failed["status"] == jobs.FAILED
+    assert failed["error"] == "Worker process crashed repeatedly"
+
+
+def test_stale_worker_cannot_checkpoint_or_finish(store):
+    _submit()
+    stale = jobs.claim_job(store)
+    _expire_lease(store, stale["job_id"])
+    current = jobs.claim_job(store)
+
+    jobs.run_job(store, stale, threading.Event())
+    assert _samples(store, stale["job_id"]) == {}
+    row = jobs.get_job(stale["job_id"])
+    assert (row["status"], row["lease_owner"]) == (jobs.RUNNING, current["lease_owner"])
+    assert os.path.exists(row["input_path"])
+
+
+# ==============================
+# RUNNING / CHECKPOINTS
+# ==============================
+def test_run_job_checkpoints_every_sample(store):
+    row, _ = _submit()
+    job = jobs.claim_job(store)
+    jobs.run_job(store, job, threading.Event())
+
+    done = jobs.get_job(row["job_id"])
+    assert done["status"] == jobs.SUCCEEDED
+    assert (done["total_samples"], done["completed_samples"]) == (3, 3)
+    assert not os.path.exists(done["input_path"])
+
+    results = list(jobs.iter_job_results(row["job_id"]))
+    assert [sample for sample, _ in results] == ["S1", "S2", "S3"]
+    assert all(a[0]["drug"] == "CLOPIDOGREL" for _, a in results)
+
+
+def test_resume_skips_checkpointed_samples(store):
+    row, _ = _submit()
+    jobs.claim_job(store)
+    kb_tag = jobs.current_knowledge_base().tag
+    marker = orjson.dumps([{"drug": "CLOPIDOGREL", "marker": True}])
+    store.execute(
+        "UPDATE jobs SET knowledge_base_version = ? WHERE job_id = ?", (kb_tag, row["job_id"])
+    )
+    store.execute(
+        "INSERT INTO job_samples (job_id, sample_index, sample, assessments) VALUES (?, 1, 'S2', ?)",
+        (row["job_id"], marker)
+    )
+    job = jobs.get_job(row["job_id"])
+
+    jobs.run_job(store, job, threading.Event())
+    samples = _samples(store, row["job_id"])
+    assert sorted(samples) == [0, 1, 2]
+    # The checkpointed sample was not analyzed again
+    assert samples[1] == ("S2", marker)
+    assert jobs.get_job(row["job_id"])["completed_samples"] == 3
+
+
+def test_checkpoints_from_other_rules_are_dropped(store):
+    row, _ = _submit()
+    jobs.claim_job(store)
+    marker = orjson.dumps([{"marker": True}])
+    store.execute(
+        "UPDATE jobs SET knowledge_base_version = 'old-rules' WHERE job_id = ?", (row["job_id"],)
+    )
+    store.execute(
+        "INSERT INTO job_samples (job_id, sample_index, sample, assessments) VALUES (?, 0, 'S1', ?)",
+        (row["job_id"], marker)
+    )
+    jobs.run_job(store, jobs.get_job(row["job_id"]), threading.Event())
+    assert _samples(store, row["job_id"])[0][1] != marker
+
+
+def test_stop_hands_the_job_back(store):
+    row, _ = _submit()
+    job = jobs.claim_job(store)
+    stop = threading.Event()
+    stop.set()
+    jobs.run_job(store, job, stop)
+
+    requeued = jobs.get_job(row["job_id"])
+    assert (requeued["status"], requeued["lease_owner"]) == (jobs.QUEUED, None)
+    assert os.path.exists(requeued["input_path"])
+    assert jobs.claim_job(store)["attempts"] == 1
+
+
+def test_restarts_do_not_use_up_attempts(store, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    row, _ = _submit()
+    stop = threading.Event()
+    stop.set()
+    for _ in range(3):
+        jobs.run_job(store, jobs.claim_job(store), stop)
+
+    jobs.run_job(store, jobs.claim_job(store), threading.Event())
+    assert jobs.get_job(row["job_id"])["status"] == jobs.SUCCEEDED
+
+
+def test_cancel_running_job_stops_at_checkpoint(store):
+    row, _ = _submit()
+    job = jobs.claim_job(store)
+    jobs.cancel_job(row["job_id"])
+    jobs.run_job(store, job, threading.Event())
+
+    cancelled = jobs.get_job(row["job_id"])
+    assert cancelled["status"] == jobs.CANCELLED
+    assert _samples(store, row["job_id"]) == {}
+    assert not os.path.exists(row["input_path"])
+
+
+def test_cancel_after_the_last_checkpoint_removes_the_input(store):
+    row, _ = _submit()
+    job = jobs.claim_job(store)
+    jobs.cancel_job(row["job_id"])
+    jobs._finish(store, job, jobs.SUCCEEDED)
+
+    assert jobs.get_job(row["job_id"])["status"] == jobs.CANCELLED
+    assert not os.path.exists(row["input_path"])
+
+
+def test_unreadable_input_fails_the_job(store):
+    row, _ = _submit(content=b"not a vcf\n")
+    jobs.run_job(store, jobs.claim_job(store), threading.Event())
+    failed = jobs.get_job(row["job_id"])
+    assert failed["status"] == jobs.FAILED
+    assert failed["error"] == "Invalid VCF format"
@@ -0,0 +1,136 @@
+import copy
+import json
+import os
+
+import pytest
+
+from app import auth, database, knowledge_base
+from app.knowledge_base import (
+    KNOWLEDGE_BASE_PATH, KnowledgeBase, KnowledgeBaseError, KnowledgeBaseStore, compile_snapshot,
+    load_source, validate_source
+)
+
+from conftest import auth_header
+
+SOURCE = load_source(KNOWLEDGE_BASE_PATH)
+
+
+def _write(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+@pytest.fixture
+def kb_files(tmp_path):
+    source = str(tmp_path / "kb.json")
+    _write(source, SOURCE)
+    return source, str(tmp_path / "kb.snapshot")
+
+
+def _bumped(version="2.0.0", risk="Toxic"):
+    data = copy.deepcopy(SOURCE)
+    data["version"] = version
+    data["drug_rules"]["CODEINE"]["risk_map"]["NM"] = risk
+    return data
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "kb.snapshot")
+    tag = compile_snapshot(SOURCE, path)
+    kb = KnowledgeBase(path)
+    assert kb.tag == tag
+    assert tag.startswith(SOURCE["version"] + "+")
+    assert kb.drug_rules == SOURCE["drug_rules"]
+    assert kb.recommendation("Safe") == SOURCE["recommendations"]["Safe"]
+    for drug, rule in SOURCE["drug_rules"].items():
+        for phenotype, risk in rule["risk_map"].items():
+            assert kb.table.risk_for(drug, phenotype)[0] == risk
+    # Compiled files are written whole and renamed; no temporaries remain
+    assert os.listdir(tmp_path) == ["kb.snapshot"]
+
+
+@pytest.mark.parametrize("edit, message", [
+    (lambda d: d.pop("recommendations"), "missing"),
+    (lambda d: d["star_function"]["CYP2D6"].update({"*99": "broken"}), "unknown allele function"),
+    (lambda d: d["drug_rules"].update({"codeine": d["drug_rules"]["CODEINE"]}), "upper case"),
+    (lambda d: d["drug_rules"]["CODEINE"]["risk_map"].update({"XM": "Safe"}), "unknown phenotype"),
+])
+def test_invalid_sources_are_rejected(edit, message):
+    data = copy.deepcopy(SOURCE)
+    edit(data)
+    with pytest.raises(KnowledgeBaseError, match=message):
+        validate_source(data)
+
+
+def test_bad_snapshot_files(tmp_path):
+    empty = tmp_path / "empty.snapshot"
+    empty.write_bytes(b"")
+    junk = tmp_path / "junk.snapshot"
+    junk.write_bytes(b"not a snapshot")
+    for path in (empty, junk):
+        with pytest.raises(KnowledgeBaseError):
+            KnowledgeBase(str(path))
+
+
+def test_store_follows_source_edits(kb_files):
+    source, snapshot = kb_files
+    store = KnowledgeBaseStore(source, snapshot, reload_seconds=0)
+    old = store.current()
+    assert old.table.risk_for("CODEINE", "NM")[0] == "Safe"
+
+    _write(source, _bumped())
+    new = store.current()
+    assert new.version == "2.0.0"
+    assert new.table.risk_for("CODEINE", "NM")[0] == "Toxic"
+    assert store.reloads == 1
+    # Requests holding the old snapshot keep reading it
+    assert old.table.risk_for("CODEINE", "NM")[0] == "Safe"
+
+
+def test_store_picks_up_snapshots_from_other_workers(kb_files):
+    source, snapshot = kb_files
+    store = KnowledgeBaseStore(source, snapshot, reload_seconds=0)
+    store.current()
+    # Published by another worker or the CLI, source unchanged on this host
+    compile_snapshot(_bumped("3.0.0"), snapshot)
+    assert store.current().version == "3.0.0"
+
+
+def test_broken_source_keeps_the_current_version(kb_files):
+    source, snapshot = kb_files
+    store = KnowledgeBaseStore(source, snapshot, reload_seconds=0)
+    tag = store.current().tag
+    with open(source, "w") as f:
+        f.write("{ not json")
+    assert store.current().tag == tag
+    assert store.reload_errors == 1
+    with pytest.raises(KnowledgeBaseError):
+        store.reload()
+
+
+def test_corrupt_snapshot_is_rebuilt(kb_files):
+    source, snapshot = kb_files
+    compile_snapshot(SOURCE, snapshot)
+    with open(snapshot, "r+b") as f:
+        f.write(b"garbage!")
+    store = KnowledgeBaseStore(source, snapshot, reload_seconds=0)
+    assert store.current().version == SOURCE["version"]
+    assert KnowledgeBase(snapshot).version == SOURCE["version"]
+
+
+def test_reload_endpoint_is_admin_only(client, kb_files, monkeypatch):
+    source, snapshot = kb_files
+    monkeypatch.setattr(knowledge_base, "knowledge_base", KnowledgeBaseStore(source, snapshot, 60))
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", {"admin@example.com"})
+    _write(source, _bumped("4.0.0"))
+
+    # No user store: tokens are unverified, so even an admin's is refused
+    assert client.post("/knowledge-base/reload", headers=auth_header("admin@example.com")).status_code == 403
+    monkeypatch.setattr(database.db, "db", {"users": None})
+
+    assert client.post("/knowledge-base/reload").status_code == 401
+    assert client.post("/knowledge-base/reload", headers=auth_header("alice@example.com")).status_code == 403
+    response = client.post("/knowledge-base/reload", headers=auth_header("Admin@example.com"))
+    assert response.status_code == 200
+    assert response.json()["version"].startswith("4.0.0+")
+    assert "snapshot" not in response.json()
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app import llm_engine
+from app.explanation_cache import ExplanationCache, TTLCache
+from app.llm_engine import CircuitBreaker
+
+
+class _Clock:
+    # Stands in for the time module inside llm_engine only
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_engine, "time", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed trial re-opens it for another full period
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def _result(drug):
+    return {"drug": drug, "gene": "CYP2C19", "phenotype": "PM", "variants": []}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(llm_engine, "LLM_ENABLED", True)
+    monkeypatch.setattr(llm_engine, "LLM_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(llm_engine, "breaker", CircuitBreaker(2, 30))
+    monkeypatch.setattr(llm_engine, "explanation_cache", ExplanationCache(TTLCache(64, 60)))
+
+
+def test_timeouts_fall_back_and_open_the_breaker(llm, monkeypatch):
+    calls = []
+
+    async def hang(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(llm_engine, "_generate", hang)
+    for drug in ("codeine", "warfarin"):
+        (explanation,) = asyncio.run(llm_engine.safe_generate_explanations([_result(drug)]))
+        assert explanation["mechanism"] == "Fallback explanation due to LLM timeout."
+    assert llm_engine.breaker.state == "open"
+
+    # Open breaker: no call is made at all
+    (explanation,) = asyncio.run(llm_engine.safe_generate_explanations([_result("clopidogrel")]))
+    assert explanation["mechanism"] == "LLM explanation temporarily unavailable."
+    assert len(calls) == 2
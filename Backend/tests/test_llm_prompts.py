@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import pytest
+
+from app import llm_engine
+from app.explanation_cache import ExplanationCache, TTLCache
+from app.vcf_parser import Variant
+
+
+def _result(drug, gene="CYP2C19", phenotype="IM", variants=()):
+    return {"drug": drug, "gene": gene, "phenotype": phenotype, "variants": list(variants)}
+
+
+STAR2 = Variant("rs4244285", "CYP2C19", "*2", "10", 94781859, 1)
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    # Fake Gemini: records each prompt's items and answers from `reply`
+    calls = []
+
+    async def generate(prompt):
+        items = json.loads(prompt[len(llm_engine.PROMPT_HEADER):])
+        calls.append(items)
+        return _Response(json.dumps(generate.reply(items)))
+
+    generate.reply = lambda items: {
+        item_id: {"summary": f"about {item['drug']}", "mechanism": "m", "citations": ["CPIC"]}
+        for item_id, item in items.items()
+    }
+    monkeypatch.setattr(llm_engine, "LLM_ENABLED", True)
+    monkeypatch.setattr(llm_engine, "_generate", generate)
+    monkeypatch.setattr(llm_engine, "breaker", llm_engine.CircuitBreaker(5, 30))
+    monkeypatch.setattr(llm_engine, "explanation_cache", ExplanationCache(TTLCache(64, 60)))
+    generate.calls = calls
+    return generate
+
+
+# ==============================
+# PROMPT PLANNING
+# ==============================
+def test_prompt_item_is_compact():
+    item = llm_engine.prompt_item(_result("clopidogrel", variants=[STAR2, STAR2]))
+    assert item == {"drug": "clopidogrel", "gene": "CYP2C19", "phenotype": "IM", "variants": ["rs4244285:*2"]}
+    prompt = llm_engine.build_prompt({"CLOPIDOGREL": item})
+    assert prompt.startswith(llm_engine.PROMPT_HEADER)
+    assert ", " not in prompt[len(llm_engine.PROMPT_HEADER):]
+
+
+def test_plan_prompts_packs_one_chunk_under_budget():
+    entries = [(f"k{i}", _result(d)) for i, d in enumerate(["codeine", "warfarin", "clopidogrel"])]
+    chunks = llm_engine.plan_prompts(entries)
+    assert len(chunks) == 1
+    assert list(chunks[0]) == ["CODEINE", "WARFARIN", "CLOPIDOGREL"]
+    assert chunks[0]["WARFARIN"] == entries[1]
+
+
+def test_plan_prompts_suffixes_repeated_drugs():
+    entries = [(f"k{i}", _result("codeine", phenotype=p)) for i, p in enumerate(["PM", "IM", "NM"])]
+    (chunk,) = llm_engine.plan_prompts(entries)
+    assert list(chunk) == ["CODEINE", "CODEINE.2", "CODEINE.3"]
+
+
+def test_plan_prompts_splits_over_budget():
+    entries = [(f"k{i}", _result("codeine", phenotype=str(i))) for i in range(10)]
+    header = llm_engine.estimate_tokens(llm_engine.PROMPT_HEADER)
+    # Room for about three items per chunk
+    budget = header + 3 * (llm_engine.LLM_OUTPUT_TOKENS_PER_ITEM + 30)
+    chunks = llm_engine.plan_prompts(entries, budget)
+    assert [len(c) for c in chunks] == [3, 3, 3, 1]
+    assert [key for c in chunks for key, _ in c.values()] == [k for k, _ in entries]
+
+
+def test_plan_prompts_gives_oversized_item_its_own_chunk():
+    entries = [("a", _result("codeine")), ("b", _result("warfarin"))]
+    chunks = llm_engine.plan_prompts(entries, budget=1)
+    assert [list(c) for c in chunks] == [["CODEINE"], ["WARFARIN"]]
+
+
+# ==============================
+# RESPONSE PARSING
+# ==============================
+def test_parse_response_strips_code_fences():
+    assert llm_engine._parse_response('```json\n{"A": 1}\n```') == {"A": 1}
+    assert llm_engine._parse_response('```\n{"A": 1}\n```') == {"A": 1}
+    with pytest.raises(ValueError):
+        llm_engine._parse_response("[1, 2]")
+
+
+def test_explanation_validates_items():
+    assert llm_engine._explanation(None) is None
+    assert llm_engine._explanation({"mechanism": "no summary"}) is None
+    assert llm_engine._explanation({"summary": "s", "citations": "CPIC"}) == {
+        "summary": "s", "mechanism": "Mechanism unavailable.", "citations": ["Gemini AI", "CPIC guidelines"]
+    }
+
+
+# ==============================
+# BATCHED CALLS
+# ==============================
+def test_one_call_explains_every_drug(gemini):
+    results = [_result(d, variants=[STAR2]) for d in ["clopidogrel", "codeine", "warfarin"]]
+    explanations = asyncio.run(llm_engine.safe_generate_explanations(results))
+
+    assert len(gemini.calls) == 1
+    assert [e["summary"] for e in explanations] == ["about clopidogrel", "about codeine", "about warfarin"]
+
+    # Served from the cache afterwards
+    asyncio.run(llm_engine.safe_generate_explanations(results))
+    assert len(gemini.calls) == 1
+
+
+def test_missing_items_fall_back_and_are_retried(gemini):
+    results = [_result("clopidogrel"), _result("codeine")]
+    gemini.reply = lambda items: {"CLOPIDOGREL": {"summary": "ok", "mechanism": "m", "citations": []}}
+
+    first = asyncio.run(llm_engine.safe_generate_explanations(results))
+    assert first[0]["summary"] == "ok"
+    assert first[1]["mechanism"] == "Fallback explanation, item missing from LLM response."
+
+    asyncio.run(llm_engine.safe_generate_explanations(results))
+    assert list(gemini.calls[1]) == ["CODEINE"]
+
+
+def test_bad_response_falls_back_for_the_chunk(gemini, monkeypatch):
+    async def broken(prompt):
+        return _Response("not json")
+
+    monkeypatch.setattr(llm_engine, "_generate", broken)
+    explanations = asyncio.run(llm_engine.safe_generate_explanations([_result("codeine"), _result("warfarin")]))
+    assert [e["mechanism"] for e in explanations] == ["Fallback explanation due to LLM error."] * 2
+    assert llm_engine.breaker.failures == 1
+
+
+def test_disabled_llm_uses_fallback(monkeypatch):
+    monkeypatch.setattr(llm_engine, "LLM_ENABLED", False)
+    (explanation,) = asyncio.run(llm_engine.safe_generate_explanations([_result("codeine")]))
+    assert explanation["mechanism"] == "LLM explanation unavailable (API Key missing)."
+    assert asyncio.run(llm_engine.safe_generate_explanations([])) == []
@@ -0,0 +1,82 @@
+from app import main, metrics
+from app.metrics import Counter, Histogram, StageTimer
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\n"
+)
+HEADERS = auth_header("alice@example.com")
+
+
+def _sample(text: str, series: str) -> float:
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == series:
+            return float(value)
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("h", "Help text", (1, 5), ["stage"])
+    for value in (0.5, 3, 3, 7):
+        histogram.observe(value, stage="parse")
+    assert histogram.render() == [
+        "# HELP h Help text",
+        "# TYPE h histogram",
+        'h_bucket{stage="parse",le="1"} 1',
+        'h_bucket{stage="parse",le="5"} 3',
+        'h_bucket{stage="parse",le="+Inf"} 4',
+        'h_sum{stage="parse"} 13.5',
+        'h_count{stage="parse"} 4',
+    ]
+
+
+def test_counter_and_collectors(monkeypatch):
+    counter = Counter("c_total", "Help text", ["reason"])
+    counter.inc(reason="timeout")
+    counter.inc(2, reason="timeout")
+    assert counter.render()[-1] == 'c_total{reason="timeout"} 3'
+
+    def broken():
+        raise RuntimeError("collector failed")
+
+    monkeypatch.setattr(metrics, "_collectors", [broken, lambda: ["extra 1"]])
+    # One failing collector doesn't cost the rest of the scrape
+    assert metrics.render_metrics().splitlines()[-1] == "extra 1"
+
+
+def test_stage_timer_records_each_stage():
+    timer = StageTimer()
+    with timer.stage("parse"):
+        pass
+    try:
+        with timer.stage("llm"):
+            raise ValueError
+    except ValueError:
+        pass
+    assert [name for name, _ in timer.stages] == ["parse", "llm"]
+    assert timer.server_timing().startswith("parse;dur=") and ", llm;dur=" in timer.server_timing()
+
+
+def test_analyze_is_instrumented(client, monkeypatch):
+    monkeypatch.setattr(main, "SERVER_TIMING_ENABLED", True)
+    before = client.get("/metrics").text
+
+    response = client.post(
+        "/analyze", data={"drug": "CLOPIDOGREL"}, files={"vcf_file": ("p.vcf", VCF)}, headers=HEADERS
+    )
+    assert response.status_code == 200
+    stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert stages[:2] == ["validate", "parse"] and stages[-1] == "serialize"
+
+    after = client.get("/metrics").text
+    for series in (
+        'pharmaguard_analyze_stage_seconds_count{stage="parse"}',
+        'pharmaguard_analyze_request_seconds_count{outcome="ok"}',
+        "pharmaguard_upload_bytes_count",
+        "pharmaguard_variants_per_file_count",
+        'pharmaguard_llm_fallbacks_total{reason="no_api_key"}',
+    ):
+        assert _sample(after, series) == _sample(before, series) + 1, series
@@ -0,0 +1,42 @@
+import json
+import re
+
+import pytest
+from pydantic import TypeAdapter
+
+from app.models import AnalyzeResponse, FullResponse
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT\t1/1\n"
+    b"22\t42128945\trs3892097\tC\tT\t50\tPASS\tGENE=CYP2D6;STAR=*4\tGT\t0/1\n"
+)
+HEADERS = auth_header("alice@example.com")
+
+
+def _analyze(client, **data):
+    return client.post(
+        "/analyze", data={"drug": "CLOPIDOGREL,CODEINE", **data},
+        files={"vcf_file": ("p.vcf", VCF)}, headers=HEADERS
+    )
+
+
+@pytest.mark.parametrize("data", [{}, {"multi_drug": "true"}, {"multi_drug": "true", "defer_explanation": "true"}])
+def test_analyze_output_matches_the_response_model(client, data):
+    response = _analyze(client, **data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    body = response.json()
+    parsed = TypeAdapter(AnalyzeResponse).validate_python(body, strict=True)
+    # Nothing in the output that the model doesn't describe
+    items = parsed if isinstance(parsed, list) else [parsed]
+    assert [i.model_dump(exclude_none=True) for i in items] == (body if isinstance(body, list) else [body])
+
+
+def test_openapi_documents_the_response_model(client):
+    schema = client.get("/openapi.json").json()
+    response = schema["paths"]["/analyze"]["post"]["responses"]["200"]["content"]["application/json"]["schema"]
+    # One object or a list of them
+    assert re.findall(r"#/components/schemas/(\w+)", json.dumps(response)) == [FullResponse.__name__] * 2
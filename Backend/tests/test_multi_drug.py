@@ -0,0 +1,84 @@
+import copy
+import io
+
+import pytest
+
+from app import analysis
+from app.analysis import UnsupportedDrugError, analyze_drugs, parse_drug_list
+from app.knowledge_base import KNOWLEDGE_BASE_PATH, KnowledgeBase, compile_snapshot, load_source
+from app.vcf_parser import read_variants
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT\t1/1\n"
+    b"22\t42128945\trs3892097\tC\tT\t50\tPASS\tGENE=CYP2D6;STAR=*4\tGT\t0/1\n"
+    b"10\t94942290\trs1799853\tC\tT\t50\tPASS\tGENE=CYP2C9;STAR=*2\tGT\t0/0\n"
+)
+HEADERS = auth_header("alice@example.com")
+FIELDS = ("drug", "risk_assessment", "pharmacogenomic_profile", "clinical_recommendation")
+
+
+@pytest.fixture
+def shared_gene_kb(tmp_path):
+    # Two drugs on CYP2C19, which the shipped rules don't have
+    data = copy.deepcopy(load_source(KNOWLEDGE_BASE_PATH))
+    data["drug_rules"]["VORICONAZOLE"] = copy.deepcopy(data["drug_rules"]["CLOPIDOGREL"])
+    path = str(tmp_path / "kb.snapshot")
+    compile_snapshot(data, path)
+    return KnowledgeBase(path)
+
+
+def test_parse_drug_list():
+    assert parse_drug_list(" codeine, Warfarin,,CODEINE ") == ["CODEINE", "WARFARIN"]
+    assert parse_drug_list(" , ") == []
+
+
+def test_each_gene_is_profiled_once(shared_gene_kb, monkeypatch):
+    calls = []
+    profile_gene = analysis.profile_gene
+    monkeypatch.setattr(analysis, "profile_gene", lambda *a: calls.append(a[2]) or profile_gene(*a))
+
+    variants = read_variants(io.BytesIO(VCF))
+    results = analyze_drugs(variants, ["CLOPIDOGREL", "VORICONAZOLE", "CODEINE"], shared_gene_kb)
+    assert sorted(calls) == ["CYP2C19", "CYP2D6"]
+    assert [(r["drug"], r["diplotype"], r["phenotype"]) for r in results] == [
+        ("CLOPIDOGREL", "*2/*2", "PM"), ("VORICONAZOLE", "*2/*2", "PM"), ("CODEINE", "*4/*1", "IM")
+    ]
+
+
+def test_hom_ref_calls_count_as_data_but_not_variants():
+    (result,) = analyze_drugs(read_variants(io.BytesIO(VCF)), ["WARFARIN"])
+    assert (result["diplotype"], result["phenotype"], result["variants"]) == ("*1/*1", "NM", [])
+    (missing,) = analyze_drugs(read_variants(io.BytesIO(VCF)), ["SIMVASTATIN"])
+    assert (missing["phenotype"], missing["risk"]) == ("Indeterminate", "Unknown")
+
+
+def test_unsupported_drug():
+    with pytest.raises(UnsupportedDrugError):
+        analyze_drugs(read_variants(io.BytesIO(VCF)), ["CODEINE", "ASPIRIN"])
+
+
+def _analyze(client, drug, multi_drug):
+    return client.post(
+        "/analyze", data={"drug": drug, "multi_drug": str(multi_drug).lower(), "patient_id": "P1"},
+        files={"vcf_file": ("p.vcf", VCF)}, headers=HEADERS
+    )
+
+
+def test_multi_drug_response_matches_single_drug_calls(client):
+    response = _analyze(client, "codeine,clopidogrel,warfarin,codeine", True)
+    assert response.status_code == 200
+    assessments = response.json()
+    assert [a["drug"] for a in assessments] == ["CODEINE", "CLOPIDOGREL", "WARFARIN"]
+    for assessment in assessments:
+        single = _analyze(client, assessment["drug"], False).json()
+        for field in FIELDS:
+            assert assessment[field] == single[field], (assessment["drug"], field)
+
+
+def test_single_mode_keeps_the_first_drug(client):
+    assert _analyze(client, "codeine,warfarin", False).json()["drug"] == "CODEINE"
+    assert _analyze(client, "codeine,aspirin", True).status_code == 400
+    assert _analyze(client, " , ", True).status_code == 400
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+import pytest
+
+from app import auth, database
+
+
+class _Users:
+    def __init__(self):
+        self.docs = []
+
+    async def find_one(self, query, projection=None):
+        return next((d for d in self.docs if d["email"] == query["email"]), None)
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+@pytest.fixture
+def fast_bcrypt(monkeypatch):
+    # Minimum work factor; the context is rebuilt so the setting applies
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(auth, "_dummy_hash", None)
+    auth.get_pwd_context.cache_clear()
+    yield
+    auth.get_pwd_context.cache_clear()
+
+
+@pytest.fixture
+def users(monkeypatch, fast_bcrypt):
+    users = _Users()
+    monkeypatch.setattr(database.db, "db", {"users": users})
+    return users
+
+
+def test_work_factor_is_configurable(fast_bcrypt, monkeypatch):
+    low = auth.get_password_hash("s3cret")
+    assert low.startswith("$2b$04$")
+
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    auth.get_pwd_context.cache_clear()
+    assert auth.get_password_hash("s3cret").startswith("$2b$05$")
+    # Hashes made under the old factor still verify
+    assert auth.verify_password("s3cret", low)
+    assert not auth.verify_password("wrong", low)
+
+
+def test_hashing_runs_off_the_event_loop(fast_bcrypt, monkeypatch):
+    threads = []
+    hash_password = auth.get_password_hash
+
+    def recording_hash(password):
+        threads.append(threading.current_thread().name)
+        return hash_password(password)
+
+    monkeypatch.setattr(auth, "get_password_hash", recording_hash)
+
+    async def run():
+        hashed = await auth.get_password_hash_async("s3cret")
+        return await auth.verify_password_async("s3cret", hashed)
+
+    assert asyncio.run(run())
+    assert threads[0].startswith("bcrypt") and threads[0] != threading.main_thread().name
+
+
+def test_signup_then_login(client, users):
+    account = {"email": "alice@example.com", "password": "s3cret"}
+    assert client.post("/auth/signup", json=account).status_code == 200
+    assert users.docs[0]["hashed_password"].startswith("$2b$04$")
+    assert client.post("/auth/signup", json=account).status_code == 400
+
+    assert client.post("/auth/login", json=account).json()["token_type"] == "bearer"
+    assert client.post("/auth/login", json={**account, "password": "nope"}).status_code == 401
+    # Unknown accounts are still checked against a hash, so they take as long
+    assert client.post("/auth/login", json={**account, "email": "bob@example.com"}).status_code == 401
+    assert auth._dummy_hash is not None
@@ -0,0 +1,189 @@
+import asyncio
+import time
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from app import persistence
+from app.analysis import InvalidPatientIdError, resolve_patient_id, with_patient_id
+from app.persistence import ANALYSES_COLLECTION, AnalysisWriter, analysis_document
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\n"
+)
+HEADERS = auth_header("alice@example.com")
+
+
+def _assessment(patient_id="P1"):
+    return {
+        "patient_id": patient_id,
+        "drug": "CLOPIDOGREL",
+        "timestamp": "2026-01-02T03:04:05Z",
+        "risk_assessment": {"risk_label": "Adjust Dosage"},
+        "pharmacogenomic_profile": {"primary_gene": "CYP2C19", "diplotype": "*1/*2", "phenotype": "IM"}
+    }
+
+
+class _Collection:
+    def __init__(self, fail=None):
+        self.docs = []
+        self.fail = fail
+
+    async def insert_many(self, docs, ordered=True):
+        if self.fail is not None:
+            error, self.fail = self.fail, None
+            raise error
+        self.docs.extend(docs)
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = _Collection()
+    monkeypatch.setattr(persistence.db, "db", {ANALYSES_COLLECTION: collection})
+    return collection
+
+
+# ==============================
+# PATIENT IDS
+# ==============================
+def test_resolve_patient_id():
+    assert resolve_patient_id("  MRN-42 ") == "MRN-42"
+    generated = resolve_patient_id(None)
+    assert len(generated) == 36 and generated != resolve_patient_id("")
+    with pytest.raises(InvalidPatientIdError):
+        resolve_patient_id("x" * 129)
+
+
+def test_with_patient_id_copies():
+    cached = [_assessment("old")]
+    copy, = with_patient_id(cached, "new", "2026-02-03T00:00:00Z")
+    assert (copy["patient_id"], copy["timestamp"]) == ("new", "2026-02-03T00:00:00Z")
+    assert cached[0]["patient_id"] == "old" and cached[0]["timestamp"] == "2026-01-02T03:04:05Z"
+
+
+def test_analyze_uses_the_given_patient_id(client):
+    def analyze(patient_id=None):
+        data = {"drug": "CLOPIDOGREL"}
+        if patient_id is not None:
+            data["patient_id"] = patient_id
+        return client.post("/analyze", data=data, files={"vcf_file": ("p.vcf", VCF)}, headers=HEADERS)
+
+    assert analyze("MRN-1").json()["patient_id"] == "MRN-1"
+    # Second upload is a cache hit, stamped with its own patient
+    assert analyze("MRN-2").json()["patient_id"] == "MRN-2"
+    assert analyze().json()["patient_id"] not in ("MRN-1", "MRN-2")
+    assert analyze("x" * 200).status_code == 400
+
+
+def test_cache_hits_are_saved_with_their_own_timestamp(client, monkeypatch):
+    from app import main
+
+    saved = []
+    monkeypatch.setattr(
+        main.analysis_writer, "submit", lambda assessments, owner: saved.extend((a, owner) for a in assessments)
+    )
+
+    def analyze(patient_id):
+        data = {"drug": "CLOPIDOGREL", "patient_id": patient_id}
+        return client.post("/analyze", data=data, files={"vcf_file": ("p.vcf", VCF)}, headers=HEADERS).json()
+
+    first = analyze("MRN-1")
+    time.sleep(0.001)
+    second = analyze("MRN-2")
+    assert second["timestamp"] > first["timestamp"]
+    assert [(a["patient_id"], a["timestamp"], owner) for a, owner in saved] == [
+        ("MRN-1", first["timestamp"], "alice@example.com"), ("MRN-2", second["timestamp"], "alice@example.com")
+    ]
+
+
+# ==============================
+# BATCHED WRITER
+# ==============================
+def test_analysis_document_lifts_queried_fields():
+    doc = analysis_document(_assessment(), "alice@example.com")
+    assert (doc["owner"], doc["patient_id"], doc["drug"], doc["gene"], doc["risk_label"]) == (
+        "alice@example.com", "P1", "CLOPIDOGREL", "CYP2C19", "Adjust Dosage"
+    )
+    assert doc["timestamp"].isoformat() == "2026-01-02T03:04:05"
+    assert doc["result"] == _assessment()
+
+
+def test_writer_batches_and_drains_on_stop(collection):
+    async def run():
+        writer = AnalysisWriter(batch_size=2, flush_seconds=60, max_queued=100)
+        writer.start()
+        writer.submit([_assessment("P0")])
+        await asyncio.sleep(0.01)
+        # Below a batch: waits for the timer
+        before_batch = len(collection.docs)
+        writer.submit([_assessment("P1"), _assessment("P2")])
+        await asyncio.sleep(0.01)
+        # A full batch wakes the writer at once
+        after_batch = len(collection.docs)
+        writer.submit([_assessment("P3")])
+        await writer.stop()
+        return before_batch, after_batch, writer.stats()
+
+    before_batch, after_batch, stats = asyncio.run(run())
+    assert (before_batch, after_batch) == (0, 3)
+    assert [d["patient_id"] for d in collection.docs] == ["P0", "P1", "P2", "P3"]
+    assert stats["written"] == 4 and stats["queued"] == 0
+
+
+def test_writer_drops_when_full(collection):
+    async def run():
+        writer = AnalysisWriter(batch_size=100, flush_seconds=60, max_queued=2)
+        writer.start()
+        writer.submit([_assessment(f"P{i}") for i in range(5)])
+        await writer.stop()
+        return writer.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["written"], stats["dropped"]) == (2, 3)
+
+
+def test_failed_batch_is_retried(collection):
+    collection.fail = RuntimeError("primary stepped down")
+
+    async def run():
+        writer = AnalysisWriter(batch_size=2, flush_seconds=0.01, max_queued=100)
+        writer.start()
+        writer.submit([_assessment("P1"), _assessment("P2")])
+        await asyncio.sleep(0.05)
+        await writer.stop()
+        return writer.stats()
+
+    stats = asyncio.run(run())
+    assert stats["failed_batches"] == 1
+    assert stats["written"] == 2
+    assert [d["patient_id"] for d in collection.docs] == ["P1", "P2"]
+
+
+def test_bulk_write_errors_are_not_retried(collection):
+    collection.fail = BulkWriteError({
+        "nInserted": 1,
+        "writeErrors": [{"code": 11000}, {"code": 121}]
+    })
+
+    async def run():
+        writer = AnalysisWriter(batch_size=3, flush_seconds=60, max_queued=100)
+        writer.start()
+        writer.submit([_assessment(f"P{i}") for i in range(3)])
+        await writer.stop()
+        return writer.stats()
+
+    stats = asyncio.run(run())
+    # The duplicate was already stored; the invalid document is dropped
+    assert (stats["written"], stats["dropped"], stats["queued"]) == (1, 1, 0)
+    assert collection.docs == []
+
+
+def test_writer_is_off_without_a_database(monkeypatch):
+    monkeypatch.setattr(persistence.db, "db", None)
+    writer = AnalysisWriter(batch_size=2, flush_seconds=60, max_queued=100)
+    writer.start()
+    writer.submit([_assessment()])
+    assert writer.stats() == {"enabled": False, "queued": 0, "written": 0, "dropped": 0, "failed_batches": 0}
@@ -0,0 +1,81 @@
+import pytest
+
+from app import main
+from app.result_cache import make_etag, parse_if_none_match, result_key
+
+from conftest import auth_header
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT\t0/1\n"
+)
+ALICE = auth_header("alice@example.com")
+BOB = auth_header("bob@example.com")
+
+
+@pytest.fixture
+def analyses(monkeypatch):
+    # Counts how often the pipeline actually runs
+    calls = []
+    analyze_drugs = main.analyze_drugs
+
+    def counting(*args, **kwargs):
+        calls.append(args[1])
+        return analyze_drugs(*args, **kwargs)
+
+    monkeypatch.setattr(main, "analyze_drugs", counting)
+    return calls
+
+
+def _analyze(client, headers, drug="CLOPIDOGREL", vcf=VCF, **extra_headers):
+    files = {"vcf_file": ("p.vcf", vcf, "text/plain")} if vcf is not None else None
+    return client.post(
+        "/analyze", data={"drug": drug}, files=files, headers={**headers, **extra_headers}
+    )
+
+
+def test_etag_round_trip():
+    etag = make_etag("a" * 64, "single:CLOPIDOGREL", "rules1")
+    assert parse_if_none_match(f'W/{etag}, "junk", *') == [(etag, "a" * 64)]
+    assert result_key("h", "p", "r", "alice") != result_key("h", "p", "r", "bob")
+
+
+def test_same_upload_is_served_from_cache(client, analyses):
+    first = _analyze(client, ALICE)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    second = _analyze(client, ALICE)
+    assert second.status_code == 200
+    assert second.headers["ETag"] == etag
+    assert second.json()["risk_assessment"] == first.json()["risk_assessment"]
+    assert len(analyses) == 1
+
+    # Another panel is another entry
+    assert _analyze(client, ALICE, drug="CODEINE").headers["ETag"] != etag
+    assert len(analyses) == 2
+
+
+def test_matching_etag_with_upload_is_not_modified(client, analyses):
+    etag = _analyze(client, ALICE).headers["ETag"]
+    response = _analyze(client, ALICE, **{"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_etag_only_request_is_scoped_to_its_user(client, analyses):
+    etag = _analyze(client, ALICE).headers["ETag"]
+    # Same hash, different panel, so not a 304: the cached body comes back
+    stale = etag.replace(etag.split(".")[2], 'stale"')
+
+    mine = _analyze(client, ALICE, vcf=None, **{"If-None-Match": etag})
+    assert mine.status_code == 304
+
+    cached = _analyze(client, ALICE, vcf=None, **{"If-None-Match": stale})
+    assert cached.status_code == 200
+    assert cached.headers["ETag"] == etag
+    assert len(analyses) == 1
+
+    # Bob knows the hash but never uploaded the file
+    assert _analyze(client, BOB, vcf=None, **{"If-None-Match": stale}).status_code == 412
+    assert _analyze(client, ALICE, vcf=None).status_code == 400
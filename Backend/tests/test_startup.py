@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+from app import warmup
+
+from conftest import BACKEND_DIR
+
+HEAVY_MODULES = ("google.genai", "motor", "pymongo", "bson", "passlib", "numpy")
+
+
+def test_importing_the_app_skips_heavy_modules():
+    # A fresh interpreter, since this test process has imported everything
+    env = {k: v for k, v in os.environ.items() if k not in ("GEMINI_API_KEY", "MONGODB_URL")}
+    code = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_warm_up_times_each_phase(monkeypatch):
+    from app.auth import get_pwd_context
+
+    monkeypatch.setattr(warmup, "STARTUP_TIMINGS", {})
+    get_pwd_context.cache_clear()
+    warmup.warm_up()
+
+    assert set(warmup.STARTUP_TIMINGS) == {
+        "warmup", "warmup_annotation_index", "warmup_decision_tables", "warmup_parser", "warmup_password_context"
+    }
+    assert all(seconds >= 0 for seconds in warmup.STARTUP_TIMINGS.values())
+    assert get_pwd_context.cache_info().currsize == 1
+
+
+def test_startup_timings_are_exported(client):
+    text = client.get("/metrics").text
+    assert 'pharmaguard_startup_seconds{phase="import"}' in text
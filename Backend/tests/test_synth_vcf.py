@@ -0,0 +1,68 @@
+import gzip
+import struct
+
+import pytest
+
+from app.bgzf import inflate_stream
+from app.vcf_parser import read_cohort, read_variants
+from benchmarks.synth_vcf import BGZF_EOF, gene_windows, load_star_sites, write_vcf
+
+
+def _records(text: bytes):
+    return [line.split("\t") for line in text.decode("ascii").splitlines() if not line.startswith("#")]
+
+
+def test_same_seed_same_file(tmp_path):
+    paths = [tmp_path / name for name in ("a.vcf", "b.vcf", "c.vcf")]
+    write_vcf(str(paths[0]), 2000, seed=1)
+    write_vcf(str(paths[1]), 2000, seed=1)
+    write_vcf(str(paths[2]), 2000, seed=2)
+    assert paths[0].read_bytes() == paths[1].read_bytes() != paths[2].read_bytes()
+
+
+def test_records_are_sorted_and_hit_the_gene_windows(tmp_path):
+    path = tmp_path / "a.vcf"
+    write_vcf(str(path), 5000, pgx_density=0.5, samples=0)
+    records = _records(path.read_bytes())
+    # Random positions can collide, so a few records may be merged away
+    assert 4900 <= len(records) <= 5000
+
+    positions = [(int(r[0]), int(r[1])) for r in records]
+    assert positions == sorted(positions)
+
+    windows = gene_windows()
+    inside = sum(any(s <= int(r[1]) < e for s, e in windows.get(r[0], [])) for r in records)
+    assert inside / len(records) == pytest.approx(0.5, abs=0.05)
+
+    rsids = {r[2] for r in records}
+    assert {site[1] for sites in load_star_sites().values() for site in sites} <= rsids
+
+
+def test_compressed_outputs_decode_to_the_same_vcf(tmp_path):
+    plain, gz, bgzf = (tmp_path / name for name in ("a.vcf", "a.vcf.gz", "a.vcf.bgz"))
+    for path, compression in ((plain, "none"), (gz, "gzip"), (bgzf, "bgzf")):
+        write_vcf(str(path), 20000, samples=3, compression=compression)
+
+    expected = plain.read_bytes()
+    assert gzip.decompress(gz.read_bytes()) == expected
+    raw = bgzf.read_bytes()
+    assert b"".join(inflate_stream(iter([raw]))) == expected
+
+    # Well-formed BGZF: every block's BSIZE field lands on the next block,
+    # and the file ends in the empty EOF block
+    offset, blocks = 0, 0
+    while offset < len(raw):
+        assert raw[offset:offset + 4] == b"\x1f\x8b\x08\x04" and raw[offset + 12:offset + 14] == b"BC"
+        offset += struct.unpack_from("<H", raw, offset + 16)[0] + 1
+        blocks += 1
+    assert offset == len(raw) and blocks > 2 and raw.endswith(BGZF_EOF)
+
+    with open(bgzf, "rb") as f:
+        assert read_variants(f)
+    with open(bgzf, "rb") as f:
+        assert len(read_cohort(f).samples) == 3
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        write_vcf(str(tmp_path / "a.vcf"), 10, compression="zstd")
@@ -0,0 +1,40 @@
+import io
+
+from app.analysis import quality_metrics
+from app.vcf_parser import Variant, VariantCalls, parse_vcf_line, read_variants
+
+VCF = (
+    b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+    b"22\t42128945\trs3892097\tC\tT\t50\tPASS\tGENE=CYP2D6;STAR=*4\tGT\t0/1\n"
+    b"10\t94781859\trs4244285\tG\tA\t50\tPASS\tGENE=CYP2C19;STAR=*2\tGT\t1/1\n"
+    b"22\t42130692\trs1065852\tG\tA\t50\tPASS\tGENE=CYP2D6;STAR=*10\tDP\t30\n"
+)
+
+
+def test_records_are_compact_tuples():
+    variant = parse_vcf_line("chr22 42128945 rs3892097 C T 50 PASS GENE=CYP2D6;STAR=*4 GT 1|1")
+    assert variant == Variant("rs3892097", "CYP2D6", "*4", "chr22", 42128945, 2)
+    assert not hasattr(variant, "__dict__")
+
+    # Repeated values share one string object, even when built separately
+    gene = "".join(["CYP", "2D6"])
+    other = parse_vcf_line(f"chr22\t42130692\trs1065852\tG\tA\t50\tPASS\tGENE={gene};STAR=*10")
+    assert other.gene is variant.gene and other.chromosome is variant.chromosome
+    assert other.dosage is None
+
+
+def test_position_is_reported_as_a_string():
+    variant = Variant("rs1", "CYP2D6", "*4", "22", 42128945)
+    assert variant.detected() == {"rsid": "rs1", "gene": "CYP2D6", "chromosome": "22", "position": "42128945"}
+
+
+def test_calls_are_grouped_by_gene_at_parse_time():
+    calls = read_variants(io.BytesIO(VCF))
+    assert isinstance(calls, VariantCalls) and len(calls) == 3
+    assert list(calls.by_gene) == ["CYP2D6", "CYP2C19"]
+    assert [v.rsid for v in calls.gene("CYP2D6")] == ["rs3892097", "rs1065852"]
+    assert calls.gene("TPMT") == []
+    assert [v.rsid for v in calls] == ["rs3892097", "rs1065852", "rs4244285"]
+    assert quality_metrics(calls) == {
+        "vcf_parsing_success": True, "variants_detected": 3, "genes_identified": ["CYP2D6", "CYP2C19"]
+    }
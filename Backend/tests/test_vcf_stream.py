@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import io
+import os
+
+import pytest
+
+from app import vcf_parser
+from app.vcf_parser import VCFFormatError, iter_vcf_lines, read_variants
+
+from conftest import FIXTURES
+
+PLAIN = gzip.decompress(open(os.path.join(FIXTURES, "indexed.vcf.gz"), "rb").read())
+
+
+def _lines(data: bytes, **kwargs):
+    return list(iter_vcf_lines(io.BytesIO(data), **kwargs))
+
+
+def _calls(data: bytes):
+    return sorted(read_variants(io.BytesIO(data)))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, vcf_parser.CHUNK_SIZE])
+def test_lines_survive_any_chunk_boundary(chunk_size):
+    data = b"##fileformat=VCFv4.2\n#CHROM\tPOS\n22\t1\n22\t2"
+    assert _lines(data, chunk_size=chunk_size) == ["##fileformat=VCFv4.2", "#CHROM\tPOS", "22\t1", "22\t2"]
+
+
+def test_gzip_and_plain_give_the_same_calls():
+    calls = _calls(PLAIN)
+    assert len(calls) == 7
+    assert _calls(gzip.compress(PLAIN)) == calls
+    # Multi-member gzip (what bgzip writes) is read through to the end
+    half = len(PLAIN) // 2
+    assert _calls(gzip.compress(PLAIN[:half]) + gzip.compress(PLAIN[half:])) == calls
+
+
+def test_crlf_line_endings():
+    assert _calls(PLAIN.replace(b"\n", b"\r\n")) == _calls(PLAIN)
+
+
+def test_hasher_sees_the_raw_upload():
+    data = gzip.compress(PLAIN)
+    hasher = hashlib.sha256()
+    read_variants(io.BytesIO(data), hasher=hasher)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_plain_size_cap(monkeypatch):
+    monkeypatch.setattr(vcf_parser, "MAX_VCF_BYTES", 1024)
+    with pytest.raises(VCFFormatError, match="limit"):
+        _calls(PLAIN)
+    # Compressed uploads are measured against their own limit
+    assert len(_calls(gzip.compress(PLAIN))) == 7
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"22\t42128945\trs3892097\tC\tT\t50\tPASS\t.\n",
+    b"#CHROM\tPOS\n22\t1\n",
+    b"\x1f\x8b\x08\x00garbage",
+    gzip.compress(PLAIN)[:200],
+])
+def test_invalid_input(data):
+    with pytest.raises(VCFFormatError):
+        _calls(data)
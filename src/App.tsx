@@ -6,6 +6,7 @@ import DeepDiveConsole from './pages/DeepDiveConsole';
 import LandingPage from './pages/LandingPage';
 import Layout from './components/shared/Layout';
 import SettingsPage from './pages/SettingsPage';
+import AuthPage from './pages/AuthPage';
 import { gsap } from 'gsap';
 
 const App = () => {
@@ -13,6 +14,7 @@ const App = () => {
     <Router>
       <Routes>
         <Route path="/" element={<LandingPage />} />
+        <Route path="/auth" element={<AuthPage />} />
 
         {/* Main App Layout Routes */}
         <Route path="/intake" element={<Layout><IntakeHub /></Layout>} />
@@ -1,8 +1,9 @@
 import React from 'react';
 import Header from './Header'; // Keep Header for status/user context
 import Sidebar from './Sidebar';
-import { useLocation } from 'react-router-dom';
+import { Navigate, useLocation } from 'react-router-dom';
 import ScrollToTop from './ScrollToTop';
+import { isSignedIn } from '../../services/api';
 
 interface LayoutProps {
     children: React.ReactNode;
@@ -13,6 +14,11 @@ interface LayoutProps {
 const Layout: React.FC<LayoutProps> = ({ children }) => {
     const location = useLocation();
 
+    // App pages call protected API routes; sign in first
+    if (!isSignedIn()) {
+        return <Navigate to="/auth" replace />;
+    }
+
     return (
         <div className="flex min-h-screen bg-background text-foreground font-sans relative transition-colors duration-300">
             <ScrollToTop watch={location.pathname} />
@@ -0,0 +1,85 @@
+import React, { useState } from 'react';
+import { useNavigate } from 'react-router-dom';
+import { Activity, Lock, Mail, User } from 'lucide-react';
+import { login, signup } from '../services/api';
+
+const inputClass = "w-full bg-slate-950/50 border border-slate-800 rounded-lg pl-10 pr-4 py-3 text-sm text-white focus:outline-none focus:border-cyan-500/50 focus:bg-slate-900 transition-all hover:border-slate-700";
+
+const AuthPage = () => {
+    const navigate = useNavigate();
+    const [mode, setMode] = useState<'login' | 'signup'>('login');
+    const [email, setEmail] = useState('');
+    const [password, setPassword] = useState('');
+    const [fullName, setFullName] = useState('');
+    const [error, setError] = useState<string | null>(null);
+    const [submitting, setSubmitting] = useState(false);
+
+    const handleSubmit = async (e: React.FormEvent) => {
+        e.preventDefault();
+        setError(null);
+        setSubmitting(true);
+        try {
+            if (mode === 'login') {
+                await login(email, password);
+            } else {
+                await signup(email, password, fullName);
+            }
+            navigate('/intake');
+        } catch (err: any) {
+            const detail = err.response?.data?.detail;
+            setError(typeof detail === 'string' ? detail : err.response ? 'Check your email and password' : 'Unable to reach the server');
+        } finally {
+            setSubmitting(false);
+        }
+    };
+
+    return (
+        <div className="min-h-screen bg-[#020617] text-white font-sans flex items-center justify-center px-6">
+            <form onSubmit={handleSubmit} className="w-full max-w-sm space-y-6 bg-slate-900/60 border border-slate-800 rounded-2xl p-8">
+                <div className="flex items-center gap-2">
+                    <div className="w-8 h-8 bg-cyan-500 rounded-lg flex items-center justify-center">
+                        <Activity className="text-[#020617]" size={20} />
+                    </div>
+                    <span className="font-bold tracking-tight text-xl">PrecisionRx</span>
+                </div>
+
+                {mode === 'signup' && (
+                    <div className="relative">
+                        <div className="absolute inset-y-0 left-0 pl-3 flex items-center pointer-events-none text-slate-500">
+                            <User size={16} />
+                        </div>
+                        <input type="text" placeholder="Full name" value={fullName}
+                            onChange={(e) => setFullName(e.target.value)} className={inputClass} />
+                    </div>
+                )}
+                <div className="relative">
+                    <div className="absolute inset-y-0 left-0 pl-3 flex items-center pointer-events-none text-slate-500">
+                        <Mail size={16} />
+                    </div>
+                    <input type="email" placeholder="Email" required value={email}
+                        onChange={(e) => setEmail(e.target.value)} className={inputClass} />
+                </div>
+                <div className="relative">
+                    <div className="absolute inset-y-0 left-0 pl-3 flex items-center pointer-events-none text-slate-500">
+                        <Lock size={16} />
+                    </div>
+                    <input type="password" placeholder="Password" required value={password}
+                        onChange={(e) => setPassword(e.target.value)} className={inputClass} />
+                </div>
+
+                {error && <p className="text-xs text-red-400">{error}</p>}
+
+                <button type="submit" disabled={submitting}
+                    className="w-full px-5 py-3 bg-cyan-500 hover:bg-cyan-400 disabled:opacity-50 text-[#020617] font-bold rounded-lg transition-all">
+                    {mode === 'login' ? 'Sign in' : 'Create account'}
+                </button>
+                <button type="button" onClick={() => { setMode(mode === 'login' ? 'signup' : 'login'); setError(null); }}
+                    className="w-full text-xs text-slate-400 hover:text-cyan-400 transition-all">
+                    {mode === 'login' ? 'No account? Sign up' : 'Already registered? Sign in'}
+                </button>
+            </form>
+        </div>
+    );
+};
+
+export default AuthPage;
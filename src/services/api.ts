@@ -2,19 +2,100 @@ import axios from 'axios';
 
 const API_URL = (import.meta as any).env.VITE_API_URL || 'http://127.0.0.1:8000';
 
-import { AnalysisResponse } from '../types';
+const TOKEN_KEY = 'token';
 
-export const analyzeVcf = async (file: File, drugs: string[]): Promise<AnalysisResponse> => {
-    const formData = new FormData();
-    formData.append('vcf_file', file);
-    formData.append('drug', drugs.join(','));
+// Send the session token, when there is one, to routes the backend protects
+axios.interceptors.request.use((config) => {
+    const token = localStorage.getItem(TOKEN_KEY);
+    if (token && config.url?.startsWith(API_URL)) {
+        config.headers.Authorization = `Bearer ${token}`;
+    }
+    return config;
+});
+
+// Expired or missing session: drop the token and send the user to sign in
+axios.interceptors.response.use(undefined, (error) => {
+    if (error.response?.status === 401 && !error.config?.url?.startsWith(`${API_URL}/auth/`)) {
+        localStorage.removeItem(TOKEN_KEY);
+        window.location.hash = '#/auth';
+    }
+    return Promise.reject(error);
+});
+
+interface TokenResponse {
+    access_token: string;
+    token_type: string;
+}
+
+export const login = async (email: string, password: string): Promise<void> => {
+    const response = await axios.post<TokenResponse>(`${API_URL}/auth/login`, { email, password });
+    localStorage.setItem(TOKEN_KEY, response.data.access_token);
+};
+
+export const signup = async (email: string, password: string, fullName?: string): Promise<void> => {
+    const response = await axios.post<TokenResponse>(`${API_URL}/auth/signup`, {
+        email,
+        password,
+        full_name: fullName || null,
+    });
+    localStorage.setItem(TOKEN_KEY, response.data.access_token);
+};
+
+export const isSignedIn = (): boolean => localStorage.getItem(TOKEN_KEY) !== null;
+
+import { AnalysisResponse, LLMExplanation } from '../types';
+
+// ETag of the last analysis per local file, so re-analysing the same file
+// (e.g. for another drug) can skip re-uploading it.
+const etagCache = new Map<string, string>();
+const responseCache = new Map<string, AnalysisResponse>();
+
+const fileKey = (file: File) => `${file.name}:${file.size}:${file.lastModified}`;
+
+const remember = (key: string, requestKey: string, etag: string | undefined, data: AnalysisResponse) => {
+    if (etag) etagCache.set(key, etag);
+    responseCache.set(requestKey, data);
+};
+
+// patientId groups a patient's analyses in the history; the backend
+// assigns a random one when it is omitted.
+export const analyzeVcf = async (file: File, drugs: string[], patientId?: string): Promise<AnalysisResponse> => {
+    const key = fileKey(file);
+    const requestKey = `${key}|${drugs.join(',')}|${patientId ?? ''}`;
+    const etag = etagCache.get(key);
 
     try {
+        if (etag) {
+            const cachedForm = new FormData();
+            cachedForm.append('drug', drugs.join(','));
+            if (patientId) cachedForm.append('patient_id', patientId);
+
+            const cached = await axios.post<AnalysisResponse>(`${API_URL}/analyze`, cachedForm, {
+                headers: { 'If-None-Match': etag },
+                // 412: server no longer has results for this file; upload it
+                validateStatus: (status) => status === 200 || status === 304 || status === 412,
+            });
+
+            if (cached.status === 200) {
+                remember(key, requestKey, cached.headers['etag'], cached.data);
+                return cached.data;
+            }
+            if (cached.status === 304 && responseCache.has(requestKey)) {
+                return responseCache.get(requestKey)!;
+            }
+        }
+
+        const formData = new FormData();
+        formData.append('vcf_file', file);
+        formData.append('drug', drugs.join(','));
+        if (patientId) formData.append('patient_id', patientId);
+
         const response = await axios.post<AnalysisResponse>(`${API_URL}/analyze`, formData, {
             headers: {
                 'Content-Type': 'multipart/form-data',
             },
         });
+        remember(key, requestKey, response.headers['etag'], response.data);
         return response.data;
     } catch (error) {
         console.error('Error analyzing VCF:', error);
@@ -22,6 +103,17 @@ export const analyzeVcf = async (file: File, drugs: string[]): Promise<AnalysisR
     }
 };
 
+export interface DeferredExplanation {
+    explanation_id: string;
+    status: 'pending' | 'ready' | 'failed';
+    explanation?: LLMExplanation;
+}
+
+export const getExplanation = async (explanationId: string): Promise<DeferredExplanation> => {
+    const response = await axios.get<DeferredExplanation>(`${API_URL}/explanations/${explanationId}`);
+    return response.data;
+};
+
 export const checkHealth = async (): Promise<boolean> => {
     try {
         await axios.get(`${API_URL}/health`);
@@ -27,6 +27,15 @@ export interface ClinicalRecommendation {
   alternatives: string[]; // Moved here
 }
 
+export interface LLMExplanation {
+  summary: string;
+  mechanism: string;
+  citations: string[];
+  // Present when the analysis was requested with defer_explanation
+  status?: 'pending' | 'ready' | 'failed';
+  explanation_id?: string;
+}
+
 export interface DrugAssessment {
   patient_id: string;
   drug: string;
@@ -42,17 +51,15 @@ export interface DrugAssessment {
 
   clinical_recommendation: ClinicalRecommendation;
 
-  llm_generated_explanation: {
-    summary: string;
-    mechanism: string;
-    citations: string[];
-  };
+  llm_generated_explanation: LLMExplanation;
 
   quality_metrics: {
     vcf_parsing_success: boolean;
     variants_detected: number;
     genes_identified: string[];
   };
+
+  knowledge_base_version?: string;
 }
 
 // The API now returns a SINGLE DrugAssessment object